@@ -7,6 +7,7 @@ from app.api.routes.device_solutions import router as device_solutions_router
 from app.api.routes.customer_solutions import router as customer_solutions_router
 from app.api.routes.device_metrics import router as device_metrics_router
 from app.api.routes.services.city_eye.city_eye_analytics import router as city_eye_analytics_router
+from app.api.routes.services.city_eye.city_eye_ingest import router as city_eye_ingest_router
 from app.api.routes.device_commands import router as device_commands_router
 from app.api.routes.sse import router as sse_router
 from app.api.routes.audit_logs import router as audit_logs_router
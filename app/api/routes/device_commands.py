@@ -1,4 +1,4 @@
-from typing import Any, List, Dict
+from typing import Any, List, Dict, Optional
 from fastapi import APIRouter, Depends, HTTPException, Request, BackgroundTasks, status, Header
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.async_session import AsyncSessionLocal
@@ -21,6 +21,7 @@ from app.utils.util import check_device_access, validate_device_for_commands
 from app.utils.aws_iot_commands import iot_command_service
 from app.utils.logger import get_logger
 from app.api.routes.sse import notify_command_update
+from app.utils.xlines_config_cache import notify_xlines_config_applied
 from app.schemas.audit import AuditLogActionType, AuditLogResourceType
 
 logger = get_logger("api.device_commands")
@@ -35,7 +36,8 @@ async def _send_command_in_background(
     user_id: uuid.UUID,
     device_name: str,
     ip_address: str,
-    user_agent: str
+    user_agent: str,
+    device_id: Optional[uuid.UUID] = None,
 ):
     """
     Background task to send the IoT command and handle the result.
@@ -58,6 +60,7 @@ async def _send_command_in_background(
                 message_id=str(message_id),
                 status=CommandStatus.FAILED.value,
                 error_message="Failed to publish command to AWS IoT Core",
+                device_id=device_id,
             )
         else:
             logger.info(f"Successfully published capture image command to IoT Core for device {thing_name}. Message ID: {message_id}")
@@ -91,6 +94,7 @@ async def _send_command_in_background(
             message_id=str(message_id),
             status=CommandStatus.FAILED.value,
             error_message=f"Internal server error during command sending: {str(e)}",
+            device_id=device_id,
         )
     finally:
         await db.close()
@@ -153,7 +157,8 @@ async def send_capture_image_command(
             user_id=current_user.user_id,
             device_name=db_device.name,
             ip_address=request.client.host,
-            user_agent=request.headers.get("user-agent")
+            user_agent=request.headers.get("user-agent"),
+            device_id=db_device.device_id,
         )
     else:
         background_tasks.add_task(
@@ -165,7 +170,8 @@ async def send_capture_image_command(
             user_id=current_user.user_id,
             device_name=db_device.name,
             ip_address=request.client.host,
-            user_agent=request.headers.get("user-agent")
+            user_agent=request.headers.get("user-agent"),
+            device_id=db_device.device_id,
         )
 
     
@@ -214,8 +220,15 @@ async def update_command_status_internal(
         status=status_update.status.value,
         response_payload=status_update.response_payload,
         error_message=status_update.error_message,
+        device_id=db_command.device_id,
     )
 
+    # The device now reports the new polygons: direction analytics must stop serving the old ones
+    if db_command.command_type == CommandType.UPDATE_POLYGON and status_update.status == CommandStatus.SUCCESS:
+        db_device = await device.get_by_id(db, device_id=db_command.device_id)
+        if db_device and db_device.thing_name:
+            notify_xlines_config_applied(db_device.thing_name)
+
     logger.info(
         f"Command {message_id} status updated to {status_update.status} via internal API"
     )
@@ -315,6 +328,7 @@ async def start_live_stream_command(
             message_id=str(db_command.message_id),
             status=CommandStatus.FAILED.value,
             error_message="Failed to publish command to AWS IoT Core",
+            device_id=db_command.device_id,
         )
 
         raise HTTPException(status_code=500, detail="Failed to send command to device")
@@ -415,6 +429,7 @@ async def stop_live_stream_command(
             message_id=str(db_command.message_id),
             status=CommandStatus.FAILED.value,
             error_message="Failed to publish command to AWS IoT Core",
+            device_id=db_command.device_id,
         )
 
         raise HTTPException(status_code=500, detail="Failed to send command to device")
@@ -1,13 +1,18 @@
-from typing import Any, Optional
+import asyncio
+from typing import Any, Dict, Optional
 from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from app.api import deps
 from app.models import User, UserRole
 from app.crud import device
-from app.schemas import MetricsResponse
+from app.schemas import MetricsResponse, BatchMetricsRequest, BatchMetricsResponse
 from app.utils.logger import get_logger
 # Import from the new influxdb module instead of timestream
 from app.utils.influxdb import (
+    InfluxQueryTimeout,
+    choose_metrics_interval,
+    dump_json,
+    query_metrics_batch,
     query_memory_metrics,
     query_cpu_metrics,
     query_temperature_metrics,
@@ -60,7 +65,11 @@ async def get_memory_metrics(
     # Query the metrics from InfluxDB
     try:
         metrics = await query_memory_metrics(str(device_name), start_time, end_time, interval)
-        return metrics
+        # Series come pre-encoded, so the document is written out as is
+        return Response(content=dump_json(metrics), media_type="application/json")
+    except InfluxQueryTimeout as e:
+        logger.error(f"Timed out querying memory metrics: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error querying memory metrics: {str(e)}")
         raise HTTPException(
@@ -101,7 +110,11 @@ async def get_cpu_metrics(
     # Query the metrics from InfluxDB
     try:
         metrics = await query_cpu_metrics(str(device_name), start_time, end_time, interval)
-        return metrics
+        # Series come pre-encoded, so the document is written out as is
+        return Response(content=dump_json(metrics), media_type="application/json")
+    except InfluxQueryTimeout as e:
+        logger.error(f"Timed out querying CPU metrics: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error querying CPU metrics: {str(e)}")
         raise HTTPException(
@@ -149,9 +162,85 @@ async def get_temperature_metrics(
     # Query the metrics from InfluxDB
     try:
         metrics = await query_temperature_metrics(str(device_name), start_time, end_time, interval)
-        return metrics
+        # Series come pre-encoded, so the document is written out as is
+        return Response(content=dump_json(metrics), media_type="application/json")
+    except InfluxQueryTimeout as e:
+        logger.error(f"Timed out querying temperature metrics: {str(e)}")
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error querying temperature metrics: {str(e)}")
         raise HTTPException(
             status_code=500, detail=f"Error querying temperature metrics: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+@router.post("/batch", response_model=BatchMetricsResponse)
+async def get_batch_metrics(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    request_in: BatchMetricsRequest,
+    current_user: User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Get several metric families for many devices at once.
+
+    All devices are looked up and authorized with one query, and each metric family is read for
+    all authorized devices with one InfluxDB query. Unknown or unauthorized devices, and metric
+    families that fail to load, are reported per device in `error` instead of failing the request.
+    Long ranges are read with a coarser interval, returned in `interval`.
+    """
+    device_names = list(dict.fromkeys(request_in.device_names))
+    devices = {}
+    for db_device in await device.get_by_device_names(db, device_names=device_names):
+        devices.setdefault(db_device.name, db_device)
+
+    items: Dict[str, Dict[str, Any]] = {}
+    authorized_names = []
+    for device_name in device_names:
+        items[device_name] = {"device_name": device_name, "metrics": {}, "error": None}
+        db_device = devices.get(device_name)
+        if not db_device:
+            items[device_name]["error"] = "Device not found"
+        elif current_user.role not in [UserRole.ADMIN, UserRole.ENGINEER] and db_device.customer_id != current_user.customer_id:
+            items[device_name]["error"] = "Not authorized to access this device's metrics"
+        else:
+            authorized_names.append(device_name)
+
+    # Set default time range if not specified
+    end_time = request_in.end_time or datetime.now(ZoneInfo("Asia/Tokyo"))
+    start_time = request_in.start_time or end_time - timedelta(hours=1)
+
+    # Ensure times have timezone info (JST)
+    if end_time.tzinfo is None:
+        end_time = end_time.replace(tzinfo=ZoneInfo("Asia/Tokyo"))
+    if start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=ZoneInfo("Asia/Tokyo"))
+    interval = choose_metrics_interval(start_time, end_time, request_in.interval)
+
+    if authorized_names:
+        families = list(dict.fromkeys(request_in.metrics))
+        # The families run concurrently on the InfluxDB client's query threads
+        results = await asyncio.gather(
+            *(query_metrics_batch(family, authorized_names, start_time, end_time, interval) for family in families),
+            return_exceptions=True,
+        )
+        for family, result in zip(families, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error querying {family} metrics for {len(authorized_names)} devices: {str(result)}")
+                error = f"Error querying {family} metrics: {str(result)}"
+                for device_name in authorized_names:
+                    item = items[device_name]
+                    item["error"] = f"{item['error']}; {error}" if item["error"] else error
+                continue
+            for device_name in authorized_names:
+                items[device_name]["metrics"][family] = result[device_name]
+
+    return Response(
+        content=dump_json({
+            "devices": list(items.values()),
+            "start_time": start_time,
+            "end_time": end_time,
+            "interval": f"{interval}m",
+        }),
+        media_type="application/json",
+    )
@@ -5,7 +5,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.async_session import AsyncSessionLocal
 from app.api import deps
 from app.crud import job, device
-from app.models import User, Job, JobStatus, JobType
+from app.models import User, JobStatus, JobType
 from app.schemas.job import (
     RestartApplicationJob,
     RebootDeviceJob,
@@ -14,7 +14,6 @@ from app.schemas.job import (
     JobCreate
 )
 from app.utils.aws_iot_jobs import iot_jobs_service
-from app.api.routes.sse import notify_job_update
 from app.utils.audit import log_action
 from app.utils.util import check_device_access, validate_device_for_commands
 from app.utils.logger import get_logger
@@ -25,57 +24,6 @@ logger = get_logger("api.jobs")
 
 router = APIRouter()
 
-async def sync_job_status(db: AsyncSession, job_obj: Job) -> Job:
-    """
-    Sync job status with AWS IoT if the job is not in a terminal state
-    """
-    if job_obj.status not in [JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.TIMED_OUT, JobStatus.CANCELED, JobStatus.ARCHIVED]:
-        # Get current status from AWS
-        device_obj = await device.get_by_id(db, device_id=job_obj.device_id)
-        if device_obj and device_obj.thing_name:
-            aws_status = iot_jobs_service.get_job_execution_status(
-                job_id=job_obj.job_id,
-                thing_name=device_obj.thing_name
-            )
-            
-            if aws_status:
-                # Map AWS status to our status enum
-                status_mapping = {
-                    "QUEUED": JobStatus.QUEUED,
-                    "IN_PROGRESS": JobStatus.IN_PROGRESS,
-                    "SUCCEEDED": JobStatus.SUCCEEDED,
-                    "FAILED": JobStatus.FAILED,
-                    "TIMED_OUT": JobStatus.TIMED_OUT,
-                    "CANCELED": JobStatus.CANCELED
-                }
-                
-                new_status = status_mapping.get(aws_status["status"])
-                if new_status and new_status != job_obj.status:
-                    job_obj = await job.update_status(
-                        db,
-                        job_id=job_obj.job_id,
-                        status=new_status,
-                        status_details=aws_status.get("status_details")
-                    )
-
-                    # Notify any connected SSE clients
-                    # Calculate a simple progress percentage for the frontend
-                    progress = 0
-                    if new_status == JobStatus.IN_PROGRESS:
-                        progress = 50
-                    elif new_status in [JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.TIMED_OUT, JobStatus.CANCELED, JobStatus.ARCHIVED]:
-                        progress = 100
-                    
-                    notify_job_update(
-                        job_id=job_obj.job_id,
-                        status=new_status.value,
-                        progress_percentage=progress,
-                        status_details=job_obj.status_details,
-                        error_message=job_obj.error_message
-                    )
-    
-    return job_obj
-
 async def create_restart_jobs_task(
     job_in: RestartApplicationJob, current_user: User, ip_address: str, user_agent: str
 ):
@@ -232,10 +180,9 @@ async def get_device_jobs(
     # Get jobs
     jobs_list = await job.get_by_device(db, device_id=device_id, skip=skip, limit=limit)
     
-    # Sync status for non-terminal jobs
+    # Statuses are kept up to date by the job reconciler
     response = []
     for job_obj in jobs_list:
-        job_obj = await sync_job_status(db, job_obj)
         response.append(JobResponse(
             id=job_obj.id,
             job_id=job_obj.job_id,
@@ -275,9 +222,6 @@ async def get_device_latest_job(
             detail="No jobs found for this device"
         )
     
-    # Sync status if needed
-    job_obj = await sync_job_status(db, job_obj)
-    
     return JobResponse(
         id=job_obj.id,
         job_id=job_obj.job_id,
@@ -315,9 +259,6 @@ async def get_job_status(
     db_device = await device.get_by_id(db, device_id=job_obj.device_id)
     await check_device_access(current_user, db_device, action="view jobs for")
     
-    # Sync status if needed
-    job_obj = await sync_job_status(db, job_obj)
-    
     # Calculate progress percentage (simplified)
     progress_percentage = None
     if job_obj.status == JobStatus.QUEUED:
@@ -494,9 +435,6 @@ async def get_device_latest_deployment_job(
             detail="No PACKAGE_DEPLOYMENT jobs found for this device"
         )
 
-    # Sync status if needed
-    job_obj = await sync_job_status(db, job_obj)
-
     return JobResponse(
         id=job_obj.id,
         job_id=job_obj.job_id,
@@ -1,7 +1,11 @@
-from typing import Any, List, Optional, Dict, Callable, Union
+from typing import Any, List, Optional, Dict, Callable, Union, Awaitable, Tuple
+from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, Query, APIRouter, Request, BackgroundTasks
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from app.api import deps
+from app.core.config import settings
+import asyncio
 import uuid
 import json
 from app.models import User, UserRole, CommandType, CommandStatus # Renamed to avoid conflict
@@ -9,9 +13,8 @@ from app.crud import device as crud_device # Alias crud operations
 from app.crud import solution as crud_solution,  device, device_solution, device_command
 from app.crud import customer_solution as crud_customer_solution
 from app.crud import customer as crud_customer
-from app.crud import device_solution as crud_device_solution
 from app.api.routes.sse import notify_command_update
-from app.utils.util import check_device_access, validate_device_for_commands, calculate_offset_route
+from app.utils.util import check_device_access, validate_device_for_commands
 from app.utils.aws_iot_commands import iot_command_service
 from app.schemas.device_command import (
     DeviceCommandCreate,
@@ -19,7 +22,11 @@ from app.schemas.device_command import (
 )
 from app.schemas.services.city_eye_settings import XLinesConfigPayload, UpdateXLinesConfigCommand, Vertex, Point, Center, DetectionZone, Position, ThresholdConfigResponse, ThresholdConfigRequest, ThresholdDataResponse 
 from app.crud.crud_city_eye_analytics import crud_city_eye_analytics
+from app.utils.analytics_cache import analytics_cache
+from app.utils.xlines_config_cache import xlines_config_cache, parse_polygon_geometry
 from app.utils.audit import log_action
+from app.utils.city_eye_export import EXPORT_FORMATS, create_export_encoder
+from app.utils.city_eye_ingest import KEY_COLUMNS, HUMAN_COUNT_COLUMNS, TRAFFIC_COUNT_COLUMNS
 from app.schemas.services.city_eye_analytics import (
     AnalyticsFilters,
     TrafficAnalyticsFilters,
@@ -37,6 +44,12 @@ from app.schemas.services.city_eye_analytics import (
     DeviceAnalyticsItem,
     DeviceTrafficAnalyticsItem,
     DeviceDirectionItem,
+    HumanFlowComparison,
+    TrafficFlowComparison,
+    AggregateAnalyticsItem,
+    AggregateTrafficAnalyticsItem,
+    CityEyeAggregateAnalyticsResponse,
+    CityEyeAggregateTrafficAnalyticsResponse,
     CityEyeAnalyticsPerDeviceResponse,
     CityEyeTrafficAnalyticsPerDeviceResponse,
     CityEyeDirectionPerDeviceResponse,
@@ -58,62 +71,197 @@ async def _validate_devices_for_analytics(
     if not device_ids:
         raise HTTPException(status_code=400, detail="Please specify at least one device_id.")
 
-    city_eye_solution_model = await crud_solution.get_by_name(db, name=solution_name)
-    if not city_eye_solution_model:
+    solution_id = await crud_solution.get_id_by_name_cached(db, name=solution_name)
+    if not solution_id:
         logger.error(f"{solution_name} solution not found in database")
         raise HTTPException(status_code=404, detail=f"{solution_name} solution not configured")
 
-    final_device_ids = []
-    device_details = {}
+    is_customer_user = current_user.role not in [UserRole.ADMIN, UserRole.ENGINEER]
 
     # Common logic for customer users
-    if current_user.role not in [UserRole.ADMIN, UserRole.ENGINEER]:
+    if is_customer_user:
         if not current_user.customer_id:
             raise HTTPException(status_code=403, detail="User is not associated with any customer")
 
         if not await crud_customer_solution.check_customer_has_access(
-            db, customer_id=current_user.customer_id, solution_id=city_eye_solution_model.solution_id
+            db, customer_id=current_user.customer_id, solution_id=solution_id
         ):
             raise HTTPException(status_code=403, detail=f"Your organization does not have access to {solution_name} analytics")
 
+    requested_ids = []
     for device_id_str in device_ids:
         try:
             device_uuid = uuid.UUID(str(device_id_str))
-            db_device = await crud_device.get_by_id(db, device_id=device_uuid)
+        except ValueError:
+            logger.warning(f"Invalid device UUID format: {device_id_str}")
+            continue
+        if device_uuid not in requested_ids:
+            requested_ids.append(device_uuid)
 
-            if not db_device:
-                logger.warning(f"Device {device_id_str} not found.")
-                continue
+    # One query for every requested device together with its solution deployment flag
+    rows = await crud_device.get_by_ids_with_solution_flag(
+        db, device_ids=requested_ids, solution_id=solution_id
+    ) if requested_ids else []
+    devices_by_id = {db_device.device_id: (db_device, solution_deployed) for db_device, solution_deployed in rows}
 
-            # Authorization Check
-            if current_user.role not in [UserRole.ADMIN, UserRole.ENGINEER]:
-                if db_device.customer_id != current_user.customer_id:
-                    logger.warning(f"User {current_user.email} denied access to device {device_id_str}")
-                    continue
-                
-                device_solutions = await crud_device_solution.get_active_by_device(db, device_id=device_uuid)
-                if not any(ds.solution_id == city_eye_solution_model.solution_id for ds in device_solutions):
-                    logger.warning(f"{solution_name} solution not active on device {device_id_str}")
-                    continue
-
-            final_device_ids.append(device_uuid)
-            device_details[device_uuid] = {
-                "device_name": db_device.name,
-                "device_location": db_device.location,
-                "device_position": [db_device.latitude, db_device.longitude] if db_device.latitude and db_device.longitude else [],
-                "thing_name": db_device.thing_name,
-            }
+    final_device_ids = []
+    device_details = {}
 
-        except ValueError:
-            logger.warning(f"Invalid device UUID format: {device_id_str}")
+    for device_uuid in requested_ids:
+        if device_uuid not in devices_by_id:
+            logger.warning(f"Device {device_uuid} not found.")
             continue
-            
+        db_device, solution_deployed = devices_by_id[device_uuid]
+
+        # Authorization Check
+        if is_customer_user:
+            if db_device.customer_id != current_user.customer_id:
+                logger.warning(f"User {current_user.email} denied access to device {device_uuid}")
+                continue
+
+            if not solution_deployed:
+                logger.warning(f"{solution_name} solution not active on device {device_uuid}")
+                continue
+
+        final_device_ids.append(device_uuid)
+        device_details[device_uuid] = {
+            "device_name": db_device.name,
+            "device_location": db_device.location,
+            "device_position": [db_device.latitude, db_device.longitude] if db_device.latitude and db_device.longitude else [],
+            "thing_name": db_device.thing_name,
+        }
+
     if not final_device_ids:
         logger.info(f"No authorized or valid devices left to process for analytics request by {current_user.email}")
 
     return final_device_ids, device_details
 
 
+def _get_time_series_interval(filters: Union[AnalyticsFilters, TrafficAnalyticsFilters], interval_minutes: int) -> int:
+    """
+    Coarsens the requested time series bucket size when the range would produce too many points.
+    """
+    effective_interval = crud_city_eye_analytics.get_time_series_interval(
+        start_time=filters.start_time, end_time=filters.end_time, interval_minutes=interval_minutes
+    )
+    if effective_interval != interval_minutes:
+        logger.info(f"Coarsened time series interval from {interval_minutes} to {effective_interval} minutes")
+    return effective_interval
+
+
+def _fill_analytics_data(data_obj: Any, metrics: Dict[str, Any], metric_schemas: Dict[str, tuple]) -> None:
+    """
+    Sets every metric of `metric_schemas` ({field: (schema, wrapper_key)}) on a
+    PerDevice*AnalyticsData object from the plain structures returned by the analytics CRUD.
+    """
+    for key, (schema, wrapper_key) in metric_schemas.items():
+        result = metrics[key]
+        if wrapper_key:
+            setattr(data_obj, key, schema(**{wrapper_key: result}))
+        elif isinstance(result, list):
+            setattr(data_obj, key, [schema(**item) for item in result])
+        else:
+            setattr(data_obj, key, schema(**result))
+
+
+async def _get_aggregate_analytics(
+    db: AsyncSession,
+    current_user: User,
+    filters: Union[AnalyticsFilters, TrafficAnalyticsFilters],
+    *,
+    aggregate: str,
+    get_metrics: Callable[..., Awaitable[Dict[Any, Dict[str, Any]]]],
+    metric_schemas: Dict[str, tuple],
+    data_cls: Any,
+    item_cls: Any,
+    interval_minutes: int,
+) -> List[Any]:
+    """
+    Computes the metrics of all authorized devices summed together ("site") or per device location
+    ("location") in SQL, and returns one item per group.
+    """
+    final_device_ids, processed_device_details = await _validate_devices_for_analytics(
+        db, current_user, filters.device_ids
+    )
+    if not final_device_ids:
+        return []
+
+    # Devices without a location share one group; "" maps back to location None
+    device_groups = {
+        device_id: (processed_device_details[device_id]["device_location"] or "") if aggregate == "location" else ""
+        for device_id in final_device_ids
+    }
+    group_device_ids: Dict[str, List[uuid.UUID]] = {}
+    for device_id in final_device_ids:
+        group_device_ids.setdefault(device_groups[device_id], []).append(device_id)
+
+    time_series_interval = _get_time_series_interval(filters, interval_minutes)
+    all_devices_filters = filters.model_copy(deep=True)
+    all_devices_filters.device_ids = final_device_ids
+
+    metrics_by_group: Dict[Any, Dict[str, Any]] = {}
+    query_error: Optional[str] = None
+    try:
+        metrics_by_group = await get_metrics(
+            db,
+            filters=all_devices_filters,
+            metrics=list(metric_schemas),
+            interval_minutes=time_series_interval,
+            device_groups=device_groups,
+        )
+    except Exception as e:
+        logger.error(f"Error aggregating CityEye analytics for devices {final_device_ids}: {str(e)}", exc_info=True)
+        query_error = str(e)
+
+    items = []
+    for group_key in sorted(group_device_ids):
+        data_obj = data_cls()
+        if not query_error:
+            _fill_analytics_data(data_obj, metrics_by_group.get(group_key, {}), metric_schemas)
+            if "time_series_data" in metric_schemas:
+                data_obj.time_series_interval_minutes = time_series_interval
+        items.append(item_cls(
+            location=group_key or None,
+            device_ids=group_device_ids[group_key],
+            analytics_data=data_obj,
+            error=f"Failed to aggregate analytics: {query_error}" if query_error else None,
+        ))
+
+    logger.info(
+        f"Aggregated analytics of {len(final_device_ids)} devices into {len(items)} {aggregate} groups for {current_user.email}"
+    )
+    return items
+
+
+def _get_baseline_range(
+    filters: Union[AnalyticsFilters, TrafficAnalyticsFilters],
+    baseline_offset_days: Optional[int],
+    baseline_start_time: Optional[datetime],
+    baseline_end_time: Optional[datetime],
+) -> Optional[Tuple[datetime, datetime]]:
+    """
+    Resolves the comparison baseline period: the filtered range shifted back by baseline_offset_days,
+    or an explicit baseline range. Returns None when no comparison was requested.
+    """
+    if baseline_offset_days is not None:
+        if baseline_start_time or baseline_end_time:
+            raise HTTPException(
+                status_code=400,
+                detail="Specify either baseline_offset_days or baseline_start_time/baseline_end_time, not both",
+            )
+        offset = timedelta(days=baseline_offset_days)
+        return filters.start_time - offset, filters.end_time - offset
+
+    if baseline_start_time or baseline_end_time:
+        if not (baseline_start_time and baseline_end_time) or baseline_start_time >= baseline_end_time:
+            raise HTTPException(
+                status_code=400,
+                detail="baseline_start_time and baseline_end_time are both required, with start before end",
+            )
+        return baseline_start_time, baseline_end_time
+    return None
+
+
 @router.post("/human-flow", response_model=CityEyeAnalyticsPerDeviceResponse)
 async def get_human_flow_analytics(
     *,
@@ -126,10 +274,20 @@ async def get_human_flow_analytics(
     include_age_gender_distribution: bool = Query(True),
     include_hourly_distribution: bool = Query(True),
     include_time_series: bool = Query(True),
+    interval_minutes: int = Query(60, ge=1, description="Time series bucket size in minutes, coarsened automatically for long ranges"),
+    baseline_offset_days: Optional[int] = Query(None, ge=1, description="Compare with the same range this many days earlier (7 = week over week, 364 = year over year on the same weekdays)"),
+    baseline_start_time: Optional[datetime] = Query(None, description="Start of an explicit comparison baseline (with baseline_end_time)"),
+    baseline_end_time: Optional[datetime] = Query(None, description="End of an explicit comparison baseline"),
 ) -> Any:
     """
     Retrieve aggregated human flow analytics data, per device, based on filters.
+    filters.source selects live ("live", default) or provisioning-period ("provisioned") data.
+
+    With baseline_offset_days or baseline_start_time/baseline_end_time, each device also gets a
+    comparison of the included total metrics against that baseline period (current, baseline,
+    delta and ratio), computed for the same authorized devices.
     """
+    baseline_range = _get_baseline_range(filters, baseline_offset_days, baseline_start_time, baseline_end_time)
     final_device_ids, processed_device_details = await _validate_devices_for_analytics(
         db, current_user, filters.device_ids
     )
@@ -140,38 +298,72 @@ async def get_human_flow_analytics(
     analytics_results: List[DeviceAnalyticsItem] = []
 
     analytics_map = {
-        "total_count": (include_total_count, crud_city_eye_analytics.get_total_count, TotalCount, "total_count"),
-        "age_distribution": (include_age_distribution, crud_city_eye_analytics.get_age_distribution, AgeDistribution, None),
-        "gender_distribution": (include_gender_distribution, crud_city_eye_analytics.get_gender_distribution, GenderDistribution, None),
-        "age_gender_distribution": (include_age_gender_distribution, crud_city_eye_analytics.get_age_gender_distribution, AgeGenderDistribution, None),
-        "hourly_distribution": (include_hourly_distribution, crud_city_eye_analytics.get_hourly_distribution, HourlyCount, None),
-        "time_series_data": (include_time_series, crud_city_eye_analytics.get_time_series_data, TimeSeriesData, None),
+        "total_count": (include_total_count, TotalCount, "total_count"),
+        "age_distribution": (include_age_distribution, AgeDistribution, None),
+        "gender_distribution": (include_gender_distribution, GenderDistribution, None),
+        "age_gender_distribution": (include_age_gender_distribution, AgeGenderDistribution, None),
+        "hourly_distribution": (include_hourly_distribution, HourlyCount, None),
+        "time_series_data": (include_time_series, TimeSeriesData, None),
     }
 
+    time_series_interval = _get_time_series_interval(filters, interval_minutes)
+
+    # All requested metrics for all authorized devices are computed in a single scan
+    all_devices_filters = filters.model_copy(deep=True)
+    all_devices_filters.device_ids = final_device_ids
+
+    metrics_by_device: Dict[uuid.UUID, Dict[str, Any]] = {}
+    comparison_by_device: Dict[uuid.UUID, Dict[str, Any]] = {}
+    query_error: Optional[str] = None
+    try:
+        metrics_by_device = await crud_city_eye_analytics.get_human_flow_metrics(
+            db,
+            filters=all_devices_filters,
+            metrics=[key for key, (include, _, _) in analytics_map.items() if include],
+            interval_minutes=time_series_interval,
+        )
+        if baseline_range:
+            comparison_by_device = await crud_city_eye_analytics.get_flow_comparison_by_device(
+                db,
+                filters=all_devices_filters,
+                kind="human",
+                metrics=[key for key, (include, _, _) in analytics_map.items() if include],
+                current_by_device=metrics_by_device,
+                baseline_start_time=baseline_range[0],
+                baseline_end_time=baseline_range[1],
+            )
+    except Exception as e:
+        logger.error(f"Error processing CityEye analytics for devices {final_device_ids}: {str(e)}", exc_info=True)
+        query_error = str(e)
+
     for device_id in final_device_ids:
         device_details = processed_device_details.get(device_id, {})
         logger.info(f"Processing analytics for device: {device_details.get('device_name')} ({device_id})")
 
-        single_device_filters = filters.model_copy(deep=True)
-        single_device_filters.device_ids = [device_id]
-
         per_device_data_obj = PerDeviceAnalyticsData()
         error_message_for_device: Optional[str] = None
 
-        try:
-            for key, (include, func, schema, wrapper_key) in analytics_map.items():
-                if include:
-                    result = await func(db, filters=single_device_filters)
-                    if wrapper_key:
-                        setattr(per_device_data_obj, key, schema(**{wrapper_key: result}))
-                    elif isinstance(result, list):
-                        setattr(per_device_data_obj, key, [schema(**item) for item in result])
-                    else:
-                        setattr(per_device_data_obj, key, schema(**result))
-
-        except Exception as e:
-            logger.error(f"Error processing CityEye analytics for device {device_id}: {str(e)}", exc_info=True)
-            error_message_for_device = f"Failed to process analytics for this device: {str(e)}"
+        if query_error:
+            error_message_for_device = f"Failed to process analytics for this device: {query_error}"
+        else:
+            try:
+                _fill_analytics_data(
+                    per_device_data_obj,
+                    metrics_by_device.get(device_id, {}),
+                    {key: (schema, wrapper_key) for key, (include, schema, wrapper_key) in analytics_map.items() if include},
+                )
+                if include_time_series:
+                    per_device_data_obj.time_series_interval_minutes = time_series_interval
+                if baseline_range:
+                    per_device_data_obj.comparison = HumanFlowComparison(
+                        baseline_start_time=baseline_range[0],
+                        baseline_end_time=baseline_range[1],
+                        **comparison_by_device.get(device_id, {}),
+                    )
+
+            except Exception as e:
+                logger.error(f"Error processing CityEye analytics for device {device_id}: {str(e)}", exc_info=True)
+                error_message_for_device = f"Failed to process analytics for this device: {str(e)}"
 
         analytics_results.append(
             DeviceAnalyticsItem(
@@ -200,10 +392,19 @@ async def get_traffic_flow_analytics(
     include_vehicle_type_distribution: bool = Query(True),
     include_hourly_distribution: bool = Query(True),
     include_time_series: bool = Query(True),
+    interval_minutes: int = Query(60, ge=1, description="Time series bucket size in minutes, coarsened automatically for long ranges"),
+    baseline_offset_days: Optional[int] = Query(None, ge=1, description="Compare with the same range this many days earlier (7 = week over week, 364 = year over year on the same weekdays)"),
+    baseline_start_time: Optional[datetime] = Query(None, description="Start of an explicit comparison baseline (with baseline_end_time)"),
+    baseline_end_time: Optional[datetime] = Query(None, description="End of an explicit comparison baseline"),
 ) -> Any:
     """
     Retrieve aggregated traffic flow analytics data, per device, based on filters.
+    filters.source selects live ("live", default) or provisioning-period ("provisioned") data.
+
+    With baseline_offset_days or baseline_start_time/baseline_end_time, each device also gets a
+    comparison of the included total metrics against that baseline period.
     """
+    baseline_range = _get_baseline_range(filters, baseline_offset_days, baseline_start_time, baseline_end_time)
     final_device_ids, processed_device_details = await _validate_devices_for_analytics(
         db, current_user, filters.device_ids
     )
@@ -212,38 +413,72 @@ async def get_traffic_flow_analytics(
         return []
 
     analytics_results: List[DeviceTrafficAnalyticsItem] = []
-    
+
     analytics_map = {
-        "total_count": (include_total_count, crud_city_eye_analytics.get_total_traffic_count, TotalCount, "total_count"),
-        "vehicle_type_distribution": (include_vehicle_type_distribution, crud_city_eye_analytics.get_vehicle_type_distribution, VehicleTypeDistribution, None),
-        "hourly_distribution": (include_hourly_distribution, crud_city_eye_analytics.get_hourly_traffic_distribution, HourlyCount, None),
-        "time_series_data": (include_time_series, crud_city_eye_analytics.get_traffic_time_series_data, TimeSeriesData, None),
+        "total_count": (include_total_count, TotalCount, "total_count"),
+        "vehicle_type_distribution": (include_vehicle_type_distribution, VehicleTypeDistribution, None),
+        "hourly_distribution": (include_hourly_distribution, HourlyCount, None),
+        "time_series_data": (include_time_series, TimeSeriesData, None),
     }
 
+    time_series_interval = _get_time_series_interval(filters, interval_minutes)
+
+    # All requested metrics for all authorized devices are computed in a single scan
+    all_devices_filters = filters.model_copy(deep=True)
+    all_devices_filters.device_ids = final_device_ids
+
+    metrics_by_device: Dict[uuid.UUID, Dict[str, Any]] = {}
+    comparison_by_device: Dict[uuid.UUID, Dict[str, Any]] = {}
+    query_error: Optional[str] = None
+    try:
+        metrics_by_device = await crud_city_eye_analytics.get_traffic_flow_metrics(
+            db,
+            filters=all_devices_filters,
+            metrics=[key for key, (include, _, _) in analytics_map.items() if include],
+            interval_minutes=time_series_interval,
+        )
+        if baseline_range:
+            comparison_by_device = await crud_city_eye_analytics.get_flow_comparison_by_device(
+                db,
+                filters=all_devices_filters,
+                kind="traffic",
+                metrics=[key for key, (include, _, _) in analytics_map.items() if include],
+                current_by_device=metrics_by_device,
+                baseline_start_time=baseline_range[0],
+                baseline_end_time=baseline_range[1],
+            )
+    except Exception as e:
+        logger.error(f"Error processing CityEye traffic analytics for devices {final_device_ids}: {str(e)}", exc_info=True)
+        query_error = str(e)
+
     for device_id in final_device_ids:
         device_details = processed_device_details.get(device_id, {})
         logger.info(f"Processing traffic analytics for device: {device_details.get('device_name')} ({device_id})")
 
-        single_device_filters = filters.model_copy(deep=True)
-        single_device_filters.device_ids = [device_id]
-
         per_device_data_obj = PerDeviceTrafficAnalyticsData()
         error_message_for_device: Optional[str] = None
 
-        try:
-            for key, (include, func, schema, wrapper_key) in analytics_map.items():
-                if include:
-                    result = await func(db, filters=single_device_filters)
-                    if wrapper_key:
-                        setattr(per_device_data_obj, key, schema(**{wrapper_key: result}))
-                    elif isinstance(result, list):
-                        setattr(per_device_data_obj, key, [schema(**item) for item in result])
-                    else:
-                        setattr(per_device_data_obj, key, schema(**result))
-
-        except Exception as e:
-            logger.error(f"Error processing CityEye traffic analytics for device {device_id}: {str(e)}", exc_info=True)
-            error_message_for_device = f"Failed to process traffic analytics for this device: {str(e)}"
+        if query_error:
+            error_message_for_device = f"Failed to process traffic analytics for this device: {query_error}"
+        else:
+            try:
+                _fill_analytics_data(
+                    per_device_data_obj,
+                    metrics_by_device.get(device_id, {}),
+                    {key: (schema, wrapper_key) for key, (include, schema, wrapper_key) in analytics_map.items() if include},
+                )
+                if include_time_series:
+                    per_device_data_obj.time_series_interval_minutes = time_series_interval
+                if baseline_range:
+                    per_device_data_obj.comparison = TrafficFlowComparison(
+                        baseline_start_time=baseline_range[0],
+                        baseline_end_time=baseline_range[1],
+                        **comparison_by_device.get(device_id, {}),
+                    )
+
+            except Exception as e:
+                logger.error(f"Error processing CityEye traffic analytics for device {device_id}: {str(e)}", exc_info=True)
+                error_message_for_device = f"Failed to process traffic analytics for this device: {str(e)}"
 
         analytics_results.append(
             DeviceTrafficAnalyticsItem(
@@ -261,81 +496,130 @@ async def get_traffic_flow_analytics(
     )
     return analytics_results
 
-async def _build_direction_analytics_response(
-    db: AsyncSession, thing_name: Optional[str], filters: Union[DirectionAnalyticsFilters, TrafficDirectionAnalyticsFilters], direction_counts_func: Callable
-) -> List[Dict]:
+@router.post("/human-flow/aggregate", response_model=CityEyeAggregateAnalyticsResponse)
+async def get_aggregate_human_flow_analytics(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    filters: AnalyticsFilters,
+    current_user: User = Depends(deps.get_current_active_user),
+    aggregate: str = Query("site", regex="^(site|location)$", description="site: one item for all devices, location: one item per device location"),
+    include_total_count: bool = Query(True),
+    include_age_distribution: bool = Query(True),
+    include_gender_distribution: bool = Query(True),
+    include_age_gender_distribution: bool = Query(True),
+    include_hourly_distribution: bool = Query(True),
+    include_time_series: bool = Query(True),
+    interval_minutes: int = Query(60, ge=1, description="Time series bucket size in minutes, coarsened automatically for long ranges"),
+) -> Any:
     """
-    Builds the direction analytics response by fetching counts and shadow config.
+    Retrieve human flow analytics summed across all authorized devices (aggregate=site) or per
+    device location (aggregate=location), computed in SQL rather than per device.
     """
-    direction_counts = await direction_counts_func(db, filters=filters)
-    xlines_config = []
+    metric_schemas = {
+        key: (schema, wrapper_key)
+        for key, (include, schema, wrapper_key) in {
+            "total_count": (include_total_count, TotalCount, "total_count"),
+            "age_distribution": (include_age_distribution, AgeDistribution, None),
+            "gender_distribution": (include_gender_distribution, GenderDistribution, None),
+            "age_gender_distribution": (include_age_gender_distribution, AgeGenderDistribution, None),
+            "hourly_distribution": (include_hourly_distribution, HourlyCount, None),
+            "time_series_data": (include_time_series, TimeSeriesData, None),
+        }.items()
+        if include
+    }
+    return await _get_aggregate_analytics(
+        db,
+        current_user,
+        filters,
+        aggregate=aggregate,
+        get_metrics=crud_city_eye_analytics.get_human_flow_metrics,
+        metric_schemas=metric_schemas,
+        data_cls=PerDeviceAnalyticsData,
+        item_cls=AggregateAnalyticsItem,
+        interval_minutes=interval_minutes,
+    )
 
-    if thing_name:
-        shadow_document = iot_command_service.get_xlines_config_shadow(thing_name)
-        if shadow_document:
-            state = shadow_document.get("state", {})
-            reported = state.get("reported", {})
-            xlines_cfg_content = reported.get("xlines_cfg_content")
-            if xlines_cfg_content:
-                try:
-                    xlines_config = json.loads(xlines_cfg_content)
-                except json.JSONDecodeError:
-                    logger.error(f"Failed to parse xlines configuration for thing {thing_name}")
 
+@router.post("/traffic-flow/aggregate", response_model=CityEyeAggregateTrafficAnalyticsResponse)
+async def get_aggregate_traffic_flow_analytics(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    filters: TrafficAnalyticsFilters,
+    current_user: User = Depends(deps.get_current_active_user),
+    aggregate: str = Query("site", regex="^(site|location)$", description="site: one item for all devices, location: one item per device location"),
+    include_total_count: bool = Query(True),
+    include_vehicle_type_distribution: bool = Query(True),
+    include_hourly_distribution: bool = Query(True),
+    include_time_series: bool = Query(True),
+    interval_minutes: int = Query(60, ge=1, description="Time series bucket size in minutes, coarsened automatically for long ranges"),
+) -> Any:
+    """
+    Retrieve traffic flow analytics summed across all authorized devices (aggregate=site) or per
+    device location (aggregate=location), computed in SQL rather than per device.
+    """
+    metric_schemas = {
+        key: (schema, wrapper_key)
+        for key, (include, schema, wrapper_key) in {
+            "total_count": (include_total_count, TotalCount, "total_count"),
+            "vehicle_type_distribution": (include_vehicle_type_distribution, VehicleTypeDistribution, None),
+            "hourly_distribution": (include_hourly_distribution, HourlyCount, None),
+            "time_series_data": (include_time_series, TimeSeriesData, None),
+        }.items()
+        if include
+    }
+    return await _get_aggregate_analytics(
+        db,
+        current_user,
+        filters,
+        aggregate=aggregate,
+        get_metrics=crud_city_eye_analytics.get_traffic_flow_metrics,
+        metric_schemas=metric_schemas,
+        data_cls=PerDeviceTrafficAnalyticsData,
+        item_cls=AggregateTrafficAnalyticsItem,
+        interval_minutes=interval_minutes,
+    )
+
+
+async def _get_polygons_by_thing(
+    device_ids: List[uuid.UUID], device_details: Dict[uuid.UUID, Dict[str, Any]]
+) -> Dict[str, Union[List[Dict[str, Any]], Exception]]:
+    """
+    Returns the cached shadow polygon geometry of the devices' things, keyed by thing name.
+    """
+    thing_names = [device_details[device_id]["thing_name"] for device_id in device_ids]
+    return await xlines_config_cache.get_polygons_by_thing(thing_name for thing_name in thing_names if thing_name)
+
+
+def _build_direction_analytics_response(
+    polygons: List[Dict[str, Any]], direction_counts: Dict[str, Dict[str, int]]
+) -> List[Dict]:
+    """
+    Builds the direction analytics response from one device's counts and its cached shadow config.
+    """
     detection_zones = []
 
     # Build detection zones with the new format
     for polygon_id, counts in sorted(direction_counts.items()):
         polygon_id_int = int(polygon_id)
 
-        # Default values
-        polygon_name = f"Zone {int(polygon_id) + 1}"
-        default_lat = 35.681236
-        default_lng = 139.767125
-        
-        in_start_point = {"lat": default_lat, "lng": default_lng}
-        in_end_point = {"lat": default_lat, "lng": default_lng}
-        out_start_point = {"lat": default_lat, "lng": default_lng}
-        out_end_point = {"lat": default_lat, "lng": default_lng}
-
-
-        # Get polygon data from shadow if available
-        if polygon_id_int < len(xlines_config):
-            polygon_data = xlines_config[polygon_id_int]
-            polygon_name = polygon_data.get("name", f"Zone {int(polygon_id) + 1}")
-            
-            # Get center coordinates
-            center = polygon_data.get("center", {})
-            if center:
-                start_point = center.get("startPoint", {})
-                end_point = center.get("endPoint", {})
-
-                if start_point and end_point:
-                    in_start_point = {
-                        "lat": start_point.get("lat", 35.681236),
-                        "lng": start_point.get("lng", 139.767125)
-                    }
-                    in_end_point = {
-                        "lat": end_point.get("lat", 35.681236),
-                        "lng": end_point.get("lng", 139.767125)
-                    }
-
-                    # Calculate out coordinates using the helper function
-                    out_start_point, out_end_point = calculate_offset_route(center)
-                
+        # Get polygon data from shadow if available, default values otherwise
+        if polygon_id_int < len(polygons):
+            geometry = polygons[polygon_id_int]
+        else:
+            geometry = parse_polygon_geometry(polygon_id_int, None)
 
         # Create detection zone
         detection_zone = {
             "polygon_id": polygon_id_int,
-            "polygon_name": polygon_name,
+            "polygon_name": geometry["polygon_name"],
             "in_data": {
-                "start_point": in_start_point,
-                "end_point": in_end_point,
+                "start_point": geometry["in_start_point"],
+                "end_point": geometry["in_end_point"],
                 "count": counts['in_count']
             },
             "out_data": {
-                "start_point": out_start_point,  
-                "end_point": out_end_point,
+                "start_point": geometry["out_start_point"],
+                "end_point": geometry["out_end_point"],
                 "count": counts['out_count']
             }
         }
@@ -368,6 +652,7 @@ async def get_human_direction_analytics(
             - hours: Optional list of hours to filter
             - genders: Optional gender filters
             - age_groups: Optional age group filters
+            - source: "live" (default) or "provisioned" to read provisioning-period data
     """
     final_device_ids, processed_device_details = await _validate_devices_for_analytics(
         db, current_user, filters.device_ids
@@ -378,23 +663,38 @@ async def get_human_direction_analytics(
 
     analytics_results: List[DeviceDirectionItem] = []
 
+    # In/out counts for all authorized devices are computed in a single scan
+    all_devices_filters = filters.model_copy(deep=True)
+    all_devices_filters.device_ids = final_device_ids
+
+    counts_by_device: Dict[uuid.UUID, Dict[str, Dict[str, int]]] = {}
+    query_error: Optional[str] = None
+    try:
+        counts_by_device = await crud_city_eye_analytics.get_direction_counts_by_device(db, filters=all_devices_filters)
+    except Exception as e:
+        logger.error(f"Error processing direction analytics for devices {final_device_ids}: {str(e)}", exc_info=True)
+        query_error = str(e)
+
+    # Shadow configs of all devices are read concurrently, once per distinct thing
+    polygons_by_thing = await _get_polygons_by_thing(final_device_ids, processed_device_details) if not query_error else {}
+
     for device_id in final_device_ids:
         device_details = processed_device_details.get(device_id, {})
         logger.info(f"Processing direction analytics for device: {device_details.get('device_name')} ({device_id})")
-
-        single_device_filters = filters.model_copy(deep=True)
-        single_device_filters.device_ids = [device_id]
-        
-        detection_zones = []
+        detection_zones: List[Dict] = []
         error_message_for_device: Optional[str] = None
 
-        try:
-            detection_zones = await _build_direction_analytics_response(
-                db, device_details.get("thing_name"), single_device_filters, crud_city_eye_analytics.get_direction_counts
-            )
-        except Exception as e:
-            logger.error(f"Error processing direction analytics for device {device_id}: {str(e)}", exc_info=True)
-            error_message_for_device = f"Failed to process direction analytics for this device: {str(e)}"
+        if query_error:
+            error_message_for_device = f"Failed to process direction analytics for this device: {query_error}"
+        else:
+            try:
+                polygons = polygons_by_thing.get(device_details.get("thing_name"), [])
+                if isinstance(polygons, Exception):
+                    raise polygons
+                detection_zones = _build_direction_analytics_response(polygons, counts_by_device.get(device_id, {}))
+            except Exception as e:
+                logger.error(f"Error processing direction analytics for device {device_id}: {str(e)}", exc_info=True)
+                error_message_for_device = f"Failed to process direction analytics for this device: {str(e)}"
 
         analytics_results.append(
             DeviceDirectionItem(
@@ -420,6 +720,7 @@ async def get_traffic_direction_analytics(
 ) -> Any:
     """
     Retrieve per-polygon in/out counts for traffic flow analytics, per device.
+    filters.source selects live ("live", default) or provisioning-period ("provisioned") data.
     """
     final_device_ids, processed_device_details = await _validate_devices_for_analytics(
         db, current_user, filters.device_ids
@@ -430,23 +731,38 @@ async def get_traffic_direction_analytics(
 
     analytics_results: List[DeviceDirectionItem] = []
 
+    # In/out counts for all authorized devices are computed in a single scan
+    all_devices_filters = filters.model_copy(deep=True)
+    all_devices_filters.device_ids = final_device_ids
+
+    counts_by_device: Dict[uuid.UUID, Dict[str, Dict[str, int]]] = {}
+    query_error: Optional[str] = None
+    try:
+        counts_by_device = await crud_city_eye_analytics.get_traffic_direction_counts_by_device(db, filters=all_devices_filters)
+    except Exception as e:
+        logger.error(f"Error processing traffic direction analytics for devices {final_device_ids}: {str(e)}", exc_info=True)
+        query_error = str(e)
+
+    # Shadow configs of all devices are read concurrently, once per distinct thing
+    polygons_by_thing = await _get_polygons_by_thing(final_device_ids, processed_device_details) if not query_error else {}
+
     for device_id in final_device_ids:
         device_details = processed_device_details.get(device_id, {})
         logger.info(f"Processing traffic direction analytics for device: {device_details.get('device_name')} ({device_id})")
-
-        single_device_filters = filters.model_copy(deep=True)
-        single_device_filters.device_ids = [device_id]
-        
-        detection_zones = []
+        detection_zones: List[Dict] = []
         error_message_for_device: Optional[str] = None
 
-        try:
-            detection_zones = await _build_direction_analytics_response(
-                db, device_details.get("thing_name"), single_device_filters, crud_city_eye_analytics.get_traffic_direction_counts
-            )
-        except Exception as e:
-            logger.error(f"Error processing traffic direction analytics for device {device_id}: {str(e)}", exc_info=True)
-            error_message_for_device = f"Failed to process traffic direction analytics for this device: {str(e)}"
+        if query_error:
+            error_message_for_device = f"Failed to process traffic direction analytics for this device: {query_error}"
+        else:
+            try:
+                polygons = polygons_by_thing.get(device_details.get("thing_name"), [])
+                if isinstance(polygons, Exception):
+                    raise polygons
+                detection_zones = _build_direction_analytics_response(polygons, counts_by_device.get(device_id, {}))
+            except Exception as e:
+                logger.error(f"Error processing traffic direction analytics for device {device_id}: {str(e)}", exc_info=True)
+                error_message_for_device = f"Failed to process traffic direction analytics for this device: {str(e)}"
 
         analytics_results.append(
             DeviceDirectionItem(
@@ -463,6 +779,102 @@ async def get_traffic_direction_analytics(
     return analytics_results
 
 
+async def _export_raw_data(
+    db: AsyncSession,
+    current_user: User,
+    filters: Union[AnalyticsFilters, TrafficAnalyticsFilters],
+    *,
+    kind: str,
+    count_columns: tuple,
+    format: str,
+) -> StreamingResponse:
+    """
+    Streams the raw "human" or "traffic" rows of the authorized devices in `format`, one encoded
+    chunk per CITY_EYE_EXPORT_CHUNK_ROWS rows.
+    """
+    final_device_ids, _ = await _validate_devices_for_analytics(db, current_user, filters.device_ids)
+    if not final_device_ids:
+        raise HTTPException(status_code=404, detail="No authorized devices found for export")
+
+    columns = [*KEY_COLUMNS, *count_columns]
+    try:
+        encoder = create_export_encoder(format, columns)
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    export_filters = filters.model_copy(deep=True)
+    export_filters.device_ids = final_device_ids
+
+    # The request session is closed once the endpoint returns, so the stream reads on its own session
+    session_factory = async_sessionmaker(bind=db.bind, class_=AsyncSession, expire_on_commit=False)
+
+    async def export_stream():
+        async with session_factory() as session:
+            yield encoder.begin()
+            async for rows in crud_city_eye_analytics.stream_raw_rows(
+                session,
+                kind=kind,
+                filters=export_filters,
+                columns=columns,
+                chunk_size=settings.CITY_EYE_EXPORT_CHUNK_ROWS,
+            ):
+                yield encoder.encode(rows)
+            yield encoder.end()
+
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"city_eye_{kind}_data_{filters.start_time:%Y%m%d%H%M}_{filters.end_time:%Y%m%d%H%M}.{extension}"
+    logger.info(f"User {current_user.email} exporting {kind} data of {len(final_device_ids)} devices as {format}")
+    return StreamingResponse(
+        export_stream(),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+@router.post("/human-flow/export")
+async def export_human_flow_data(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    filters: AnalyticsFilters,
+    current_user: User = Depends(deps.get_current_active_user),
+    format: str = Query("csv", regex="^(csv|ndjson|arrow|parquet)$", description="Export format"),
+) -> Any:
+    """
+    Export raw human flow rows of the authorized devices for the filtered range.
+    Streams CSV, NDJSON, an Arrow IPC stream or Parquet; arrow and parquet require pyarrow on the server.
+    """
+    return await _export_raw_data(
+        db, current_user, filters, kind="human", count_columns=HUMAN_COUNT_COLUMNS, format=format
+    )
+
+
+@router.post("/traffic-flow/export")
+async def export_traffic_flow_data(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    filters: TrafficAnalyticsFilters,
+    current_user: User = Depends(deps.get_current_active_user),
+    format: str = Query("csv", regex="^(csv|ndjson|arrow|parquet)$", description="Export format"),
+) -> Any:
+    """
+    Export raw traffic flow rows of the authorized devices for the filtered range.
+    Streams CSV, NDJSON, an Arrow IPC stream or Parquet; arrow and parquet require pyarrow on the server.
+    """
+    return await _export_raw_data(
+        db, current_user, filters, kind="traffic", count_columns=TRAFFIC_COUNT_COLUMNS, format=format
+    )
+
+
+@router.get("/cache-stats")
+async def get_analytics_cache_stats(
+    current_user: User = Depends(deps.get_current_admin_or_engineer_user),
+) -> Any:
+    """
+    Hit/miss counters of the analytics result cache (per worker for the in-memory backend).
+    """
+    return analytics_cache.stats()
+
+
 @router.post("/polygon-xlines-config", response_model=DeviceCommandResponse)
 async def polygon_xlines_config(
     *,
@@ -550,6 +962,7 @@ async def polygon_xlines_config(
             message_id=str(db_command.message_id),
             status=CommandStatus.FAILED.value,
             error_message="Failed to update device shadow in AWS IoT Core",
+            device_id=db_command.device_id,
         )
 
         raise HTTPException(
@@ -625,7 +1038,7 @@ async def get_polygon_xlines_config(
         )
     
     # Retrieve the shadow from AWS IoT
-    shadow_document = iot_command_service.get_xlines_config_shadow(db_device.thing_name)
+    shadow_document = await asyncio.to_thread(iot_command_service.get_xlines_config_shadow, db_device.thing_name)
     
     if not shadow_document:
         raise HTTPException(
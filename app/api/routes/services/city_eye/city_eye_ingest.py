@@ -0,0 +1,178 @@
+import asyncio
+from datetime import timedelta
+from typing import Any, Tuple
+from fastapi import Depends, HTTPException, APIRouter, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api import deps
+from app.core.config import settings
+from app.crud import solution as crud_solution
+from app.crud.crud_city_eye_ingest import crud_city_eye_ingest
+from app.db.async_session import jst_now
+from app.models import CityEyeHumanTable, CityEyeTrafficTable
+from app.schemas.services.city_eye_analytics import CityEyeIngestResponse
+from app.utils.analytics_cache import analytics_cache
+from app.utils.city_eye_ingest import (
+    HUMAN_COUNT_COLUMNS,
+    TRAFFIC_COUNT_COLUMNS,
+    KEY_COLUMNS,
+    MAX_REPORTED_ERRORS,
+    MIN_ROW_BYTES,
+    IngestBackpressure,
+    IngestPayloadError,
+    parse_columns,
+    validate_columns,
+    deduplicate_rows,
+)
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+router = APIRouter()
+
+# Shared by both endpoints so the bound holds per worker
+ingest_backpressure = IngestBackpressure(max_rows=settings.CITY_EYE_INGEST_MAX_BUFFERED_ROWS)
+
+
+def _too_busy(rows: int) -> HTTPException:
+    logger.warning(f"Rejecting batch of up to {rows} rows, {ingest_backpressure.in_flight} rows already in flight")
+    return HTTPException(
+        status_code=429,
+        detail="Ingestion is behind, please retry the batch later",
+        headers={"Retry-After": str(settings.CITY_EYE_INGEST_RETRY_AFTER_SECONDS)},
+    )
+
+
+async def _read_body(request: Request) -> bytes:
+    """Reads the body, giving up as soon as it exceeds CITY_EYE_INGEST_MAX_BODY_BYTES."""
+    chunks, size = [], 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > settings.CITY_EYE_INGEST_MAX_BODY_BYTES:
+            raise HTTPException(status_code=413, detail=f"Batch exceeds {settings.CITY_EYE_INGEST_MAX_BODY_BYTES} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def _ingest(
+    db: AsyncSession, request: Request, *, table, count_columns: Tuple[str, ...], solution_name: str = "City Eye"
+) -> CityEyeIngestResponse:
+    """
+    Parses, validates, de-duplicates and bulk loads one batch of edge counts into `table`.
+
+    Rows are reserved against the worker's backpressure bound before the body is read: first as
+    many as the announced Content-Length can hold (the batch row limit without one), then exactly
+    the parsed row count. Parsing and validation are per-row loops and run in a thread.
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.CITY_EYE_INGEST_MAX_BODY_BYTES:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {settings.CITY_EYE_INGEST_MAX_BODY_BYTES} bytes")
+
+    reserved = settings.CITY_EYE_INGEST_MAX_BATCH_ROWS
+    if content_length and content_length.isdigit():
+        reserved = max(1, min(reserved, int(content_length) // MIN_ROW_BYTES))
+    if not ingest_backpressure.try_reserve(reserved):
+        raise _too_busy(reserved)
+
+    try:
+        body = await _read_body(request)
+        try:
+            columns = await asyncio.to_thread(
+                parse_columns, body, request.headers.get("content-type"), (*KEY_COLUMNS, *count_columns)
+            )
+        except IngestPayloadError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        del body
+
+        received = len(columns["device_id"])
+        if received > settings.CITY_EYE_INGEST_MAX_BATCH_ROWS:
+            raise HTTPException(status_code=413, detail=f"Batch exceeds {settings.CITY_EYE_INGEST_MAX_BATCH_ROWS} rows")
+
+        # Hold the actual row count from now on (no await in between, so nothing interleaves)
+        ingest_backpressure.release(reserved)
+        reserved = 0
+        if not ingest_backpressure.try_reserve(received):
+            raise _too_busy(received)
+        reserved = received
+
+        # Timestamps far from now come from a device with a broken clock
+        now = jst_now().replace(tzinfo=None)
+        timestamp_range = (
+            now - timedelta(days=settings.CITY_EYE_INGEST_MAX_PAST_DAYS),
+            now + timedelta(minutes=settings.CITY_EYE_INGEST_MAX_FUTURE_MINUTES),
+        )
+        rows, errors, rejected = await asyncio.to_thread(validate_columns, columns, count_columns, timestamp_range)
+        del columns
+        rows, duplicates = await asyncio.to_thread(deduplicate_rows, rows)
+
+        solution_id = await crud_solution.get_id_by_name_cached(db, name=solution_name)
+        if not solution_id:
+            raise HTTPException(status_code=404, detail=f"{solution_name} solution not configured")
+
+        device_solution_ids = await crud_city_eye_ingest.get_device_solution_ids(
+            db, device_ids=set(rows["device_id"]), solution_id=solution_id
+        )
+        undeployed = set(rows["device_id"]) - device_solution_ids.keys()
+        if undeployed:
+            keep = [index for index, device_id in enumerate(rows["device_id"]) if device_id in device_solution_ids]
+            rejected += len(rows["device_id"]) - len(keep)
+            errors += [
+                {"row": None, "error": f"{solution_name} is not deployed on device {device_id}"}
+                for device_id in sorted(undeployed, key=str)
+            ][:max(0, MAX_REPORTED_ERRORS - len(errors))]
+            rows = {column: [values[index] for index in keep] for column, values in rows.items()}
+
+        rows["solution_id"] = [solution_id] * len(rows["device_id"])
+        rows["device_solution_id"] = [device_solution_ids[device_id] for device_id in rows["device_id"]]
+
+        inserted = await crud_city_eye_ingest.bulk_insert(db, table=table, columns=rows, count_columns=count_columns)
+        duplicates += len(rows["device_id"]) - inserted
+        if inserted:
+            # Cached analytics of these devices no longer include all of their rows
+            await analytics_cache.invalidate_devices(rows["device_id"])
+    finally:
+        ingest_backpressure.release(reserved)
+
+    logger.info(
+        f"Ingested {table.__tablename__} batch: received {received}, inserted {inserted}, "
+        f"duplicates {duplicates}, rejected {rejected}"
+    )
+    return CityEyeIngestResponse(
+        received=received, inserted=inserted, duplicates=duplicates, rejected=rejected, errors=errors
+    )
+
+
+@router.post("/human-flow", response_model=CityEyeIngestResponse)
+async def ingest_human_flow(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    request: Request,
+    api_key_valid: bool = Depends(deps.verify_api_key),
+) -> Any:
+    """
+    Bulk load human flow counts pushed by edge devices. Requires API key authentication.
+
+    The body is either NDJSON (Content-Type application/x-ndjson, one row object per line) or a
+    columnar JSON object of equally long lists. Every row needs device_id, timestamp,
+    polygon_id_in, polygon_id_out and the ten demographic count columns.
+
+    Invalid rows are rejected individually, rows whose (device_id, timestamp, polygon_id_in,
+    polygon_id_out) repeats within the batch or is already stored are skipped as duplicates, so a
+    batch can safely be retried. Returns 429 with Retry-After while the worker is saturated.
+    """
+    return await _ingest(db, request, table=CityEyeHumanTable, count_columns=HUMAN_COUNT_COLUMNS)
+
+
+@router.post("/traffic-flow", response_model=CityEyeIngestResponse)
+async def ingest_traffic_flow(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    request: Request,
+    api_key_valid: bool = Depends(deps.verify_api_key),
+) -> Any:
+    """
+    Bulk load traffic counts pushed by edge devices. Requires API key authentication.
+
+    Same payload formats and semantics as /human-flow, with the large, normal, bicycle and
+    motorcycle count columns.
+    """
+    return await _ingest(db, request, table=CityEyeTrafficTable, count_columns=TRAFFIC_COUNT_COLUMNS)
@@ -1,10 +1,11 @@
-from typing import Any, Dict, Optional
-from fastapi import APIRouter, Depends, HTTPException
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.api import deps
 from app.crud import device_command, job as crud_job, device as crud_device
-from app.models import User, JobStatus
+from app.models import User, UserRole, JobStatus
 from app.utils.logger import get_logger
 from app.utils.util import check_device_access
 import uuid
@@ -13,14 +14,61 @@ import asyncio
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from app.db.async_session import AsyncSessionLocal
+from app.utils.event_broker import event_broker
 
 logger = get_logger("api.sse")
 
 router = APIRouter()
 
-# Store active SSE connections: message_id -> connection_queue
-active_command_connections = {}
-active_job_connections = {}
+# Store active SSE connections of this worker: message_id / job_id -> connection queues (one per client)
+active_command_connections: Dict[str, Set[asyncio.Queue]] = {}
+active_job_connections: Dict[str, Set[asyncio.Queue]] = {}
+# Store active City Eye threshold streams: customer_id -> connection queues of that customer
+active_threshold_connections: Dict[uuid.UUID, Set[asyncio.Queue]] = {}
+# Store active multiplexed streams: topic ("command:<message_id>", "job:<job_id>", "device:<device_id>") -> connection queues
+active_stream_connections: Dict[str, Set[asyncio.Queue]] = {}
+
+# Event broker channels; updates are published to every worker, which delivers them to its own connections
+COMMAND_UPDATES_CHANNEL = "sse_command_updates"
+JOB_UPDATES_CHANNEL = "sse_job_updates"
+THRESHOLD_CROSSINGS_CHANNEL = "sse_threshold_crossings"
+
+# Events buffered per threshold stream; a client that falls further behind misses events
+THRESHOLD_QUEUE_SIZE = 100
+# Events buffered per multiplexed stream, and topics one stream may subscribe to
+STREAM_QUEUE_SIZE = 1000
+STREAM_MAX_TOPICS = 200
+# Multiplexed stream events kept for Last-Event-ID resumes
+STREAM_REPLAY_SIZE = 1000
+
+# Command update fields only shown to the command's owner, not on the topic of its device
+COMMAND_PRIVATE_FIELDS = ("response_payload", "error_message")
+
+# Recent multiplexed stream events of this worker, oldest first: (event_id, event_type, topic -> data)
+stream_replay_buffer: Deque[Tuple[str, str, Dict[str, Dict[str, Any]]]] = deque(maxlen=STREAM_REPLAY_SIZE)
+
+
+def _trim_update(event: Dict[str, Any], fields: Tuple[str, ...]) -> Dict[str, Any]:
+    """
+    Returns the event with the given (possibly large) fields of its update cleared, for workers it
+    is too large to be relayed to. `truncated` tells clients to fetch the full status from the API.
+    """
+    update = {**event["update"], **{field: None for field in fields}, "truncated": True}
+    return {**event, "update": update}
+
+
+def _discard_connection(connections: Dict[Any, Set[asyncio.Queue]], key: Any, connection_queue: asyncio.Queue):
+    queues = connections.get(key)
+    if queues is not None:
+        queues.discard(connection_queue)
+        if not queues:
+            del connections[key]
+
+
+def _format_event(event_type: str, data: Dict[str, Any], event_id: Optional[str] = None) -> str:
+    """Frames one text/event-stream event; JSON has no line breaks, so data fits on one line."""
+    id_line = f"id: {event_id}\n" if event_id else ""
+    return f"{id_line}event: {event_type}\ndata: {json.dumps(data)}\n\n"
 
 
 @router.get("/commands/status/{message_id}")
@@ -69,9 +117,9 @@ async def command_status_stream(
             headers={"Cache-Control": "no-cache", "Connection": "keep-alive"},
         )
 
-    # Create connection queue for this message
+    # Create connection queue for this client; other clients of the same message keep theirs
     connection_queue = asyncio.Queue()
-    active_command_connections[message_id] = connection_queue
+    active_command_connections.setdefault(message_id, set()).add(connection_queue)
 
     async def event_stream():
         # Inner function: Actually generates the streaming data
@@ -109,8 +157,7 @@ async def command_status_stream(
             logger.error(f"Error in SSE stream for command {message_id}: {str(e)}")
         finally:
             # Clean up connection
-            if message_id in active_command_connections:
-                del active_command_connections[message_id]
+            _discard_connection(active_command_connections, message_id, connection_queue)
 
     return StreamingResponse(
         event_stream(),
@@ -124,30 +171,57 @@ def notify_command_update(
     status: str,
     response_payload: dict = None,
     error_message: str = None,
+    device_id: Optional[uuid.UUID] = None,
 ):
     """
     Function to push updates to SSE connections
-    Called from the internal status update endpoint
+    Called from the internal status update endpoint; the update reaches the connections on any
+    worker, and the device's multiplexed streams when device_id is given
     """
+    update_data = {
+        "status": status,
+        "completed_at": datetime.now(ZoneInfo("Asia/Tokyo")).isoformat(),
+        "response_payload": response_payload,
+        "error_message": error_message,
+    }
+    event = {
+        "event_id": uuid.uuid4().hex,
+        "message_id": message_id,
+        "device_id": str(device_id) if device_id else None,
+        "update": update_data,
+    }
+    event_broker.publish(COMMAND_UPDATES_CHANNEL, event, _trim_update(event, ("response_payload", "error_message")))
+
+
+def _deliver_command_update(event: Dict[str, Any]):
+    message_id = event["message_id"]
     if message_id in active_command_connections:
-        update_data = {
-            "status": status,
-            "completed_at": datetime.now(ZoneInfo("Asia/Tokyo")).isoformat(),
-            "response_payload": response_payload,
-            "error_message": error_message,
-        }
-
-        try:
-            # Put update in queue (non-blocking)
-            active_command_connections[message_id].put_nowait(update_data)
-            logger.info(f"Pushed SSE update for command {message_id}")
-        except Exception as e:
-            logger.error(
-                f"Failed to push SSE update for command {message_id}: {str(e)}"
-            )
+        for connection_queue in active_command_connections[message_id]:
+            try:
+                # Put update in queue (non-blocking)
+                connection_queue.put_nowait(event["update"])
+                logger.info(f"Pushed SSE update for command {message_id}")
+            except Exception as e:
+                logger.error(
+                    f"Failed to push SSE update for command {message_id}: {str(e)}"
+                )
     else:
         logger.debug(f"No active SSE connection for command {message_id}")
 
+    try:
+        # Stream topics use the canonical UUID form
+        command_topic = f"command:{uuid.UUID(message_id)}"
+    except ValueError:
+        command_topic = f"command:{message_id}"
+    data = {"message_id": message_id, "device_id": event["device_id"], **event["update"]}
+    topic_data = {command_topic: data}
+    if event["device_id"]:
+        # Other users of the device see the status, the response stays with the command's owner
+        topic_data[f"device:{event['device_id']}"] = {
+            key: value for key, value in data.items() if key not in COMMAND_PRIVATE_FIELDS
+        }
+    _deliver_stream_event(event["event_id"], "command", topic_data)
+
 
 @router.get("/jobs/status/{job_id}")
 async def job_status_stream(
@@ -157,7 +231,7 @@ async def job_status_stream(
 ) -> Any:
     """
     SSE endpoint for real-time job status updates.
-    The stream will proactively sync with AWS IoT to ensure status updates.
+    Status changes are found by the job reconciler, which pushes them to this stream.
     """
     async with AsyncSessionLocal() as session:
         try:
@@ -185,7 +259,7 @@ async def job_status_stream(
         return StreamingResponse(send_final_status(), media_type="text/event-stream")
 
     connection_queue = asyncio.Queue()
-    active_job_connections[job_id] = connection_queue
+    active_job_connections.setdefault(job_id, set()).add(connection_queue)
 
     async def event_stream():
         try:
@@ -203,7 +277,7 @@ async def job_status_stream(
             while datetime.now(ZoneInfo("Asia/Tokyo")) < timeout_time:
                 try:
                     # Wait for update with a 30-second timeout.
-                    # This allows the loop to periodically check AWS.
+                    # This allows the loop to periodically send a heartbeat.
                     update_data = await asyncio.wait_for(connection_queue.get(), timeout=30.0)
                     yield f"data: {json.dumps(update_data)}\n\n"
                     
@@ -211,32 +285,7 @@ async def job_status_stream(
                         break
                 
                 except asyncio.TimeoutError:
-                    async with AsyncSessionLocal() as session:
-                        try:
-                            # Check for updates from AWS in case the queue is empty
-                            synced_job = await crud_job.sync_job_status(session, db_job)
-                        finally:
-                            await session.close()
-                    # If status has changed to terminal, send it and break
-                    if synced_job.status.value != db_job.status.value and synced_job.status.value in [JobStatus.SUCCEEDED.value, JobStatus.FAILED.value, JobStatus.TIMED_OUT.value, JobStatus.CANCELED.value, JobStatus.ARCHIVED.value]:
-                        data = {
-                            "status": synced_job.status.value,
-                            "completed_at": synced_job.completed_at.isoformat() if synced_job.completed_at else None,
-                            "error_message": synced_job.error_message,
-                            "status_details": synced_job.status_details,
-                            "progress_percentage": 100,
-                        }
-                        yield f"data: {json.dumps(data)}\n\n"
-                        break
-                    elif synced_job.status.value != db_job.status.value:
-                        # If status has changed but not terminal, send the update
-                        data = {
-                            "status": synced_job.status.value,
-                            "status_details": synced_job.status_details,
-                        }
-                        yield f"data: {json.dumps(data)}\n\n"
-                
-                    # Otherwise, just send a heartbeat
+                    # No update from the job reconciler yet, just send a heartbeat
                     yield f"data: {json.dumps({'heartbeat': True})}\n\n"
                     continue
             
@@ -247,8 +296,7 @@ async def job_status_stream(
         except Exception as e:
             logger.error(f"Error in SSE stream for job {job_id}: {str(e)}")
         finally:
-            if job_id in active_job_connections:
-                del active_job_connections[job_id]
+            _discard_connection(active_job_connections, job_id, connection_queue)
 
     return StreamingResponse(event_stream(), media_type="text/event-stream")
 
@@ -259,19 +307,265 @@ def notify_job_update(
     progress_percentage: Optional[int] = None,
     status_details: Optional[Dict[str, Any]] = None,
     error_message: Optional[str] = None,
+    device_id: Optional[uuid.UUID] = None,
 ):
-    """Function to push updates to SSE connections for jobs."""
+    """Function to push updates to SSE connections for jobs, on any worker."""
+    update_data = {
+        "status": status,
+        "progress_percentage": progress_percentage,
+        "status_details": status_details,
+        "error_message": error_message,
+    }
+    event = {
+        "event_id": uuid.uuid4().hex,
+        "job_id": job_id,
+        "device_id": str(device_id) if device_id else None,
+        "update": update_data,
+    }
+    event_broker.publish(JOB_UPDATES_CHANNEL, event, _trim_update(event, ("status_details", "error_message")))
+
+
+def _deliver_job_update(event: Dict[str, Any]):
+    job_id = event["job_id"]
     if job_id in active_job_connections:
-        update_data = {
-            "status": status,
-            "progress_percentage": progress_percentage,
-            "status_details": status_details,
-            "error_message": error_message,
-        }
-        try:
-            active_job_connections[job_id].put_nowait(update_data)
-            logger.info(f"Pushed SSE update for job {job_id}")
-        except Exception as e:
-            logger.error(f"Failed to push SSE update for job {job_id}: {str(e)}")
+        for connection_queue in active_job_connections[job_id]:
+            try:
+                connection_queue.put_nowait(event["update"])
+                logger.info(f"Pushed SSE update for job {job_id}")
+            except Exception as e:
+                logger.error(f"Failed to push SSE update for job {job_id}: {str(e)}")
     else:
         logger.debug(f"No active SSE connection for job {job_id}")
+
+    data = {"job_id": job_id, "device_id": event["device_id"], **event["update"]}
+    topics = [f"job:{job_id}"] + ([f"device:{event['device_id']}"] if event["device_id"] else [])
+    _deliver_stream_event(event["event_id"], "job", {topic: data for topic in topics})
+
+
+@router.get("/city-eye/thresholds")
+async def threshold_event_stream(
+    *,
+    customer_id: Optional[uuid.UUID] = None,
+    current_user: User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    SSE endpoint for City Eye threshold crossings of a customer's devices.
+    Customer users receive their own customer's events, admins and engineers pass customer_id.
+    """
+    if current_user.role in [UserRole.ADMIN, UserRole.ENGINEER]:
+        if customer_id is None:
+            raise HTTPException(status_code=400, detail="customer_id is required")
+    else:
+        if current_user.customer_id is None or (customer_id is not None and customer_id != current_user.customer_id):
+            raise HTTPException(status_code=403, detail="Not authorized to receive this customer's threshold events")
+        customer_id = current_user.customer_id
+
+    connection_queue = asyncio.Queue(maxsize=THRESHOLD_QUEUE_SIZE)
+    active_threshold_connections.setdefault(customer_id, set()).add(connection_queue)
+
+    async def event_stream():
+        try:
+            # Clients reconnect after the timeout, like the job streams
+            timeout_time = datetime.now(ZoneInfo("Asia/Tokyo")) + timedelta(minutes=30)
+
+            while datetime.now(ZoneInfo("Asia/Tokyo")) < timeout_time:
+                try:
+                    event = await asyncio.wait_for(connection_queue.get(), timeout=30.0)
+                    yield f"data: {json.dumps(event)}\n\n"
+                except asyncio.TimeoutError:
+                    yield f"data: {json.dumps({'heartbeat': True})}\n\n"
+
+        except Exception as e:
+            logger.error(f"Error in SSE stream for thresholds of customer {customer_id}: {str(e)}")
+        finally:
+            _discard_connection(active_threshold_connections, customer_id, connection_queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "Connection": "keep-alive"},
+    )
+
+
+def notify_threshold_crossing(customer_id: uuid.UUID, event: Dict[str, Any]):
+    """Function to push a threshold crossing to the customer's SSE connections on every worker."""
+    event_broker.publish(THRESHOLD_CROSSINGS_CHANNEL, {
+        "event_id": uuid.uuid4().hex,
+        "customer_id": str(customer_id),
+        "event": event,
+    })
+
+
+def _deliver_threshold_crossing(event: Dict[str, Any]):
+    customer_id = uuid.UUID(event["customer_id"])
+    for connection_queue in active_threshold_connections.get(customer_id, ()):
+        try:
+            connection_queue.put_nowait(event["event"])
+        except asyncio.QueueFull:
+            logger.warning(f"Dropped threshold event for a slow SSE client of customer {customer_id}")
+
+    _deliver_stream_event(event["event_id"], "threshold", {f"device:{event['event']['device_id']}": event["event"]})
+
+
+
+@router.get("/stream")
+async def multiplexed_event_stream(
+    *,
+    db: AsyncSession = Depends(deps.get_async_db),
+    commands: List[str] = Query(default=[]),
+    jobs: List[str] = Query(default=[]),
+    devices: List[uuid.UUID] = Query(default=[]),
+    last_event_id: Optional[str] = Header(default=None, alias="Last-Event-ID"),
+    current_user: User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    SSE endpoint multiplexing many subscriptions over one connection: status updates of the
+    given commands and jobs, and every command, job and threshold event of the given devices.
+
+    Events carry an `id` and their type (`command`, `job` or `threshold`). A client reconnecting
+    with the Last-Event-ID header receives the events it missed, as long as they are still in
+    the replay buffer; otherwise, as on a first connection, the stream starts with the current
+    status of each command and job.
+    """
+    commands = list(dict.fromkeys(commands))
+    jobs = list(dict.fromkeys(jobs))
+    devices = list(dict.fromkeys(devices))
+    if not commands and not jobs and not devices:
+        raise HTTPException(status_code=400, detail="Subscribe to at least one command, job or device")
+    if len(commands) + len(jobs) + len(devices) > STREAM_MAX_TOPICS:
+        raise HTTPException(status_code=400, detail=f"A stream can subscribe to at most {STREAM_MAX_TOPICS} commands, jobs and devices")
+
+    try:
+        message_uuids = [uuid.UUID(message_id) for message_id in commands]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid message ID format")
+
+    # Events delivered while the current statuses are read are replayed after them
+    replay_mark = stream_replay_buffer[-1][0] if stream_replay_buffer else None
+
+    db_commands = await device_command.get_by_message_ids(db, message_ids=message_uuids) if message_uuids else []
+    if len(db_commands) != len(message_uuids):
+        raise HTTPException(status_code=404, detail="Command not found")
+    if any(db_command.user_id != current_user.user_id for db_command in db_commands):
+        raise HTTPException(status_code=403, detail="Not authorized to access this command")
+
+    db_jobs = await crud_job.get_by_job_ids(db, job_ids=jobs) if jobs else []
+    if len(db_jobs) != len(jobs):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    device_ids = set(devices) | {db_job.device_id for db_job in db_jobs}
+    db_devices = await crud_device.get_by_ids(db, device_ids=list(device_ids)) if device_ids else []
+    if len(db_devices) != len(device_ids):
+        raise HTTPException(status_code=404, detail="Device not found")
+    for db_device in db_devices:
+        await check_device_access(current_user, db_device, action="view events of")
+
+    topics = (
+        [f"command:{db_command.message_id}" for db_command in db_commands]
+        + [f"job:{job_id}" for job_id in jobs]
+        + [f"device:{device_id}" for device_id in devices]
+    )
+
+    initial_events = []
+    resumed = last_event_id is not None and any(event[0] == last_event_id for event in stream_replay_buffer)
+    if not resumed:
+        for db_command in db_commands:
+            initial_events.append(("command", {
+                "message_id": str(db_command.message_id),
+                "device_id": str(db_command.device_id),
+                "status": db_command.status.value,
+                "sent_at": db_command.sent_at.isoformat() if db_command.sent_at else None,
+                "completed_at": db_command.completed_at.isoformat() if db_command.completed_at else None,
+                "response_payload": db_command.response_payload,
+                "error_message": db_command.error_message,
+            }))
+        for db_job in db_jobs:
+            final = db_job.status in [JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.TIMED_OUT, JobStatus.CANCELED, JobStatus.ARCHIVED]
+            initial_events.append(("job", {
+                "job_id": db_job.job_id,
+                "device_id": str(db_job.device_id),
+                "status": db_job.status.value,
+                "created_at": db_job.created_at.isoformat() if db_job.created_at else None,
+                "completed_at": db_job.completed_at.isoformat() if db_job.completed_at else None,
+                "status_details": db_job.status_details,
+                "error_message": db_job.error_message,
+                "progress_percentage": 100 if final else 0 if db_job.status == JobStatus.QUEUED else 50,
+            }))
+
+    # Subscribing and collecting the missed events without awaiting in between means every
+    # event is sent exactly once, from the replay buffer or from the queue
+    connection_queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    for topic in topics:
+        active_stream_connections.setdefault(topic, set()).add(connection_queue)
+    missed_events = _replay_events(last_event_id if resumed else replay_mark, set(topics))
+
+    async def event_stream():
+        try:
+            for event_type, data in initial_events:
+                yield _format_event(event_type, data)
+            for event_id, event_type, data in missed_events:
+                yield _format_event(event_type, data, event_id)
+
+            # Clients reconnect after the timeout, like the job streams
+            timeout_time = datetime.now(ZoneInfo("Asia/Tokyo")) + timedelta(minutes=30)
+
+            while datetime.now(ZoneInfo("Asia/Tokyo")) < timeout_time:
+                try:
+                    event_id, event_type, data = await asyncio.wait_for(connection_queue.get(), timeout=30.0)
+                    yield _format_event(event_type, data, event_id)
+                except asyncio.TimeoutError:
+                    # A comment line keeps the connection open without reaching the client's handlers
+                    yield ": heartbeat\n\n"
+
+        except Exception as e:
+            logger.error(f"Error in multiplexed SSE stream of user {current_user.user_id}: {str(e)}")
+        finally:
+            for topic in topics:
+                _discard_connection(active_stream_connections, topic, connection_queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "Connection": "keep-alive"},
+    )
+
+
+def _deliver_stream_event(event_id: str, event_type: str, topic_data: Dict[str, Dict[str, Any]]):
+    """
+    Hands an event to the multiplexed streams subscribed to any of its topics, and keeps it for
+    replays. topic_data holds the data shown on each topic; a stream subscribed to several of
+    them gets the event once, with the data of the first one.
+    """
+    stream_replay_buffer.append((event_id, event_type, topic_data))
+    connection_data: Dict[asyncio.Queue, Dict[str, Any]] = {}
+    for topic, data in topic_data.items():
+        for connection_queue in active_stream_connections.get(topic, ()):
+            connection_data.setdefault(connection_queue, data)
+    for connection_queue, data in connection_data.items():
+        try:
+            connection_queue.put_nowait((event_id, event_type, data))
+        except asyncio.QueueFull:
+            logger.warning(f"Dropped {event_type} event {event_id} for a slow multiplexed SSE client")
+
+
+def _replay_events(after_event_id: Optional[str], topics: Set[str]) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """
+    Returns the buffered events on any of the topics that came after after_event_id, or all of
+    them when it is None or no longer buffered.
+    """
+    events = list(stream_replay_buffer)
+    start = 0
+    for index, (event_id, _, _) in enumerate(events):
+        if event_id == after_event_id:
+            start = index + 1
+            break
+    replayed = []
+    for event_id, event_type, topic_data in events[start:]:
+        data = next((data for topic, data in topic_data.items() if topic in topics), None)
+        if data is not None:
+            replayed.append((event_id, event_type, data))
+    return replayed
+
+event_broker.subscribe(COMMAND_UPDATES_CHANNEL, _deliver_command_update)
+event_broker.subscribe(JOB_UPDATES_CHANNEL, _deliver_job_update)
+event_broker.subscribe(THRESHOLD_CROSSINGS_CHANNEL, _deliver_threshold_crossing)
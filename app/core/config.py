@@ -48,10 +48,67 @@ class Settings(BaseSettings):
     THROTTLE_MAX_CONCURRENT_REQUESTS: int = 50  # Adjust as needed
     THROTTLE_ACQUIRE_TIMEOUT_SECONDS: int = 10  # How long a request waits for a slot
 
+    # City Eye analytics
+    ANALYTICS_MAX_TIME_SERIES_POINTS: int = 1000  # Time series buckets are coarsened beyond this many points
+
+    # City Eye analytics result cache
+    ANALYTICS_CACHE_ENABLED: bool = True
+    ANALYTICS_CACHE_BACKEND: str = "memory"  # "memory" (per worker) or "redis" (shared by all workers)
+    ANALYTICS_CACHE_REDIS_URL: Optional[str] = None
+    ANALYTICS_CACHE_MAX_ENTRIES: int = 1024  # LRU bound of the in-memory backend
+    ANALYTICS_CACHE_LIVE_TTL_SECONDS: int = 60  # Ranges reaching into the last hour
+    ANALYTICS_CACHE_HISTORICAL_TTL_SECONDS: int = 86400  # Fully historical ranges
+    XLINES_CONFIG_CACHE_TTL_SECONDS: int = 300  # Polygon geometry read from XLinesConfigShadow
+    XLINES_CONFIG_CACHE_MISS_TTL_SECONDS: int = 30  # Missing or unreadable shadows
+    XLINES_CONFIG_MAX_CONCURRENT_READS: int = 5  # Shadow reads run at once by one direction analytics request
+
+    # City Eye raw data partitions (PostgreSQL only)
+    CITY_EYE_PARTITION_MAINTENANCE_ENABLED: bool = True  # Run partition maintenance in the background of each worker
+    CITY_EYE_PARTITION_MONTHS_AHEAD: int = 3  # Monthly partitions are created this far beyond the current month
+    CITY_EYE_RETENTION_MONTHS: Optional[int] = None  # Raw partitions older than this are dropped; None = keep forever
+    CITY_EYE_PARTITION_MAINTENANCE_INTERVAL_SECONDS: int = 86400
+
+    # City Eye bulk ingestion
+    CITY_EYE_INGEST_MAX_BATCH_ROWS: int = 50000
+    CITY_EYE_INGEST_MAX_BODY_BYTES: int = 32 * 1024 * 1024
+    CITY_EYE_INGEST_MAX_BUFFERED_ROWS: int = 200000  # Rows held per worker before batches get 429
+    CITY_EYE_INGEST_RETRY_AFTER_SECONDS: int = 5
+    CITY_EYE_INGEST_MAX_PAST_DAYS: int = 730  # Rows timestamped further in the past are rejected
+    CITY_EYE_INGEST_MAX_FUTURE_MINUTES: int = 60  # Rows timestamped further ahead (device clock skew) are rejected
+
+    # City Eye raw data export
+    CITY_EYE_EXPORT_CHUNK_ROWS: int = 10000  # Rows fetched from the server-side cursor and encoded per chunk
+
+    # City Eye threshold evaluation (customer human/traffic count thresholds per hourly bucket)
+    CITY_EYE_THRESHOLD_EVALUATOR_ENABLED: bool = True  # Evaluate thresholds in the background of each worker
+    CITY_EYE_THRESHOLD_EVALUATION_INTERVAL_SECONDS: int = 300
+    CITY_EYE_THRESHOLD_SETTLE_SECONDS: int = 300  # Hour buckets are evaluated this long after they end, so late uploads count
+    CITY_EYE_THRESHOLD_MAX_CATCHUP_HOURS: int = 24  # After downtime, older unevaluated buckets are skipped
+
+    # Fan-out of SSE updates to the workers holding the client connections
+    EVENT_BROKER_BACKEND: str = "postgres"  # "postgres" (LISTEN/NOTIFY, all workers) or "memory" (this worker only)
+    EVENT_BROKER_MAX_PENDING: int = 1000  # Events kept per worker while its broker connection is down
+    EVENT_BROKER_RECONNECT_SECONDS: float = 5
+
+    # Reconciliation of unfinished IoT job statuses with AWS, pushed to the job SSE streams
+    JOB_RECONCILER_ENABLED: bool = True  # Poll AWS in the background of each worker
+    JOB_RECONCILER_INTERVAL_SECONDS: int = 30
+    JOB_RECONCILER_MAX_CONCURRENT_REQUESTS: int = 4  # AWS IoT requests in flight per worker
+    JOB_RECONCILER_REQUESTS_PER_SECOND: float = 10  # Keeps clear of the AWS IoT Jobs API throttling
+
     # InfluxDB Settings
     INFLUXDB_HOST: Optional[str] = None
     INFLUXDB_TOKEN: Optional[str] = None
     INFLUXDB_DATABASE: Optional[str] = None
+    INFLUXDB_MAX_CONCURRENT_QUERIES: int = 4  # Threads running InfluxDB queries per worker
+    INFLUXDB_QUERY_TIMEOUT_SECONDS: float = 30  # Includes the wait for a free query thread
+
+    # Device metrics (InfluxDB) downsampling and cache; the cache uses ANALYTICS_CACHE_BACKEND
+    DEVICE_METRICS_MAX_POINTS: int = 1000  # Intervals are coarsened beyond this many points per series
+    DEVICE_METRICS_CACHE_ENABLED: bool = True
+    DEVICE_METRICS_CACHE_MAX_ENTRIES: int = 4096  # LRU bound of the in-memory backend; one entry per device, family and block
+    DEVICE_METRICS_CACHE_TTL_SECONDS: int = 86400
+    DEVICE_METRICS_CACHE_SETTLE_SECONDS: int = 300  # Blocks are cached this long after they end, so late writes count
 
     class Config:
         env_file = ".env"
@@ -6,6 +6,8 @@ from app.crud.solution import solution
 from app.crud.customer_solution import customer_solution
 from app.crud.device_solution import device_solution
 from app.crud.crud_city_eye_analytics import crud_city_eye_analytics
+from app.crud.crud_city_eye_ingest import crud_city_eye_ingest
+from app.crud.crud_city_eye_thresholds import crud_city_eye_thresholds
 from app.crud.device_command import device_command
 from app.crud.audit_log import audit_log
 from app.crud.password_reset_token import password_reset_token
@@ -31,7 +31,22 @@ class CRUDAuditLog(CRUDBase[AuditLog, AuditLogCreate, None]):
         await db.commit()
         await db.refresh(db_obj)
         return db_obj
-    
+
+    def add_many(self, db: AsyncSession, *, objs_in: List[AuditLogCreate]) -> None:
+        """Add audit log entries to the session without committing, so they are written in the caller's transaction"""
+        db.add_all([
+            AuditLog(
+                user_id=obj_in.user_id,
+                action_type=obj_in.action_type,
+                resource_type=obj_in.resource_type,
+                resource_id=obj_in.resource_id,
+                details=obj_in.details,
+                ip_address=obj_in.ip_address,
+                user_agent=obj_in.user_agent
+            )
+            for obj_in in objs_in
+        ])
+
     async def get_logs_with_filters(
         self, 
         db: AsyncSession, 
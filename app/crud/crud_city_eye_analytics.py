@@ -1,13 +1,51 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable, Tuple, Sequence, AsyncIterator
+import math
 import uuid
+from functools import reduce
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import func, and_, or_, select
+from sqlalchemy import func, select, tuple_, union_all, cast, literal, case, true, Integer, Interval, DateTime, String
+from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql.expression import literal_column, ColumnElement
 from app.models.services.city_eye.human_table import CityEyeHumanTable
 from app.models.services.city_eye.traffic_table import CityEyeTrafficTable
+from app.models.services.city_eye.human_hourly_table import CityEyeHumanHourlyTable
+from app.models.services.city_eye.human_daily_table import CityEyeHumanDailyTable
+from app.models.services.city_eye.traffic_hourly_table import CityEyeTrafficHourlyTable
+from app.models.services.city_eye.traffic_daily_table import CityEyeTrafficDailyTable
+from app.models.services.city_eye.provisioned_human_table import CityEyeProvisionedHumanTable
+from app.models.services.city_eye.provisioned_traffic_table import CityEyeProvisionedTrafficTable
 from app.models import CustomerSolution
+from app.core.config import settings
+from app.utils.analytics_cache import cached_analytics
+from app.utils.analytics_filters import compile_filters
 from app.schemas.services.city_eye_analytics import AnalyticsFilters, TrafficAnalyticsFilters, DirectionAnalyticsFilters, TrafficDirectionAnalyticsFilters
-from datetime import datetime, time as dt_time
+from datetime import datetime, timedelta, timezone
+
+# Human flow metrics that are all derived from the per-device (device_id) grouping set
+HUMAN_TOTAL_METRICS = ("total_count", "age_distribution", "gender_distribution", "age_gender_distribution")
+# Traffic flow metrics that are derived from the per-device vehicle sums
+TRAFFIC_TOTAL_METRICS = ("total_count", "vehicle_type_distribution")
+VEHICLE_TYPES = ("large", "normal", "bicycle", "motorcycle")
+
+# Raw tables of each table family, selected by the filters' `source`. Both families share column
+# names, so every query below works on either of them.
+TABLE_FAMILIES = {
+    "live": {"human": CityEyeHumanTable, "traffic": CityEyeTrafficTable},
+    "provisioned": {"human": CityEyeProvisionedHumanTable, "traffic": CityEyeProvisionedTrafficTable},
+}
+
+# Rollup tables for each raw table, coarsest first. They are kept in sync by database triggers
+# and share the raw tables' device/polygon/timestamp and count column names.
+ROLLUP_TIERS = {
+    CityEyeHumanTable: (("day", CityEyeHumanDailyTable), ("hour", CityEyeHumanHourlyTable)),
+    CityEyeTrafficTable: (("day", CityEyeTrafficDailyTable), ("hour", CityEyeTrafficHourlyTable)),
+}
+ROLLUP_UNIT_MINUTES = {"day": 24 * 60, "hour": 60}
+
+# Bucket sizes (minutes) that time series are coarsened to when the requested one yields too many points
+TIME_SERIES_INTERVALS_MINUTES = (5, 15, 30, 60, 3 * 60, 6 * 60, 12 * 60, 24 * 60, 7 * 24 * 60)
+# Monday midnight, so day buckets start at midnight and week buckets on Mondays
+TIME_BUCKET_ORIGIN = datetime(2000, 1, 3)
 
 class CRUDCityEyeAnalytics:
 
@@ -15,30 +53,30 @@ class CRUDCityEyeAnalytics:
     # HUMAN ANALYTICS METHODS
     # =============================================================================
 
-    def _get_people_columns_map(self) -> Dict[tuple, Any]:
+    def _get_people_columns_map(self, table=CityEyeHumanTable) -> Dict[tuple, Any]:
         """
         Returns the mapping of (gender, age_group) tuples to database columns.
         Extracted to follow DRY principle.
         """
         return {
-            ("male", "under_18"): CityEyeHumanTable.male_less_than_18,
-            ("female", "under_18"): CityEyeHumanTable.female_less_than_18,
-            ("male", "18_to_29"): CityEyeHumanTable.male_18_to_29,
-            ("female", "18_to_29"): CityEyeHumanTable.female_18_to_29,
-            ("male", "30_to_49"): CityEyeHumanTable.male_30_to_49,
-            ("female", "30_to_49"): CityEyeHumanTable.female_30_to_49,
-            ("male", "50_to_64"): CityEyeHumanTable.male_50_to_64,
-            ("female", "50_to_64"): CityEyeHumanTable.female_50_to_64,
-            ("male", "over_64"): CityEyeHumanTable.male_65_plus,
-            ("female", "over_64"): CityEyeHumanTable.female_65_plus,
+            ("male", "under_18"): table.male_less_than_18,
+            ("female", "under_18"): table.female_less_than_18,
+            ("male", "18_to_29"): table.male_18_to_29,
+            ("female", "18_to_29"): table.female_18_to_29,
+            ("male", "30_to_49"): table.male_30_to_49,
+            ("female", "30_to_49"): table.female_30_to_49,
+            ("male", "50_to_64"): table.male_50_to_64,
+            ("female", "50_to_64"): table.female_50_to_64,
+            ("male", "over_64"): table.male_65_plus,
+            ("female", "over_64"): table.female_65_plus,
         }
 
-    def _get_people_sum_expression(self, filters: AnalyticsFilters) -> ColumnElement:
+    def _get_people_sum_expression(self, filters: AnalyticsFilters, table=CityEyeHumanTable) -> ColumnElement:
         """
         Dynamically creates a SQLAlchemy sum expression based on gender and age_group filters.
         """
         
-        people_columns_map = self._get_people_columns_map()
+        people_columns_map = self._get_people_columns_map(table)
 
         selected_columns = []
 
@@ -63,158 +101,30 @@ class CRUDCityEyeAnalytics:
         
         return sum_expression
 
-    def _apply_filters(self, query, filters: AnalyticsFilters, is_aggregation_query: bool = False):
-        # Row-level filters (timestamps, devices, polygons)
-        if filters.device_ids:
-            query = query.filter(CityEyeHumanTable.device_id.in_(filters.device_ids))
-        if filters.start_time:
-            query = query.filter(CityEyeHumanTable.timestamp >= filters.start_time)
-        if filters.end_time:
-            # Add 1 hour to end_time to make it inclusive of the last hour
-            inclusive_end_time = filters.end_time # + timedelta(hours=1)
-            query = query.filter(CityEyeHumanTable.timestamp < inclusive_end_time)
-        if filters.polygon_ids_in:
-            query = query.filter(CityEyeHumanTable.polygon_id_in.in_(filters.polygon_ids_in))
-        if filters.polygon_ids_out:
-            query = query.filter(CityEyeHumanTable.polygon_id_out.in_(filters.polygon_ids_out))
-
-        # Day of the week filtering
-        if filters.days:
-            # Convert day names to DOW numbers (0=Sunday, 1=Monday, ..., 6=Saturday for PostgreSQL EXTRACT(DOW ...))
-            # Python's weekday() is 0=Monday, ..., 6=Sunday. So we need to map.
-            day_mapping = {
-                "sunday": 0, "monday": 1, "tuesday": 2, "wednesday": 3,
-                "thursday": 4, "friday": 5, "saturday": 6
-            }
-            dow_numbers = [day_mapping[day.lower()] for day in filters.days if day.lower() in day_mapping]
-            if dow_numbers:
-                query = query.filter(func.extract('dow', CityEyeHumanTable.timestamp).in_(dow_numbers))
-        if filters.hours:
-            # Expecting hours like "10:00", "23:00". We only need the hour part.
-            hour_numbers = []
-            for hour_str in filters.hours:
-                try:
-                    hour_part = int(hour_str.split(':')[0])
-                    hour_numbers.append(hour_part)
-                except ValueError:
-                    # Handle cases where hour_str might not be in "HH:MM" format or is invalid
-                    pass # Or log a warning
-            
-            if hour_numbers: # Only apply filter if valid hours were parsed
-                query = query.filter(func.extract('hour', CityEyeHumanTable.timestamp).in_(hour_numbers))
-
-        return query
-    
-    def _apply_direction_filters(self, query, filters: DirectionAnalyticsFilters, is_aggregation_query: bool = False):
-        """Apply filters for direction analytics with date array support"""
-        # Row-level filters (devices, polygons)
-        if filters.device_ids:
-            query = query.filter(CityEyeHumanTable.device_id.in_(filters.device_ids))
-        
-        # Date filtering - create OR conditions for each date
-        if filters.dates:
-            date_conditions = []
-            for single_date in filters.dates:
-                # Convert date to datetime range (start of day to end of day)
-                start_of_day = datetime.combine(single_date, dt_time.min)
-                end_of_day = datetime.combine(single_date, dt_time.max)
-                date_conditions.append(
-                    and_(
-                        CityEyeHumanTable.timestamp >= start_of_day,
-                        CityEyeHumanTable.timestamp <= end_of_day
-                    )
-                )
-            
-            # Apply OR condition for all dates
-            query = query.filter(or_(*date_conditions))
-        
-        # Day of the week filtering
-        if filters.days:
-            day_mapping = {
-                "sunday": 0, "monday": 1, "tuesday": 2, "wednesday": 3,
-                "thursday": 4, "friday": 5, "saturday": 6
-            }
-            dow_numbers = [day_mapping[day.lower()] for day in filters.days if day.lower() in day_mapping]
-            if dow_numbers:
-                query = query.filter(func.extract('dow', CityEyeHumanTable.timestamp).in_(dow_numbers))
-        
-        # Hour filtering
-        if filters.hours:
-            hour_numbers = []
-            for hour_str in filters.hours:
-                try:
-                    hour_part = int(hour_str.split(':')[0])
-                    hour_numbers.append(hour_part)
-                except ValueError:
-                    pass
-            
-            if hour_numbers:
-                query = query.filter(func.extract('hour', CityEyeHumanTable.timestamp).in_(hour_numbers))
-        
-        return query
-
-    def _apply_traffic_direction_filters(self, query, filters: TrafficDirectionAnalyticsFilters, is_aggregation_query: bool = False):
-        """Apply filters for traffic direction analytics with date array support"""
-        # Row-level filters (devices, polygons)
-        if filters.device_ids:
-            query = query.filter(CityEyeTrafficTable.device_id.in_(filters.device_ids))
-        
-        # Date filtering - create OR conditions for each date
-        if filters.dates:
-            date_conditions = []
-            for single_date in filters.dates:
-                # Convert date to datetime range (start of day to end of day)
-                start_of_day = datetime.combine(single_date, dt_time.min)
-                end_of_day = datetime.combine(single_date, dt_time.max)
-                
-                date_conditions.append(
-                    and_(
-                        CityEyeTrafficTable.timestamp >= start_of_day,
-                        CityEyeTrafficTable.timestamp <= end_of_day
-                    )
-                )
-            
-            # Apply OR condition for all dates
-            query = query.filter(or_(*date_conditions))
-        
-        # Day of the week filtering
-        if filters.days:
-            day_mapping = {
-                "sunday": 0, "monday": 1, "tuesday": 2, "wednesday": 3,
-                "thursday": 4, "friday": 5, "saturday": 6
-            }
-            dow_numbers = [day_mapping[day.lower()] for day in filters.days if day.lower() in day_mapping]
-            if dow_numbers:
-                query = query.filter(func.extract('dow', CityEyeTrafficTable.timestamp).in_(dow_numbers))
-        
-        # Hour filtering
-        if filters.hours:
-            hour_numbers = []
-            for hour_str in filters.hours:
-                try:
-                    hour_part = int(hour_str.split(':')[0])
-                    hour_numbers.append(hour_part)
-                except ValueError:
-                    pass
-            
-            if hour_numbers:
-                query = query.filter(func.extract('hour', CityEyeTrafficTable.timestamp).in_(hour_numbers))
-        
-        return query
+    def _apply_filters(self, query, filters, is_aggregation_query: bool = False, table=CityEyeHumanTable):
+        """
+        Applies the row-level filters (devices, time range or dates, polygons, days, hours) of any
+        analytics filter schema, or of an already compiled one (see compile_filters), to `query`.
+        """
+        return compile_filters(filters).apply(query, table)
 
 
+    @cached_analytics("get_total_count")
     async def get_total_count(self, db: AsyncSession, *, filters: AnalyticsFilters) -> int:
-        sum_expr = self._get_people_sum_expression(filters)
+        source = self._get_source_table(db, self._get_raw_table(filters, "human"), filters, resolution_minutes=None)
+        sum_expr = self._get_people_sum_expression(filters, source)
         query = select(func.sum(sum_expr).label("total_people"))
 
         # Apply row-level filters (time, device, polygon, day, hour)
-        query = self._apply_filters(query, filters, is_aggregation_query=True)
+        query = self._apply_filters(query, filters, is_aggregation_query=True, table=source)
         result = await db.execute(query)
         return result.scalar() or 0
 
+    @cached_analytics("get_age_distribution")
     async def get_age_distribution(self, db: AsyncSession, *, filters: AnalyticsFilters) -> Dict[str, int]:
         # Get columns map for reuse
-        people_columns_map = self._get_people_columns_map()
+        source = self._get_source_table(db, self._get_raw_table(filters, "human"), filters, resolution_minutes=None)
+        people_columns_map = self._get_people_columns_map(source)
         
         # Determine which genders to include (respect gender filter)
         genders_to_sum = filters.genders if filters.genders else ["male", "female"]
@@ -247,7 +157,7 @@ class CRUDCityEyeAnalytics:
             }
         
         query = select(*sum_expressions.values())
-        query = self._apply_filters(query, filters)
+        query = self._apply_filters(query, filters, table=source)
         result = await db.execute(query)
         result = result.first()
         
@@ -262,9 +172,11 @@ class CRUDCityEyeAnalytics:
         
         return output
 
+    @cached_analytics("get_gender_distribution")
     async def get_gender_distribution(self, db: AsyncSession, *, filters: AnalyticsFilters) -> Dict[str, int]:
         # Get columns map for reuse
-        people_columns_map = self._get_people_columns_map()
+        source = self._get_source_table(db, self._get_raw_table(filters, "human"), filters, resolution_minutes=None)
+        people_columns_map = self._get_people_columns_map(source)
         
         # Determine which genders to include (respect gender filter)
         genders_to_sum = filters.genders if filters.genders else ["male", "female"]
@@ -293,7 +205,7 @@ class CRUDCityEyeAnalytics:
             return {"male": 0, "female": 0}
         
         query = select(*sum_expressions.values())
-        query = self._apply_filters(query, filters)
+        query = self._apply_filters(query, filters, table=source)
         result = await db.execute(query)
         result = result.first()
         
@@ -306,9 +218,11 @@ class CRUDCityEyeAnalytics:
         
         return output
 
+    @cached_analytics("get_age_gender_distribution")
     async def get_age_gender_distribution(self, db: AsyncSession, *, filters: AnalyticsFilters) -> Dict[str, int]:
         # Get columns map for reuse
-        people_columns_map = self._get_people_columns_map()
+        source = self._get_source_table(db, self._get_raw_table(filters, "human"), filters, resolution_minutes=None)
+        people_columns_map = self._get_people_columns_map(source)
         
         # Determine which genders and age groups to include
         genders_to_sum = filters.genders if filters.genders else ["male", "female"]
@@ -346,7 +260,7 @@ class CRUDCityEyeAnalytics:
             }
         
         query = select(*sum_expressions.values())
-        query = self._apply_filters(query, filters)
+        query = self._apply_filters(query, filters, table=source)
         result = await db.execute(query)
         result = result.first()
         
@@ -363,57 +277,478 @@ class CRUDCityEyeAnalytics:
         
         return output
 
+    @cached_analytics("get_hourly_distribution")
     async def get_hourly_distribution(self, db: AsyncSession, *, filters: AnalyticsFilters) -> List[Dict[str, Any]]:
-        hour_part = func.extract('hour', CityEyeHumanTable.timestamp).label("hour")
-        sum_expr = self._get_people_sum_expression(filters)
+        source = self._get_source_table(db, self._get_raw_table(filters, "human"), filters, resolution_minutes=60)
+        hour_part = source.hour_of_day.label("hour")
+        sum_expr = self._get_people_sum_expression(filters, source)
         query = select(
             hour_part,
             func.sum(sum_expr).label("count")
         )
         # Apply row-level filters (time, device, polygon, day, hour already applied in _apply_filters)
-        query = self._apply_filters(query, filters, is_aggregation_query=True)
+        query = self._apply_filters(query, filters, is_aggregation_query=True, table=source)
         query = query.group_by(hour_part).order_by(hour_part)
 
         results = await db.execute(query)
         results = results.all()
         return [{"hour": int(r.hour), "count": r.count or 0} for r in results]
 
+    @cached_analytics("get_time_series_data")
     async def get_time_series_data(self, db: AsyncSession, *, filters: AnalyticsFilters, interval_minutes: int = 60) -> List[Dict[str, Any]]:
-        sum_expr = self._get_people_sum_expression(filters)
-
-        if db.bind.dialect.name == 'sqlite': # type: ignore
-            # SQLite does not have date_trunc, approximate by formatting
-            time_bucket = func.strftime('%Y-%m-%d %H:00:00', CityEyeHumanTable.timestamp).label("time_bucket")
-        else: # For PostgreSQL
-            # This truncates to the hour. For other intervals, this would need to be more complex.
-            time_bucket = func.date_trunc('hour', CityEyeHumanTable.timestamp).label("time_bucket")
+        source = self._get_source_table(db, self._get_raw_table(filters, "human"), filters, resolution_minutes=interval_minutes)
+        sum_expr = self._get_people_sum_expression(filters, source)
+        time_bucket = self._get_time_bucket_expression(db, source.timestamp, interval_minutes).label("time_bucket")
 
         query = select(
             time_bucket,
             func.sum(sum_expr).label("count")
         )
         # Apply row-level filters (time, device, polygon, day, hour already applied in _apply_filters)
-        query = self._apply_filters(query, filters, is_aggregation_query=True)
+        query = self._apply_filters(query, filters, is_aggregation_query=True, table=source)
         query = query.group_by(time_bucket).order_by(time_bucket)
 
         results = await db.execute(query)
         results = results.all()
         return [{"timestamp": r.time_bucket, "count": r.count or 0} for r in results]
 
+    def _get_selected_people_keys(self, filters: AnalyticsFilters) -> set:
+        """
+        Returns the (gender, age_group) pairs selected by the gender and age_group filters.
+        """
+        genders_to_sum = [g.lower() for g in filters.genders] if filters.genders else ["male", "female"]
+        age_groups_to_sum = [a.lower() for a in filters.age_groups] if filters.age_groups else ["under_18", "18_to_29", "30_to_49", "50_to_64", "over_64"]
+        return {(gender, age_group) for gender in genders_to_sum for age_group in age_groups_to_sum}
+
+    def _build_human_metrics(self, sums: Dict[str, int], filters: AnalyticsFilters, metrics: set) -> Dict[str, Any]:
+        """
+        Derives total, age, gender and age x gender metrics from the ten demographic sums of one device.
+        Output keys match get_total_count / get_age_distribution / get_gender_distribution /
+        get_age_gender_distribution.
+        """
+        people_columns_map = self._get_people_columns_map()
+        selected_keys = self._get_selected_people_keys(filters)
+
+        total_count = 0
+        age_distribution = {"under_18": 0, "age_18_to_29": 0, "age_30_to_49": 0, "age_50_to_64": 0, "over_64": 0}
+        gender_distribution = {"male": 0, "female": 0}
+        age_gender_distribution = {
+            "male_under_18": 0, "female_under_18": 0, "male_18_to_29": 0, "female_18_to_29": 0,
+            "male_30_to_49": 0, "female_30_to_49": 0, "male_50_to_64": 0, "female_50_to_64": 0,
+            "male_65_plus": 0, "female_65_plus": 0
+        }
+
+        for (gender, age_group), column in people_columns_map.items():
+            if (gender, age_group) not in selected_keys:
+                continue
+            value = sums.get(column.key) or 0
+            total_count += value
+
+            age_key = f"age_{age_group}" if age_group not in ("under_18", "over_64") else age_group
+            age_distribution[age_key] += value
+            gender_distribution[gender] += value
+
+            age_gender_key = f"{gender}_65_plus" if age_group == "over_64" else f"{gender}_{age_group}"
+            age_gender_distribution[age_gender_key] += value
+
+        output = {
+            "total_count": total_count,
+            "age_distribution": age_distribution,
+            "gender_distribution": gender_distribution,
+            "age_gender_distribution": age_gender_distribution,
+        }
+        return {key: value for key, value in output.items() if key in metrics}
+
+    @cached_analytics("get_human_flow_metrics")
+    async def get_human_flow_metrics(
+        self,
+        db: AsyncSession,
+        *,
+        filters: AnalyticsFilters,
+        metrics: Iterable[str],
+        interval_minutes: int = 60,
+        device_groups: Optional[Dict[uuid.UUID, str]] = None,
+    ) -> Dict[Any, Dict[str, Any]]:
+        """
+        Computes the requested human flow metrics for every device in filters.device_ids
+        with a single scan of the human table selected by filters.source (or its rollups, see
+        _get_source_table).
+
+        `metrics` holds PerDeviceAnalyticsData field names and `interval_minutes` the time series
+        bucket size. Returns a dict keyed by device_id whose values hold the same structures as the
+        individual get_* methods. With `device_groups` ({device_id: group key}) the devices of each
+        group are summed together in SQL and the dict is keyed by group key instead.
+        """
+        return await self._get_flow_metrics(
+            db, kind="human", filters=filters, metrics=metrics,
+            interval_minutes=interval_minutes, device_groups=device_groups,
+        )
+
+    @cached_analytics("get_traffic_flow_metrics")
+    async def get_traffic_flow_metrics(
+        self,
+        db: AsyncSession,
+        *,
+        filters: TrafficAnalyticsFilters,
+        metrics: Iterable[str],
+        interval_minutes: int = 60,
+        device_groups: Optional[Dict[uuid.UUID, str]] = None,
+    ) -> Dict[Any, Dict[str, Any]]:
+        """
+        Traffic counterpart of get_human_flow_metrics (metrics are PerDeviceTrafficAnalyticsData
+        field names).
+        """
+        return await self._get_flow_metrics(
+            db, kind="traffic", filters=filters, metrics=metrics,
+            interval_minutes=interval_minutes, device_groups=device_groups,
+        )
+
+    async def _get_flow_metrics(
+        self,
+        db: AsyncSession,
+        *,
+        kind: str,
+        filters,
+        metrics: Iterable[str],
+        interval_minutes: int,
+        device_groups: Optional[Dict[uuid.UUID, str]],
+    ) -> Dict[Any, Dict[str, Any]]:
+        metrics = set(metrics)
+        device_ids = list(filters.device_ids or [])
+        if kind == "human":
+            build_metrics, total_metrics = self._build_human_metrics, HUMAN_TOTAL_METRICS
+        else:
+            build_metrics, total_metrics = self._build_traffic_metrics, TRAFFIC_TOTAL_METRICS
+
+        if device_groups is not None:
+            device_ids = [device_id for device_id in device_ids if device_id in device_groups]
+            keys = sorted(set(device_groups[device_id] for device_id in device_ids))
+        else:
+            keys = device_ids
+
+        results: Dict[Any, Dict[str, Any]] = {}
+        for key in keys:
+            key_metrics = build_metrics({}, filters, metrics)
+            if "hourly_distribution" in metrics:
+                key_metrics["hourly_distribution"] = []
+            if "time_series_data" in metrics:
+                key_metrics["time_series_data"] = []
+            results[key] = key_metrics
+
+        include_totals = bool(metrics.intersection(total_metrics))
+        include_hourly = "hourly_distribution" in metrics
+        include_time_series = "time_series_data" in metrics
+        if not device_ids or not (include_totals or include_hourly or include_time_series):
+            return results
+
+        resolutions = ([60] if include_hourly else []) + ([interval_minutes] if include_time_series else [])
+        resolution_minutes = reduce(math.gcd, resolutions) if resolutions else None
+        source = self._get_source_table(db, self._get_raw_table(filters, kind), filters, resolution_minutes=resolution_minutes)
+        if kind == "human":
+            people_columns_map = self._get_people_columns_map(source)
+            columns = list(people_columns_map.values())
+            selected_column_keys = [
+                column.key for key, column in people_columns_map.items() if key in self._get_selected_people_keys(filters)
+            ]
+        else:
+            columns = [getattr(source, vehicle_type) for vehicle_type in VEHICLE_TYPES]
+            selected_types = [vt.lower() for vt in filters.vehicle_types] if filters.vehicle_types else VEHICLE_TYPES
+            selected_column_keys = [vehicle_type for vehicle_type in VEHICLE_TYPES if vehicle_type in selected_types]
+        # Compiled once, the filter callback runs once per grouping set on SQLite
+        compiled_filters = compile_filters(filters)
+
+        rows = await self._get_grouped_sums(
+            db,
+            table=source,
+            columns=columns,
+            apply_filters=lambda query: self._apply_filters(query, compiled_filters, is_aggregation_query=True, table=source),
+            include_totals=include_totals,
+            include_hourly=include_hourly,
+            include_time_series=include_time_series,
+            interval_minutes=interval_minutes,
+            device_groups={device_id: device_groups[device_id] for device_id in device_ids} if device_groups is not None else None,
+        )
+
+        hourly_rows: Dict[Any, List[Dict[str, Any]]] = {key: [] for key in keys}
+        time_series_rows: Dict[Any, List[Dict[str, Any]]] = {key: [] for key in keys}
+
+        for row in rows:
+            key = row["device_id"]
+            if key not in results:
+                continue
+            count = sum(row[column_key] or 0 for column_key in selected_column_keys)
+
+            if row["hour"] is not None:
+                hourly_rows[key].append({"hour": int(row["hour"]), "count": count})
+            elif row["time_bucket"] is not None:
+                time_series_rows[key].append({"timestamp": row["time_bucket"], "count": count})
+            else:
+                results[key].update(build_metrics(row, filters, metrics))
+
+        for key in keys:
+            if include_hourly:
+                results[key]["hourly_distribution"] = sorted(hourly_rows[key], key=lambda r: r["hour"])
+            if include_time_series:
+                results[key]["time_series_data"] = sorted(time_series_rows[key], key=lambda r: r["timestamp"])
+
+        return results
+
+    # =============================================================================
+    # SHARED AGGREGATION HELPERS
+    # =============================================================================
+
+    def _get_time_bucket_expression(self, db: AsyncSession, timestamp_column, interval_minutes: int = 60) -> ColumnElement:
+        """
+        Bins timestamps into `interval_minutes` wide buckets aligned to TIME_BUCKET_ORIGIN.
+        The same expression object must be used in SELECT and GROUP BY so its bound parameters match.
+        """
+        if db.bind.dialect.name == 'sqlite': # type: ignore
+            # SQLite does not have date_bin, bin the unix epoch instead
+            interval_seconds = interval_minutes * 60
+            origin = int(TIME_BUCKET_ORIGIN.replace(tzinfo=timezone.utc).timestamp())
+            epoch = cast(func.strftime('%s', timestamp_column), Integer)
+            return func.datetime((epoch - origin) // interval_seconds * interval_seconds + origin, 'unixepoch')
+        return func.date_bin(
+            literal(timedelta(minutes=interval_minutes), Interval),
+            timestamp_column,
+            literal(TIME_BUCKET_ORIGIN, DateTime),
+        )
+
+    def get_time_series_interval(
+        self, *, start_time: datetime, end_time: datetime, interval_minutes: int, max_points: Optional[int] = None
+    ) -> int:
+        """
+        Returns the bucket size to use for a time series over [start_time, end_time): the requested
+        interval, or the smallest coarser one in TIME_SERIES_INTERVALS_MINUTES (then whole weeks)
+        that keeps the series within max_points buckets.
+        """
+        max_points = max_points or settings.ANALYTICS_MAX_TIME_SERIES_POINTS
+        range_minutes = (end_time - start_time).total_seconds() / 60
+        if range_minutes <= interval_minutes * max_points:
+            return interval_minutes
+
+        for candidate in TIME_SERIES_INTERVALS_MINUTES:
+            if candidate > interval_minutes and range_minutes <= candidate * max_points:
+                return candidate
+        week_minutes = TIME_SERIES_INTERVALS_MINUTES[-1]
+        return max(interval_minutes, math.ceil(range_minutes / max_points / week_minutes) * week_minutes)
+
+    def _get_raw_table(self, filters, kind: str):
+        """
+        Returns the raw "human" or "traffic" table of the table family selected by filters.source.
+        """
+        return TABLE_FAMILIES[filters.source][kind]
+
+    def _get_rollup_tiers(self, db: AsyncSession, raw_table, resolution_minutes: Optional[int]) -> List[Tuple[str, Any]]:
+        """
+        Returns the rollup tiers whose buckets are fine enough for a query that groups time into
+        `resolution_minutes` wide buckets (None when it needs no time detail at all).
+        """
+        if db.bind.dialect.name == 'sqlite': # type: ignore
+            # Rollups are maintained by PostgreSQL triggers, so SQLite only has the raw rows
+            return []
+        # Provisioned data has no rollups and is always read raw
+        return [
+            (unit, table) for unit, table in ROLLUP_TIERS.get(raw_table, ())
+            if resolution_minutes is None or resolution_minutes % ROLLUP_UNIT_MINUTES[unit] == 0
+        ]
+
+    def _is_bucket_aligned_zone(self, value: datetime, unit: str) -> bool:
+        """
+        Rollup buckets are truncated on the stored (naive) timestamps. Hour buckets line up with
+        any whole-hour UTC offset, day buckets only with naive bounds.
+        """
+        offset = value.utcoffset()
+        if offset is None:
+            return True
+        return unit == "hour" and offset.total_seconds() % 3600 == 0
+
+    def _floor_to_bucket(self, value: datetime, unit: str) -> datetime:
+        value = value.replace(minute=0, second=0, microsecond=0)
+        return value.replace(hour=0) if unit == "day" else value
+
+    def _ceil_to_bucket(self, value: datetime, unit: str) -> datetime:
+        floored = self._floor_to_bucket(value, unit)
+        if floored == value:
+            return floored
+        return floored + (timedelta(days=1) if unit == "day" else timedelta(hours=1))
+
+    def _plan_time_segments(
+        self, start_time: Optional[datetime], end_time: Optional[datetime], tiers: List[Tuple[str, Any]], raw_table
+    ) -> List[Tuple[Any, Optional[datetime], Optional[datetime]]]:
+        """
+        Splits [start_time, end_time) into (table, start, end) segments so that every part of the
+        range is read from the coarsest tier whose buckets fit entirely inside it. The partial
+        buckets at either edge fall through to the next finer tier and finally to the raw table.
+        A None bound is open.
+        """
+        if start_time is not None and end_time is not None and start_time >= end_time:
+            return []
+        if not tiers:
+            return [(raw_table, start_time, end_time)]
+
+        (unit, rollup_table), finer_tiers = tiers[0], tiers[1:]
+        if not all(self._is_bucket_aligned_zone(value, unit) for value in (start_time, end_time) if value is not None):
+            return self._plan_time_segments(start_time, end_time, finer_tiers, raw_table)
+
+        inner_start = None if start_time is None else self._ceil_to_bucket(start_time, unit)
+        inner_end = None if end_time is None else self._floor_to_bucket(end_time, unit)
+        if inner_start is not None and inner_end is not None and inner_start >= inner_end:
+            return self._plan_time_segments(start_time, end_time, finer_tiers, raw_table)
+
+        segments = []
+        if start_time is not None:
+            segments += self._plan_time_segments(start_time, inner_start, finer_tiers, raw_table)
+        segments.append((rollup_table, inner_start, inner_end))
+        if end_time is not None:
+            segments += self._plan_time_segments(inner_end, end_time, finer_tiers, raw_table)
+        return segments
+
+    def _get_source_table(self, db: AsyncSession, raw_table, filters, resolution_minutes: Optional[int]):
+        """
+        Returns what to aggregate for `filters`: the raw table, a single rollup table, or a
+        UNION ALL of rollup and raw segments (as a subquery column collection). All of them expose
+        the raw table's column names, so _apply_filters works unchanged.
+
+        `resolution_minutes` is the time granularity the query groups by (None for plain totals);
+        an hours filter needs at least hourly buckets.
+        """
+        if filters.hours:
+            resolution_minutes = math.gcd(resolution_minutes, 60) if resolution_minutes else 60
+        tiers = self._get_rollup_tiers(db, raw_table, resolution_minutes)
+        segments = self._plan_time_segments(filters.start_time, filters.end_time, tiers, raw_table)
+        if not segments:
+            return raw_table
+        if len(segments) == 1:
+            # The outer start/end filters already bound a single segment
+            return segments[0][0]
+
+        column_names = ROLLUP_TIERS[raw_table][0][1].__table__.columns.keys()
+        selects = []
+        for table, segment_start, segment_end in segments:
+            query = select(*[getattr(table, name) for name in column_names])
+            if segment_start is not None:
+                query = query.filter(table.timestamp >= segment_start)
+            if segment_end is not None:
+                query = query.filter(table.timestamp < segment_end)
+            selects.append(query)
+        return union_all(*selects).subquery(f"{raw_table.__tablename__}_source").c
+
+    def _get_direction_source_table(self, db: AsyncSession, raw_table, filters):
+        """
+        Direction filters select whole dates, so they are always covered by a rollup:
+        daily buckets without an hours filter, hourly buckets otherwise.
+        """
+        tiers = self._get_rollup_tiers(db, raw_table, 60 if filters.hours else None)
+        return tiers[0][1] if tiers else raw_table
+
+    def _get_device_groups_table(self, device_groups: Dict[uuid.UUID, str]):
+        """
+        Returns a (device_id, group_key) derived table of bound parameters, one row per device.
+        Grouping by its group_key column keeps SELECT and GROUP BY identical on every dialect.
+        """
+        selects = [
+            select(
+                literal(device_id, UUID(as_uuid=True)).label("device_id"),
+                literal(group_key, String).label("group_key"),
+            )
+            for device_id, group_key in device_groups.items()
+        ]
+        return (selects[0] if len(selects) == 1 else union_all(*selects)).subquery("device_groups")
+
+    async def _get_grouped_sums(
+        self,
+        db: AsyncSession,
+        *,
+        table,
+        columns: List[Any],
+        apply_filters,
+        include_totals: bool,
+        include_hourly: bool,
+        include_time_series: bool,
+        interval_minutes: int = 60,
+        device_groups: Optional[Dict[uuid.UUID, str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Sums `columns` over the filtered rows of `table` for up to three grouping sets in one pass:
+        (device_id), (device_id, hour) and (device_id, time_bucket).
+
+        Each returned row has device_id, hour, time_bucket and one key per summed column.
+        hour / time_bucket are None on rows that do not belong to that grouping set, so a row
+        with both set to None is a per-device total.
+
+        With `device_groups` ({device_id: group key}) rows are grouped by group key instead of
+        device (returned in device_id), and devices missing from it are skipped.
+        """
+        key_column = table.device_id
+        join_condition = None
+        if device_groups is not None:
+            groups = self._get_device_groups_table(device_groups)
+            key_column = groups.c.group_key
+            join_condition = groups.c.device_id == table.device_id
+
+        hour_part = table.hour_of_day
+        time_bucket = self._get_time_bucket_expression(db, table.timestamp, interval_minutes)
+        sums = [func.sum(column).label(column.key) for column in columns]
+        null_column = literal_column("NULL")
+
+        # (hour column, time_bucket column) for each requested grouping set
+        grouping_sets = []
+        if include_totals:
+            grouping_sets.append((None, None))
+        if include_hourly:
+            grouping_sets.append((hour_part, None))
+        if include_time_series:
+            grouping_sets.append((None, time_bucket))
+
+        if db.bind.dialect.name == 'sqlite': # type: ignore
+            # SQLite has no GROUPING SETS; emulate them with one grouped select per set in a single statement
+            selects = []
+            for hour_column, bucket_column in grouping_sets:
+                group_by_columns = [key_column] + [c for c in (hour_column, bucket_column) if c is not None]
+                query = select(
+                    key_column.label("device_id"),
+                    (hour_column if hour_column is not None else null_column).label("hour"),
+                    (bucket_column if bucket_column is not None else null_column).label("time_bucket"),
+                    *sums,
+                )
+                if join_condition is not None:
+                    query = query.filter(join_condition)
+                query = apply_filters(query).group_by(*group_by_columns)
+                selects.append(query)
+            query = selects[0] if len(selects) == 1 else union_all(*selects)
+        else: # For PostgreSQL
+            query = select(
+                key_column.label("device_id"),
+                (hour_part if include_hourly else null_column).label("hour"),
+                (time_bucket if include_time_series else null_column).label("time_bucket"),
+                *sums,
+            )
+            if join_condition is not None:
+                query = query.filter(join_condition)
+            query = apply_filters(query)
+            query = query.group_by(func.grouping_sets(*[
+                tuple_(key_column, *[c for c in (hour_column, bucket_column) if c is not None])
+                for hour_column, bucket_column in grouping_sets
+            ]))
+
+        result = await db.execute(query)
+        return [dict(row._mapping) for row in result.all()]
+
     # =============================================================================
     # TRAFFIC ANALYTICS METHODS
     # =============================================================================
 
-    def _get_vehicles_sum_expression(self, filters: TrafficAnalyticsFilters) -> ColumnElement:
+    def _get_vehicles_sum_expression(self, filters: TrafficAnalyticsFilters, table=CityEyeTrafficTable) -> ColumnElement:
         """
         Dynamically creates a SQLAlchemy sum expression based on vehicle_types filters.
         """
         
         vehicle_columns_map = {
-            "large": CityEyeTrafficTable.large,
-            "normal": CityEyeTrafficTable.normal,
-            "bicycle": CityEyeTrafficTable.bicycle,
-            "motorcycle": CityEyeTrafficTable.motorcycle,
+            "large": table.large,
+            "normal": table.normal,
+            "bicycle": table.bicycle,
+            "motorcycle": table.motorcycle,
         }
 
         selected_columns = []
@@ -437,64 +772,26 @@ class CRUDCityEyeAnalytics:
         
         return sum_expression
     
-    def _apply_traffic_filters(self, query, filters: TrafficAnalyticsFilters, is_aggregation_query: bool = False):
-        # Row-level filters (timestamps, devices, polygons)
-        if filters.device_ids:
-            query = query.filter(CityEyeTrafficTable.device_id.in_(filters.device_ids))
-        if filters.start_time:
-            query = query.filter(CityEyeTrafficTable.timestamp >= filters.start_time)
-        if filters.end_time:
-            # Add 1 hour to end_time to make it inclusive of the last hour
-            inclusive_end_time = filters.end_time # + timedelta(hours=1)
-            query = query.filter(CityEyeTrafficTable.timestamp < inclusive_end_time)
-        if filters.polygon_ids_in:
-            query = query.filter(CityEyeTrafficTable.polygon_id_in.in_(filters.polygon_ids_in))
-        if filters.polygon_ids_out:
-            query = query.filter(CityEyeTrafficTable.polygon_id_out.in_(filters.polygon_ids_out))
-
-        # Day of the week filtering
-        if filters.days:
-            # Convert day names to DOW numbers (0=Sunday, 1=Monday, ..., 6=Saturday for PostgreSQL EXTRACT(DOW ...))
-            day_mapping = {
-                "sunday": 0, "monday": 1, "tuesday": 2, "wednesday": 3,
-                "thursday": 4, "friday": 5, "saturday": 6
-            }
-            dow_numbers = [day_mapping[day.lower()] for day in filters.days if day.lower() in day_mapping]
-            if dow_numbers:
-                query = query.filter(func.extract('dow', CityEyeTrafficTable.timestamp).in_(dow_numbers))
-        
-        if filters.hours:
-            # Expecting hours like "10:00", "23:00". We only need the hour part.
-            hour_numbers = []
-            for hour_str in filters.hours:
-                try:
-                    hour_part = int(hour_str.split(':')[0])
-                    hour_numbers.append(hour_part)
-                except ValueError:
-                    # Handle cases where hour_str might not be in "HH:MM" format or is invalid
-                    pass # Or log a warning
-            
-            if hour_numbers: # Only apply filter if valid hours were parsed
-                query = query.filter(func.extract('hour', CityEyeTrafficTable.timestamp).in_(hour_numbers))
-
-        return query
-
+    @cached_analytics("get_total_traffic_count")
     async def get_total_traffic_count(self, db: AsyncSession, *, filters: TrafficAnalyticsFilters) -> int:
-        sum_expr = self._get_vehicles_sum_expression(filters)
+        source = self._get_source_table(db, self._get_raw_table(filters, "traffic"), filters, resolution_minutes=None)
+        sum_expr = self._get_vehicles_sum_expression(filters, source)
         query = select(func.sum(sum_expr).label("total_vehicles"))
 
         # Apply row-level filters (time, device, polygon, day, hour)
-        query = self._apply_traffic_filters(query, filters, is_aggregation_query=True)
+        query = self._apply_filters(query, filters, is_aggregation_query=True, table=source)
         result = await db.execute(query)
         return result.scalar() or 0
 
+    @cached_analytics("get_vehicle_type_distribution")
     async def get_vehicle_type_distribution(self, db: AsyncSession, *, filters: TrafficAnalyticsFilters) -> Dict[str, int]:
         # Get vehicle columns map
+        source = self._get_source_table(db, self._get_raw_table(filters, "traffic"), filters, resolution_minutes=None)
         vehicle_columns_map = {
-            "large": CityEyeTrafficTable.large,
-            "normal": CityEyeTrafficTable.normal,
-            "bicycle": CityEyeTrafficTable.bicycle,
-            "motorcycle": CityEyeTrafficTable.motorcycle,
+            "large": source.large,
+            "normal": source.normal,
+            "bicycle": source.bicycle,
+            "motorcycle": source.motorcycle,
         }
         
         # Determine which vehicle types to include (respect vehicle_types filter)
@@ -516,7 +813,7 @@ class CRUDCityEyeAnalytics:
             }
         
         query = select(*sum_expressions.values())
-        query = self._apply_traffic_filters(query, filters)
+        query = self._apply_filters(query, filters, table=source)
         result = await db.execute(query)
         result = result.first()
         
@@ -531,37 +828,35 @@ class CRUDCityEyeAnalytics:
         
         return output
 
+    @cached_analytics("get_hourly_traffic_distribution")
     async def get_hourly_traffic_distribution(self, db: AsyncSession, *, filters: TrafficAnalyticsFilters) -> List[Dict[str, Any]]:
-        hour_part = func.extract('hour', CityEyeTrafficTable.timestamp).label("hour")
-        sum_expr = self._get_vehicles_sum_expression(filters)
+        source = self._get_source_table(db, self._get_raw_table(filters, "traffic"), filters, resolution_minutes=60)
+        hour_part = source.hour_of_day.label("hour")
+        sum_expr = self._get_vehicles_sum_expression(filters, source)
         query = select(
             hour_part,
             func.sum(sum_expr).label("count")
         )
-        # Apply row-level filters (time, device, polygon, day, hour already applied in _apply_traffic_filters)
-        query = self._apply_traffic_filters(query, filters, is_aggregation_query=True)
+        # Apply row-level filters (time, device, polygon, day, hour already applied in _apply_filters)
+        query = self._apply_filters(query, filters, is_aggregation_query=True, table=source)
         query = query.group_by(hour_part).order_by(hour_part)
 
         results = await db.execute(query)
         results = results.all()
         return [{"hour": int(r.hour), "count": r.count or 0} for r in results]
     
+    @cached_analytics("get_traffic_time_series_data")
     async def get_traffic_time_series_data(self, db: AsyncSession, *, filters: TrafficAnalyticsFilters, interval_minutes: int = 60) -> List[Dict[str, Any]]:
-        sum_expr = self._get_vehicles_sum_expression(filters)
-
-        if db.bind.dialect.name == 'sqlite': # type: ignore
-            # SQLite does not have date_trunc, approximate by formatting
-            time_bucket = func.strftime('%Y-%m-%d %H:00:00', CityEyeTrafficTable.timestamp).label("time_bucket")
-        else: # For PostgreSQL
-            # This truncates to the hour. For other intervals, this would need to be more complex.
-            time_bucket = func.date_trunc('hour', CityEyeTrafficTable.timestamp).label("time_bucket")
+        source = self._get_source_table(db, self._get_raw_table(filters, "traffic"), filters, resolution_minutes=interval_minutes)
+        sum_expr = self._get_vehicles_sum_expression(filters, source)
+        time_bucket = self._get_time_bucket_expression(db, source.timestamp, interval_minutes).label("time_bucket")
 
         query = select(
             time_bucket,
             func.sum(sum_expr).label("count")
         )
-        # Apply row-level filters (time, device, polygon, day, hour already applied in _apply_traffic_filters)
-        query = self._apply_traffic_filters(query, filters, is_aggregation_query=True)
+        # Apply row-level filters (time, device, polygon, day, hour already applied in _apply_filters)
+        query = self._apply_filters(query, filters, is_aggregation_query=True, table=source)
         query = query.group_by(time_bucket).order_by(time_bucket)
 
         results = await db.execute(query)
@@ -569,120 +864,203 @@ class CRUDCityEyeAnalytics:
         return [{"timestamp": r.time_bucket, "count": r.count or 0} for r in results]
 
 
-    async def get_direction_counts(self, db: AsyncSession, *, filters: AnalyticsFilters) -> Dict[str, Dict[str, int]]:
+    async def _get_direction_counts_by_device(
+        self, db: AsyncSession, *, table, sum_expr: ColumnElement, apply_filters
+    ) -> Dict[uuid.UUID, Dict[str, Dict[str, int]]]:
         """
-        Get in/out counts per polygon, excluding 'loss' counts.
-        Returns: Dict with polygon_id as key and {'in_count': x, 'out_count': y} as value
+        Get in/out counts per polygon per device, excluding 'loss' counts, with a single scan of `table`.
+
+        Every row is unpivoted into an 'in' row (counted for polygon_id_in) and an 'out' row (counted
+        for polygon_id_out) by a cross join with a two row direction table, so both directions are
+        grouped by (device_id, polygon_id) together instead of by two separate GROUP BY queries.
+        Returns: Dict with device_id as key and {polygon_id: {'in_count': x, 'out_count': y}} as value
         """
-        # Get the sum expression for people count
-        sum_expr = self._get_people_sum_expression(filters)
-        
-        # Query for IN counts (when polygon appears in polygon_id_in)
-        in_query = select(
-            CityEyeHumanTable.polygon_id_in.label("polygon_id"),
-            func.sum(sum_expr).label("count")
-        ).filter(
-            CityEyeHumanTable.polygon_id_in != 'loss'  # Exclude loss
-        )
-        
-        # Apply filters
-        in_query = self._apply_direction_filters(in_query, filters, is_aggregation_query=True)
-        in_query = in_query.group_by(CityEyeHumanTable.polygon_id_in)
-        
-        # Query for OUT counts (when polygon appears in polygon_id_out)
-        out_query = select(
-            CityEyeHumanTable.polygon_id_out.label("polygon_id"),
-            func.sum(sum_expr).label("count")
-        ).filter(
-            CityEyeHumanTable.polygon_id_out != 'loss'  # Exclude loss
+        directions = union_all(
+            select(literal_column("'in'").label("direction")),
+            select(literal_column("'out'").label("direction")),
+        ).subquery("directions")
+        # Literal SQL (not bound parameters) so SELECT and GROUP BY render identical expressions
+        is_in = directions.c.direction == literal_column("'in'")
+        polygon_id = case((is_in, table.polygon_id_in), else_=table.polygon_id_out)
+
+        query = select(
+            table.device_id,
+            polygon_id.label("polygon_id"),
+            func.sum(case((is_in, sum_expr), else_=0)).label("in_count"),
+            func.sum(case((is_in, 0), else_=sum_expr)).label("out_count"),
+        ).select_from(table).join(directions, true()).filter(
+            polygon_id != literal_column("'loss'")  # Exclude loss
         )
-        
-        # Apply filters
-        out_query = self._apply_direction_filters(out_query, filters, is_aggregation_query=True)
-        out_query = out_query.group_by(CityEyeHumanTable.polygon_id_out)
-        
-        # Execute queries
-        in_results = await db.execute(in_query)
-        in_results = in_results.all()
-        out_results = await db.execute(out_query)
-        out_results = out_results.all()
-        
+        query = apply_filters(query)
+        query = query.group_by(table.device_id, polygon_id)
+
+        results = await db.execute(query)
+
         # Build result dictionary
-        result = {}
-        
-        # Process IN counts
-        for row in in_results:
-            polygon_id = str(row.polygon_id)
-            if polygon_id not in result:
-                result[polygon_id] = {'in_count': 0, 'out_count': 0}
-            result[polygon_id]['in_count'] = int(row.count or 0)
-        
-        # Process OUT counts
-        for row in out_results:
-            polygon_id = str(row.polygon_id)
-            if polygon_id not in result:
-                result[polygon_id] = {'in_count': 0, 'out_count': 0}
-            result[polygon_id]['out_count'] = int(row.count or 0)
-        
+        counts_by_device: Dict[uuid.UUID, Dict[str, Dict[str, int]]] = {}
+        for row in results.all():
+            device_counts = counts_by_device.setdefault(row.device_id, {})
+            device_counts[str(row.polygon_id)] = {
+                'in_count': int(row.in_count or 0),
+                'out_count': int(row.out_count or 0),
+            }
+        return counts_by_device
+
+    def _merge_direction_counts(self, counts_by_device: Dict[uuid.UUID, Dict[str, Dict[str, int]]]) -> Dict[str, Dict[str, int]]:
+        """
+        Sums per-device direction counts into one {polygon_id: {'in_count': x, 'out_count': y}} dict.
+        """
+        result: Dict[str, Dict[str, int]] = {}
+        for device_counts in counts_by_device.values():
+            for polygon_id, counts in device_counts.items():
+                if polygon_id not in result:
+                    result[polygon_id] = {'in_count': 0, 'out_count': 0}
+                result[polygon_id]['in_count'] += counts['in_count']
+                result[polygon_id]['out_count'] += counts['out_count']
         return result
 
+    @cached_analytics("get_direction_counts_by_device")
+    async def get_direction_counts_by_device(
+        self, db: AsyncSession, *, filters: DirectionAnalyticsFilters
+    ) -> Dict[uuid.UUID, Dict[str, Dict[str, int]]]:
+        """
+        Get in/out counts per polygon for every device in filters.device_ids, excluding 'loss' counts.
+        Returns: Dict with device_id as key and {polygon_id: {'in_count': x, 'out_count': y}} as value
+        """
+        source = self._get_direction_source_table(db, self._get_raw_table(filters, "human"), filters)
+        return await self._get_direction_counts_by_device(
+            db,
+            table=source,
+            sum_expr=self._get_people_sum_expression(filters, source),
+            apply_filters=lambda query: self._apply_filters(query, filters, is_aggregation_query=True, table=source),
+        )
+
+    @cached_analytics("get_direction_counts")
+    async def get_direction_counts(self, db: AsyncSession, *, filters: AnalyticsFilters) -> Dict[str, Dict[str, int]]:
+        """
+        Get in/out counts per polygon, excluding 'loss' counts.
+        Returns: Dict with polygon_id as key and {'in_count': x, 'out_count': y} as value
+        """
+        return self._merge_direction_counts(await self.get_direction_counts_by_device(db, filters=filters))
 
+    @cached_analytics("get_traffic_direction_counts_by_device")
+    async def get_traffic_direction_counts_by_device(
+        self, db: AsyncSession, *, filters: TrafficDirectionAnalyticsFilters
+    ) -> Dict[uuid.UUID, Dict[str, Dict[str, int]]]:
+        """
+        Get in/out counts per polygon for traffic for every device in filters.device_ids, excluding 'loss' counts.
+        Returns: Dict with device_id as key and {polygon_id: {'in_count': x, 'out_count': y}} as value
+        """
+        source = self._get_direction_source_table(db, self._get_raw_table(filters, "traffic"), filters)
+        return await self._get_direction_counts_by_device(
+            db,
+            table=source,
+            sum_expr=self._get_vehicles_sum_expression(filters, source),
+            apply_filters=lambda query: self._apply_filters(query, filters, is_aggregation_query=True, table=source),
+        )
+
+    @cached_analytics("get_traffic_direction_counts")
     async def get_traffic_direction_counts(self, db: AsyncSession, *, filters: TrafficAnalyticsFilters) -> Dict[str, Dict[str, int]]:
         """
         Get in/out counts per polygon for traffic, excluding 'loss' counts.
         Returns: Dict with polygon_id as key and {'in_count': x, 'out_count': y} as value
         """
-        # Get the sum expression for vehicle count
-        sum_expr = self._get_vehicles_sum_expression(filters)
-        
-        # Query for IN counts (when polygon appears in polygon_id_in)
-        in_query = select(
-            CityEyeTrafficTable.polygon_id_in.label("polygon_id"),
-            func.sum(sum_expr).label("count")
-        ).filter(
-            CityEyeTrafficTable.polygon_id_in != 'loss'  # Exclude loss
-        )
-        
-        # Apply filters
-        in_query = self._apply_traffic_direction_filters(in_query, filters, is_aggregation_query=True)
-        in_query = in_query.group_by(CityEyeTrafficTable.polygon_id_in)
-        
-        # Query for OUT counts (when polygon appears in polygon_id_out)
-        out_query = select(
-            CityEyeTrafficTable.polygon_id_out.label("polygon_id"),
-            func.sum(sum_expr).label("count")
-        ).filter(
-            CityEyeTrafficTable.polygon_id_out != 'loss'  # Exclude loss
-        )
-        
-        # Apply filters
-        out_query = self._apply_traffic_direction_filters(out_query, filters, is_aggregation_query=True)
-        out_query = out_query.group_by(CityEyeTrafficTable.polygon_id_out)
-        
-        # Execute queries
-        in_results = await db.execute(in_query)
-        in_results = in_results.all()
-        out_results = await db.execute(out_query)
-        out_results = out_results.all()
-        
-        # Build result dictionary
-        result = {}
-        
-        # Process IN counts
-        for row in in_results:
-            polygon_id = str(row.polygon_id)
-            if polygon_id not in result:
-                result[polygon_id] = {'in_count': 0, 'out_count': 0}
-            result[polygon_id]['in_count'] = int(row.count or 0)
-        
-        # Process OUT counts
-        for row in out_results:
-            polygon_id = str(row.polygon_id)
-            if polygon_id not in result:
-                result[polygon_id] = {'in_count': 0, 'out_count': 0}
-            result[polygon_id]['out_count'] = int(row.count or 0)
-        
-        return result
+        return self._merge_direction_counts(await self.get_traffic_direction_counts_by_device(db, filters=filters))
+
+    # =============================================================================
+    # PERIOD COMPARISON
+    # =============================================================================
+
+    def _build_traffic_metrics(self, sums: Dict[str, int], filters: TrafficAnalyticsFilters, metrics: set) -> Dict[str, Any]:
+        """
+        Derives total and vehicle type metrics from the four vehicle sums of one device.
+        Output keys match get_total_traffic_count / get_vehicle_type_distribution.
+        """
+        selected_types = [vt.lower() for vt in filters.vehicle_types] if filters.vehicle_types else list(VEHICLE_TYPES)
+        vehicle_type_distribution = {
+            vehicle_type: (sums.get(vehicle_type) or 0) if vehicle_type in selected_types else 0
+            for vehicle_type in VEHICLE_TYPES
+        }
+        output = {
+            "total_count": sum(vehicle_type_distribution.values()),
+            "vehicle_type_distribution": vehicle_type_distribution,
+        }
+        return {key: value for key, value in output.items() if key in metrics}
+
+    def _compare_values(self, current: Any, baseline: Any) -> Dict[str, Any]:
+        """
+        Pairs a current and a baseline metric value (a count or a dict of counts) into
+        {current, baseline, delta, ratio} leaves. ratio is None when the baseline is 0.
+        """
+        if isinstance(current, dict):
+            return {key: self._compare_values(current[key], baseline[key]) for key in current}
+        return {
+            "current": current,
+            "baseline": baseline,
+            "delta": current - baseline,
+            "ratio": round(current / baseline, 4) if baseline else None,
+        }
+
+    async def get_flow_comparison_by_device(
+        self,
+        db: AsyncSession,
+        *,
+        filters,
+        kind: str,
+        metrics: Iterable[str],
+        current_by_device: Dict[uuid.UUID, Dict[str, Any]],
+        baseline_start_time: datetime,
+        baseline_end_time: datetime,
+    ) -> Dict[uuid.UUID, Dict[str, Any]]:
+        """
+        Compares the "human" or "traffic" total metrics of every device in filters.device_ids between
+        the filters' range and the baseline range (all other filters unchanged).
+
+        The current totals are taken from current_by_device, the get_*_flow_metrics result of the
+        filters' range, so only the baseline range is scanned. Returns a dict keyed by device_id
+        whose values map each requested metric to {current, baseline, delta, ratio} leaves (per key
+        for distributions).
+        """
+        total_metrics = HUMAN_TOTAL_METRICS if kind == "human" else TRAFFIC_TOTAL_METRICS
+        metrics = [metric for metric in total_metrics if metric in set(metrics)]
+        get_metrics = self.get_human_flow_metrics if kind == "human" else self.get_traffic_flow_metrics
+        baseline_filters = filters.model_copy(update={"start_time": baseline_start_time, "end_time": baseline_end_time})
+        baseline_by_device = await get_metrics(db, filters=baseline_filters, metrics=metrics)
+
+        results: Dict[uuid.UUID, Dict[str, Any]] = {}
+        for device_id in filters.device_ids or []:
+            current = {metric: current_by_device[device_id][metric] for metric in metrics}
+            baseline = {metric: baseline_by_device[device_id][metric] for metric in metrics}
+            results[device_id] = self._compare_values(current, baseline)
+        return results
+
+    # =============================================================================
+    # RAW DATA EXPORT
+    # =============================================================================
+
+    async def stream_raw_rows(
+        self,
+        db: AsyncSession,
+        *,
+        kind: str,
+        filters,
+        columns: Sequence[str],
+        chunk_size: int,
+    ) -> AsyncIterator[List[Any]]:
+        """
+        Yields the filtered raw "human" or "traffic" rows (as tuples of `columns`) in chunks of up to
+        chunk_size, ordered by device and time. Rows come from a server-side cursor, so memory use
+        does not depend on the size of the range.
+        """
+        table = self._get_raw_table(filters, kind)
+
+        query = select(*[getattr(table, column) for column in columns])
+        query = self._apply_filters(query, filters, table=table)
+        query = query.order_by(table.device_id, table.timestamp).execution_options(yield_per=chunk_size)
+
+        result = await db.stream(query)
+        async for rows in result.partitions(chunk_size):
+            yield rows
 
     async def get_by_customer_and_solution(
         self, db: AsyncSession, *, customer_id: uuid.UUID, solution_id: uuid.UUID
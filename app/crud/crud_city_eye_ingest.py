@@ -0,0 +1,139 @@
+from typing import Any, Dict, List, Set, Tuple
+import uuid
+from sqlalchemy import and_, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.async_session import jst_now
+from app.models import DeviceSolution
+from app.utils.city_eye_ingest import KEY_COLUMNS
+
+# Columns written by bulk_insert besides the table's count columns
+INSERT_COLUMNS = ("data_id", "solution_id", "device_solution_id", *KEY_COLUMNS)
+
+# PostgreSQL types of the staging table columns
+STAGING_COLUMN_TYPES = {
+    "data_id": "uuid",
+    "device_id": "uuid",
+    "solution_id": "uuid",
+    "device_solution_id": "uuid",
+    "timestamp": "timestamp",
+    "polygon_id_in": "text",
+    "polygon_id_out": "text",
+}
+
+
+class CRUDCityEyeIngest:
+    async def get_device_solution_ids(
+        self, db: AsyncSession, *, device_ids: Set[uuid.UUID], solution_id: uuid.UUID
+    ) -> Dict[uuid.UUID, uuid.UUID]:
+        """
+        Maps each device the solution is deployed on to its device_solution id, in one query.
+        """
+        if not device_ids:
+            return {}
+        result = await db.execute(
+            select(DeviceSolution.device_id, DeviceSolution.id).filter(
+                DeviceSolution.solution_id == solution_id,
+                DeviceSolution.device_id.in_(device_ids),
+            )
+        )
+        return {row.device_id: row.id for row in result.all()}
+
+    async def bulk_insert(
+        self, db: AsyncSession, *, table, columns: Dict[str, List[Any]], count_columns: Tuple[str, ...]
+    ) -> int:
+        """
+        Inserts the rows given as columns (INSERT_COLUMNS except data_id, plus count_columns),
+        skipping rows whose (device_id, timestamp, polygon_id_in, polygon_id_out) is already stored.
+        Returns the number of inserted rows.
+        """
+        row_count = len(columns["device_id"])
+        if not row_count:
+            return 0
+        columns = {**columns, "data_id": [uuid.uuid4() for _ in range(row_count)]}
+        column_names = [*INSERT_COLUMNS, *count_columns]
+
+        if db.bind.dialect.name == "postgresql": # type: ignore
+            inserted = await self._copy_insert(db, table=table, columns=columns, column_names=column_names)
+        else:
+            inserted = await self._insert_missing(db, table=table, columns=columns, column_names=column_names)
+        await db.commit()
+        return inserted
+
+    async def _copy_insert(self, db: AsyncSession, *, table, columns: Dict[str, List[Any]], column_names: List[str]) -> int:
+        """
+        COPYs the rows into a transaction-local staging table, then moves the ones with new keys
+        into `table` with a single INSERT ... SELECT, so the rollup triggers fire once per batch.
+
+        The raw tables have no unique key to back ON CONFLICT DO NOTHING, and two transactions
+        running the NOT EXISTS check at once would both insert the same rows (e.g. a device
+        retrying a batch that is still being loaded). A transaction-level advisory lock per
+        (table, device), taken in device order, serializes the batches of the same devices, while
+        batches of other devices still load in parallel.
+        """
+        table_name = table.__tablename__
+        staging = f"{table_name}_staging"
+        quoted = ", ".join(f'"{name}"' for name in column_names)
+        staged = ", ".join(f's."{name}"' for name in column_names)
+
+        await db.execute(text(
+            f"CREATE TEMP TABLE {staging} ("
+            + ", ".join(f'"{name}" {STAGING_COLUMN_TYPES.get(name, "integer")}' for name in column_names)
+            + ") ON COMMIT DROP"
+        ))
+
+        connection = await db.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            staging, records=zip(*(columns[name] for name in column_names)), columns=column_names
+        )
+
+        # Volatile functions in the select list run after ORDER BY: the locks are taken in order
+        await db.execute(
+            text(
+                f"SELECT pg_advisory_xact_lock(hashtext(:table_name), hashtext(d.device_id::text)) "
+                f"FROM (SELECT DISTINCT device_id FROM {staging}) d ORDER BY d.device_id"
+            ),
+            {"table_name": table_name},
+        )
+
+        key_match = " AND ".join(f't."{name}" = s."{name}"' for name in KEY_COLUMNS)
+        result = await db.execute(
+            text(
+                f"INSERT INTO {table_name} ({quoted}, created_at, updated_at) "
+                f"SELECT {staged}, :now, :now FROM {staging} s "
+                f"WHERE NOT EXISTS (SELECT 1 FROM {table_name} t WHERE {key_match})"
+            ),
+            {"now": jst_now()},
+        )
+        return result.rowcount
+
+    async def _insert_missing(self, db: AsyncSession, *, table, columns: Dict[str, List[Any]], column_names: List[str]) -> int:
+        """
+        Portable fallback: reads the stored keys of the batch's devices and time range, then
+        inserts the remaining rows with one executemany.
+        """
+        timestamps = columns["timestamp"]
+        result = await db.execute(
+            select(*[getattr(table, name) for name in KEY_COLUMNS]).filter(
+                and_(
+                    table.device_id.in_(set(columns["device_id"])),
+                    table.timestamp >= min(timestamps),
+                    table.timestamp <= max(timestamps),
+                )
+            )
+        )
+        existing = {tuple(row) for row in result.all()}
+
+        now = jst_now()
+        keys = zip(*(columns[name] for name in KEY_COLUMNS))
+        rows = [
+            {**dict(zip(column_names, values)), "created_at": now, "updated_at": now}
+            for key, values in zip(keys, zip(*(columns[name] for name in column_names)))
+            if key not in existing
+        ]
+        if rows:
+            await db.execute(insert(table), rows)
+        return len(rows)
+
+
+crud_city_eye_ingest = CRUDCityEyeIngest()
@@ -0,0 +1,98 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+import uuid
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import (
+    CityEyeHumanHourlyTable,
+    CityEyeTrafficHourlyTable,
+    CityEyeThresholdWatermark,
+    CustomerSolution,
+    Device,
+    LicenseStatus,
+)
+from app.utils.city_eye_ingest import HUMAN_COUNT_COLUMNS, TRAFFIC_COUNT_COLUMNS
+
+# kind -> (hourly rollup, count columns summed into the evaluated total, threshold list key)
+THRESHOLD_SOURCES = {
+    "human": (CityEyeHumanHourlyTable, HUMAN_COUNT_COLUMNS, "human_count_thresholds"),
+    "traffic": (CityEyeTrafficHourlyTable, TRAFFIC_COUNT_COLUMNS, "traffic_count_thresholds"),
+}
+
+
+class CRUDCityEyeThresholds:
+    async def get_customer_thresholds(
+        self, db: AsyncSession, *, solution_id: uuid.UUID
+    ) -> Dict[str, Dict[uuid.UUID, List[float]]]:
+        """
+        Reads the thresholds of every customer with an active license for the solution, in one
+        query. Returns kind -> customer_id -> sorted distinct thresholds; customers without
+        thresholds of a kind are left out of it.
+        """
+        result = await db.execute(
+            select(CustomerSolution.customer_id, CustomerSolution.configuration_template).filter(
+                CustomerSolution.solution_id == solution_id,
+                CustomerSolution.license_status == LicenseStatus.ACTIVE,
+            )
+        )
+        thresholds: Dict[str, Dict[uuid.UUID, List[float]]] = {kind: {} for kind in THRESHOLD_SOURCES}
+        for customer_id, config_template in result.all():
+            thresholds_data = (config_template or {}).get("thresholds", {})
+            for kind, (_, _, key) in THRESHOLD_SOURCES.items():
+                values = sorted({float(value) for value in thresholds_data.get(key) or []})
+                if values:
+                    thresholds[kind][customer_id] = values
+        return thresholds
+
+    async def lock_watermark(
+        self, db: AsyncSession, *, kind: str, initial: datetime
+    ) -> Optional[CityEyeThresholdWatermark]:
+        """
+        Returns the watermark of `kind` locked for this transaction, creating it at `initial` on
+        the first run. Returns None while another worker holds the lock (or wins the creation),
+        so each window is evaluated by a single worker. SQLite ignores the lock.
+        """
+        existing = await db.execute(select(CityEyeThresholdWatermark.kind).filter(CityEyeThresholdWatermark.kind == kind))
+        if existing.scalar() is None:
+            db.add(CityEyeThresholdWatermark(kind=kind, evaluated_until=initial))
+            try:
+                await db.commit()
+            except IntegrityError:
+                await db.rollback()
+                return None
+
+        result = await db.execute(
+            select(CityEyeThresholdWatermark)
+            .filter(CityEyeThresholdWatermark.kind == kind)
+            .with_for_update(skip_locked=True)
+        )
+        return result.scalars().first()
+
+    async def get_hourly_totals(
+        self, db: AsyncSession, *, kind: str, customer_ids: Set[uuid.UUID], start_time: datetime, end_time: datetime
+    ) -> List[Tuple[uuid.UUID, uuid.UUID, datetime, int]]:
+        """
+        Sums the hourly rollup of `kind` over polygons for every device of the given customers and
+        every bucket in [start_time, end_time), in one query. Returns
+        (customer_id, device_id, bucket start, total) rows ordered by device and bucket.
+        """
+        if not customer_ids:
+            return []
+        table, count_columns, _ = THRESHOLD_SOURCES[kind]
+        total = sum(getattr(table, column) for column in count_columns)
+        result = await db.execute(
+            select(Device.customer_id, table.device_id, table.timestamp, func.sum(total).label("total"))
+            .join(Device, Device.device_id == table.device_id)
+            .filter(
+                Device.customer_id.in_(customer_ids),
+                table.timestamp >= start_time,
+                table.timestamp < end_time,
+            )
+            .group_by(Device.customer_id, table.device_id, table.timestamp)
+            .order_by(table.device_id, table.timestamp)
+        )
+        return [(row.customer_id, row.device_id, row.timestamp, int(row.total or 0)) for row in result.all()]
+
+
+crud_city_eye_thresholds = CRUDCityEyeThresholds()
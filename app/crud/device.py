@@ -1,16 +1,38 @@
-from typing import Any, Dict, Optional, List
+from typing import Any, Dict, Optional, List, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import desc, and_, select, delete, func
+from sqlalchemy import desc, and_, select, delete, func, exists
 from app.crud.base import CRUDBase
 from app.models import Device, DeviceStatus, Customer, DeviceSolution, Solution, Job, DeviceCommand, CityEyeHumanTable as HumanTable, CityEyeTrafficTable as TrafficTable
+from app.models import CityEyeHumanHourlyTable, CityEyeHumanDailyTable, CityEyeTrafficHourlyTable, CityEyeTrafficDailyTable
 from app.schemas.device import DeviceCreate, DeviceUpdate
+from app.utils.analytics_cache import analytics_cache
 import uuid
 
 class CRUDDevice(CRUDBase[Device, DeviceCreate, DeviceUpdate]):
     async def get_by_id(self, db: AsyncSession, *, device_id: uuid.UUID) -> Optional[Device]:
         result = await db.execute(select(Device).filter(Device.device_id == device_id))
         return result.scalars().first()
+
+    async def get_by_ids(self, db: AsyncSession, *, device_ids: List[uuid.UUID]) -> List[Device]:
+        result = await db.execute(select(Device).filter(Device.device_id.in_(device_ids)))
+        return list(result.scalars().all())
     
+    async def get_by_ids_with_solution_flag(
+        self, db: AsyncSession, *, device_ids: List[uuid.UUID], solution_id: uuid.UUID
+    ) -> List[Tuple[Device, bool]]:
+        """
+        Fetches the given devices in one query, each paired with whether the solution is
+        deployed on it. Unknown device IDs are simply absent from the result.
+        """
+        solution_deployed = exists().where(
+            DeviceSolution.device_id == Device.device_id,
+            DeviceSolution.solution_id == solution_id,
+        ).label("solution_deployed")
+        result = await db.execute(
+            select(Device, solution_deployed).filter(Device.device_id.in_(device_ids))
+        )
+        return [(row.Device, bool(row.solution_deployed)) for row in result.all()]
+
     async def get_by_mac_address(self, db: AsyncSession, *, mac_address: str) -> Optional[Device]:
         if not mac_address:
             return None
@@ -25,6 +47,10 @@ class CRUDDevice(CRUDBase[Device, DeviceCreate, DeviceUpdate]):
         result = await db.execute(select(Device).filter(Device.name == device_name))
         return result.scalars().first()
 
+    async def get_by_device_names(self, db: AsyncSession, *, device_names: List[str]) -> List[Device]:
+        result = await db.execute(select(Device).filter(Device.name.in_(device_names)))
+        return list(result.scalars().all())
+
     async def get_by_customer(
         self, db: AsyncSession, *, customer_id: uuid.UUID, skip: int = 0, limit: int = 100
     ) -> List[Device]:
@@ -294,9 +320,13 @@ class CRUDDevice(CRUDBase[Device, DeviceCreate, DeviceUpdate]):
                 # Flush so the FK update is persisted before job deletions
                 await db.flush()
 
-            # 1. Delete City Eye data (human and traffic tables)
-            await db.execute(delete(HumanTable).where(HumanTable.device_id == device_id))
-            await db.execute(delete(TrafficTable).where(TrafficTable.device_id == device_id))
+            # 1. Delete City Eye data (human and traffic tables and their rollups). Raw rows are
+            # matched by device only: rollups may not cover all of them (rows older than the
+            # rollups, or not rolled up yet), so they cannot bound the delete.
+            for raw_table in (HumanTable, TrafficTable):
+                await db.execute(delete(raw_table).where(raw_table.device_id == device_id))
+            for rollup_table in (CityEyeHumanHourlyTable, CityEyeHumanDailyTable, CityEyeTrafficHourlyTable, CityEyeTrafficDailyTable):
+                await db.execute(delete(rollup_table).where(rollup_table.device_id == device_id))
             
             # 2. Delete device commands
             await db.execute(delete(DeviceCommand).where(DeviceCommand.device_id == device_id))
@@ -312,6 +342,9 @@ class CRUDDevice(CRUDBase[Device, DeviceCreate, DeviceUpdate]):
             
             # Commit all deletions
             await db.commit()
+
+            # Cached analytics still hold the deleted City Eye data
+            await analytics_cache.invalidate_devices([device_id])
             
             return device_obj
             
@@ -1,4 +1,4 @@
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.crud.base import CRUDBase
@@ -21,6 +21,15 @@ class CRUDDeviceCommand(
         )
         return result.scalars().first()
 
+    async def get_by_message_ids(
+        self, db: AsyncSession, *, message_ids: List[uuid.UUID]
+    ) -> List[DeviceCommand]:
+        result = await db.execute(
+            select(DeviceCommand)
+            .filter(DeviceCommand.message_id.in_(message_ids))
+        )
+        return list(result.scalars().all())
+
     async def create(self, db: AsyncSession, *, obj_in: DeviceCommandCreate) -> DeviceCommand:
         db_obj = DeviceCommand(
             device_id=obj_in.device_id,
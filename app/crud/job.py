@@ -1,10 +1,10 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import desc, select
 from app.crud.base import CRUDBase
+from app.models.device import Device
 from app.models.job import Job, JobStatus, JobType
 from app.schemas.job import JobCreate
-from app.utils.aws_iot_jobs import iot_jobs_service
 import uuid
 from datetime import datetime
 
@@ -12,6 +12,10 @@ class CRUDJob(CRUDBase[Job, JobCreate, None]):
     async def get_by_job_id(self, db: AsyncSession, *, job_id: str) -> Optional[Job]:
         result = await db.execute(select(Job).filter(Job.job_id == job_id))
         return result.scalars().first()
+
+    async def get_by_job_ids(self, db: AsyncSession, *, job_ids: List[str]) -> List[Job]:
+        result = await db.execute(select(Job).filter(Job.job_id.in_(job_ids)))
+        return list(result.scalars().all())
     
     async def get_by_device(
         self, db: AsyncSession, *, device_id: uuid.UUID, skip: int = 0, limit: int = 10
@@ -64,7 +68,6 @@ class CRUDJob(CRUDBase[Job, JobCreate, None]):
         await db.flush()
         
         # Update device's latest job
-        from app.models.device import Device
         device = await db.get(Device, obj_in.device_id)
         if device:
             device.latest_job_id = db_obj.id
@@ -87,6 +90,28 @@ class CRUDJob(CRUDBase[Job, JobCreate, None]):
         if not job_obj:
             return None
         
+        self._set_status(job_obj, status=status, status_details=status_details, error_message=error_message)
+        
+        await db.commit()
+        await db.refresh(job_obj)
+        return job_obj
+
+    async def update_statuses(
+        self, db: AsyncSession, *, updates: List[Tuple[Job, JobStatus, Optional[Dict[str, Any]]]]
+    ) -> None:
+        """Update the status (and status details) of several loaded jobs in one commit."""
+        for job_obj, status, status_details in updates:
+            self._set_status(job_obj, status=status, status_details=status_details)
+        await db.commit()
+
+    @staticmethod
+    def _set_status(
+        job_obj: Job,
+        *,
+        status: JobStatus,
+        status_details: Optional[Dict[str, Any]] = None,
+        error_message: Optional[str] = None
+    ) -> None:
         job_obj.status = status
         if status_details:
             job_obj.status_details = status_details
@@ -97,10 +122,37 @@ class CRUDJob(CRUDBase[Job, JobCreate, None]):
             job_obj.started_at = datetime.now()
         elif status in [JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.TIMED_OUT, JobStatus.CANCELED]:
             job_obj.completed_at = datetime.now()
-        
-        await db.commit()
-        await db.refresh(job_obj)
-        return job_obj
+
+    async def get_unfinished_with_thing_names(self, db: AsyncSession) -> List[Tuple[str, JobStatus, str]]:
+        """
+        Get the job id and status of the jobs that are not in a terminal state, with the thing
+        name of their device. Nothing is locked.
+        """
+        result = await db.execute(
+            select(Job.job_id, Job.status, Device.thing_name)
+            .join(Device, Device.device_id == Job.device_id)
+            .filter(
+                Job.status.notin_([
+                    JobStatus.SUCCEEDED,
+                    JobStatus.FAILED,
+                    JobStatus.TIMED_OUT,
+                    JobStatus.CANCELED,
+                    JobStatus.ARCHIVED
+                ]),
+                Device.thing_name.isnot(None)
+            )
+        )
+        return [(job_id, status, thing_name) for job_id, status, thing_name in result.all()]
+
+    async def lock_by_job_ids(self, db: AsyncSession, *, job_ids: List[str]) -> List[Job]:
+        """
+        Get and lock jobs until the end of the transaction. Jobs locked by another transaction
+        are skipped rather than waited for.
+        """
+        result = await db.execute(
+            select(Job).filter(Job.job_id.in_(job_ids)).with_for_update(skip_locked=True)
+        )
+        return list(result.scalars().all())
 
 
     async def get_archivable_jobs_for_device(
@@ -126,42 +178,5 @@ class CRUDJob(CRUDBase[Job, JobCreate, None]):
             .offset(keep_latest) # Skip the N most recent jobs
         )
         return list(result.scalars().all())
-    
-
-    async def sync_job_status(self, db: AsyncSession, job_obj: Job) -> Job:
-        """
-        Sync job status with AWS IoT if the job is not in a terminal state
-        """
-        if job_obj.status not in [JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.TIMED_OUT, JobStatus.CANCELED, JobStatus.ARCHIVED]:
-            # Get current status from AWS
-            from app.models.device import Device
-            device_obj = await db.get(Device, job_obj.device_id)
-            if device_obj and device_obj.thing_name:
-                aws_status = iot_jobs_service.get_job_execution_status(
-                    job_id=job_obj.job_id,
-                    thing_name=device_obj.thing_name
-                )
-                
-                if aws_status:
-                    # Map AWS status to our status enum
-                    status_mapping = {
-                        "QUEUED": JobStatus.QUEUED,
-                        "IN_PROGRESS": JobStatus.IN_PROGRESS,
-                        "SUCCEEDED": JobStatus.SUCCEEDED,
-                        "FAILED": JobStatus.FAILED,
-                        "TIMED_OUT": JobStatus.TIMED_OUT,
-                        "CANCELED": JobStatus.CANCELED
-                    }
-                    
-                    new_status = status_mapping.get(aws_status["status"])
-                    if new_status and new_status != job_obj.status:
-                        job_obj = await self.update_status(
-                            db,
-                            job_id=job_obj.job_id,
-                            status=new_status,
-                            status_details=aws_status.get("status_details")
-                        )
-        
-        return job_obj
 
 job = CRUDJob(Job)
@@ -1,12 +1,20 @@
-from typing import Any, Dict, Optional, List
+from typing import Any, Dict, Optional, List, Tuple, Union
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import func, select
 from app.crud.base import CRUDBase
 from app.models import DeviceSolution, CustomerSolution, Solution
 from app.schemas.solution import SolutionCreate, SolutionUpdate
+import time
 import uuid
 
+# How long a cached solution name -> ID lookup is trusted before re-reading it
+SOLUTION_ID_CACHE_TTL_SECONDS = 300
+
 class CRUDSolution(CRUDBase[Solution, SolutionCreate, SolutionUpdate]):
+    def __init__(self, model):
+        super().__init__(model)
+        self._id_by_name: Dict[str, Tuple[uuid.UUID, float]] = {}
+
     async def get_by_id(self, db: AsyncSession, *, solution_id: uuid.UUID) -> Optional[Solution]:
         result = await db.execute(select(Solution).filter(Solution.solution_id == solution_id))
         return result.scalars().first()
@@ -15,6 +23,37 @@ class CRUDSolution(CRUDBase[Solution, SolutionCreate, SolutionUpdate]):
         result = await db.execute(select(Solution).filter(Solution.name == name))
         return result.scalars().first()
 
+    async def get_id_by_name_cached(self, db: AsyncSession, *, name: str) -> Optional[uuid.UUID]:
+        """
+        Get a solution ID by name, cached process-wide. Solutions are seeded once and renamed
+        rarely, so hot paths (e.g. analytics authorization) avoid a lookup per request.
+        Misses are not cached so that a newly created solution is picked up immediately.
+        """
+        cached = self._id_by_name.get(name)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+
+        solution_obj = await self.get_by_name(db, name=name)
+        if not solution_obj:
+            self._id_by_name.pop(name, None)
+            return None
+
+        self._id_by_name[name] = (solution_obj.solution_id, time.monotonic() + SOLUTION_ID_CACHE_TTL_SECONDS)
+        return solution_obj.solution_id
+
+    def clear_name_cache(self) -> None:
+        self._id_by_name.clear()
+
+    async def update(
+        self, db: AsyncSession, *, db_obj: Solution, obj_in: Union[SolutionUpdate, Dict[str, Any]]
+    ) -> Solution:
+        self.clear_name_cache()
+        return await super().update(db, db_obj=db_obj, obj_in=obj_in)
+
+    async def remove(self, db: AsyncSession, *, id: Any) -> Solution:
+        self.clear_name_cache()
+        return await super().remove(db, id=id)
+
     async def get_by_ids(self, db: AsyncSession, *, ids: List[uuid.UUID]) -> List[Solution]:
         """Get multiple solutions by their IDs."""
         result = await db.execute(select(Solution).filter(Solution.solution_id.in_(ids)))
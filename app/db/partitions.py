@@ -0,0 +1,180 @@
+import asyncio
+import re
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.async_session import AsyncSessionLocal, jst_now
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Raw event tables range partitioned by month on "timestamp" (migration c5f1a2d7e8b4)
+PARTITIONED_TABLES = ("city_eye_human_data", "city_eye_traffic_data")
+
+
+def add_months(month: date, months: int) -> date:
+    month_index = month.year * 12 + month.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(table_name: str, month: date) -> str:
+    return f"{table_name}_p{month:%Y_%m}"
+
+
+def default_partition_name(table_name: str) -> str:
+    return f"{table_name}_default"
+
+
+def current_month() -> date:
+    # Timestamps are stored as naive JST
+    return jst_now().date().replace(day=1)
+
+
+async def list_monthly_partitions(db: AsyncSession, *, table_name: str) -> List[Tuple[str, date]]:
+    """
+    Returns (partition name, first day of its month) for every monthly partition of table_name,
+    oldest first. The default partition is not included.
+    """
+    result = await db.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+            "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+            "WHERE parent.relname = :table_name"
+        ),
+        {"table_name": table_name},
+    )
+    pattern = re.compile(rf"^{re.escape(table_name)}_p(\d{{4}})_(\d{{2}})$")
+    partitions = []
+    for (name,) in result.all():
+        match = pattern.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+async def _create_monthly_partition(db: AsyncSession, *, table_name: str, name: str, start: date) -> int:
+    """
+    Creates the partition `name` of table_name for the month starting on `start`. Rows of that
+    month already in the default partition (which would make the CREATE fail) are moved into it:
+    the default partition is detached, the month's rows moved and the default attached again.
+    These statements name partitions, not table_name, so the rollup triggers do not count the
+    moved rows twice. Returns the number of moved rows.
+    """
+    end = add_months(start, 1)
+    create = (
+        f"CREATE TABLE {name} PARTITION OF {table_name} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+    default = default_partition_name(table_name)
+    in_month = f"\"timestamp\" >= '{start.isoformat()}' AND \"timestamp\" < '{end.isoformat()}'"
+
+    default_exists = (await db.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": default})).scalar()
+    if not default_exists or not (await db.execute(text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_month})"))).scalar():
+        await db.execute(text(create))
+        return 0
+
+    await db.execute(text(f"ALTER TABLE {table_name} DETACH PARTITION {default}"))
+    await db.execute(text(create))
+    result = await db.execute(text(
+        f"WITH moved AS (DELETE FROM {default} WHERE {in_month} RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+    ))
+    await db.execute(text(f"ALTER TABLE {table_name} ATTACH PARTITION {default} DEFAULT"))
+    return result.rowcount
+
+
+async def create_monthly_partitions(
+    db: AsyncSession, *, table_name: str, months_ahead: int, month: Optional[date] = None
+) -> List[str]:
+    """
+    Creates the partitions of table_name for `month` (default: the current month) and the
+    `months_ahead` months after it, so inserts never have to fall back to the default partition.
+    Each month is created in its own savepoint: a month that fails is logged and retried on the
+    next run, the others are still created. Returns the names of the partitions that were created.
+    """
+    existing = {name for name, _ in await list_monthly_partitions(db, table_name=table_name)}
+    first_month = month or current_month()
+
+    created = []
+    for offset in range(months_ahead + 1):
+        start = add_months(first_month, offset)
+        name = partition_name(table_name, start)
+        if name in existing:
+            continue
+        try:
+            async with db.begin_nested():
+                moved = await _create_monthly_partition(db, table_name=table_name, name=name, start=start)
+        except Exception as e:
+            logger.error(f"Failed to create partition {name}: {str(e)}")
+            continue
+        if moved:
+            logger.info(f"Moved {moved} rows of {table_name} from the default partition into {name}")
+        created.append(name)
+
+    await db.commit()
+    return created
+
+
+async def drop_partitions_before(
+    db: AsyncSession, *, table_name: str, cutoff: date, detach_only: bool = False
+) -> List[str]:
+    """
+    Detaches (and unless detach_only, drops) every monthly partition of table_name that ends on
+    or before `cutoff`. This replaces a DELETE of old rows: it takes no row-by-row work and leaves
+    no dead tuples behind. The rollup triggers do not fire, so hourly/daily rollups keep the history.
+    Returns the names of the affected partitions.
+    """
+    removed = []
+    for name, month in await list_monthly_partitions(db, table_name=table_name):
+        if add_months(month, 1) > cutoff:
+            continue
+        await db.execute(text(f"ALTER TABLE {table_name} DETACH PARTITION {name}"))
+        if not detach_only:
+            await db.execute(text(f"DROP TABLE {name}"))
+        removed.append(name)
+
+    await db.commit()
+    return removed
+
+
+async def maintain_partitions(db: AsyncSession) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Creates upcoming monthly partitions and, when CITY_EYE_RETENTION_MONTHS is set, drops the
+    ones that fell out of the retention window. Does nothing on databases other than PostgreSQL.
+    """
+    if db.bind.dialect.name != "postgresql": # type: ignore
+        return {}
+
+    this_month = current_month()
+    summary = {}
+    for table_name in PARTITIONED_TABLES:
+        created = await create_monthly_partitions(
+            db, table_name=table_name, months_ahead=settings.CITY_EYE_PARTITION_MONTHS_AHEAD, month=this_month
+        )
+        dropped = []
+        if settings.CITY_EYE_RETENTION_MONTHS is not None:
+            dropped = await drop_partitions_before(
+                db, table_name=table_name, cutoff=add_months(this_month, -settings.CITY_EYE_RETENTION_MONTHS)
+            )
+        if created or dropped:
+            logger.info(f"Partition maintenance for {table_name}: created {created}, dropped {dropped}")
+        summary[table_name] = {"created": created, "dropped": dropped}
+    return summary
+
+
+async def run_partition_maintenance() -> None:
+    """
+    Runs maintain_partitions every CITY_EYE_PARTITION_MAINTENANCE_INTERVAL_SECONDS until cancelled.
+    Several workers may run it at once; a worker that loses the race just logs the error.
+    """
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                await maintain_partitions(session)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"City Eye partition maintenance failed: {str(e)}")
+        await asyncio.sleep(settings.CITY_EYE_PARTITION_MAINTENANCE_INTERVAL_SECONDS)
@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.routes import (
@@ -10,6 +11,7 @@ from app.api.routes import (
     customer_solutions_router,
     device_metrics_router,
     city_eye_analytics_router,
+    city_eye_ingest_router,
     device_commands_router,
     sse_router,
     audit_logs_router,
@@ -22,6 +24,11 @@ from app.api import deps
 from app.api.middleware import RequestLoggingMiddleware
 from app.utils.logger import get_logger
 from app.middleware.throttling import GlobalThrottlingMiddleware
+from app.db.partitions import run_partition_maintenance
+from app.utils.city_eye_thresholds import run_threshold_evaluator
+from app.utils.influxdb import influx_client
+from app.utils.event_broker import event_broker
+from app.utils.job_reconciler import run_job_reconciler
 
 # Initialize logger
 logger = get_logger("app")
@@ -88,6 +95,12 @@ app.include_router(
     tags=["analytics-city-eye"],
 )
 
+app.include_router(
+    city_eye_ingest_router,
+    prefix=f"{settings.API_V1_STR}/ingest/city-eye",
+    tags=["ingest-city-eye"],
+)
+
 app.include_router(
     device_commands_router,
     prefix=f"{settings.API_V1_STR}/device-commands",
@@ -128,12 +141,37 @@ app.include_router(
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting Edge Device Management API")
+    if settings.CITY_EYE_PARTITION_MAINTENANCE_ENABLED:
+        # Keep City Eye monthly partitions created ahead of time (and old ones dropped)
+        app.state.partition_maintenance_task = asyncio.create_task(run_partition_maintenance())
+    if settings.CITY_EYE_THRESHOLD_EVALUATOR_ENABLED:
+        # Turn new hourly rollup buckets into threshold crossing events
+        app.state.threshold_evaluator_task = asyncio.create_task(run_threshold_evaluator())
+    if settings.EVENT_BROKER_BACKEND == "postgres":
+        # Relay SSE updates between this worker and the others
+        app.state.event_broker_task = asyncio.create_task(event_broker.run())
+    if settings.JOB_RECONCILER_ENABLED:
+        # Keep unfinished job statuses in line with AWS IoT
+        app.state.job_reconciler_task = asyncio.create_task(run_job_reconciler())
 
 
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down Edge Device Management API")
+    partition_maintenance_task = getattr(app.state, "partition_maintenance_task", None)
+    if partition_maintenance_task:
+        partition_maintenance_task.cancel()
+    threshold_evaluator_task = getattr(app.state, "threshold_evaluator_task", None)
+    if threshold_evaluator_task:
+        threshold_evaluator_task.cancel()
+    event_broker_task = getattr(app.state, "event_broker_task", None)
+    if event_broker_task:
+        event_broker_task.cancel()
+    job_reconciler_task = getattr(app.state, "job_reconciler_task", None)
+    if job_reconciler_task:
+        job_reconciler_task.cancel()
+    influx_client.close()
 
 
 @app.get("/")
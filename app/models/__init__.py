@@ -10,8 +10,13 @@ from app.models.customer_solution import CustomerSolution, LicenseStatus
 from app.models.device_solution import DeviceSolution
 from app.models.services.city_eye.human_table import CityEyeHumanTable
 from app.models.services.city_eye.traffic_table import CityEyeTrafficTable
+from app.models.services.city_eye.human_hourly_table import CityEyeHumanHourlyTable
+from app.models.services.city_eye.human_daily_table import CityEyeHumanDailyTable
+from app.models.services.city_eye.traffic_hourly_table import CityEyeTrafficHourlyTable
+from app.models.services.city_eye.traffic_daily_table import CityEyeTrafficDailyTable
 from app.models.services.city_eye.provisioned_human_table import CityEyeProvisionedHumanTable
 from app.models.services.city_eye.provisioned_traffic_table import CityEyeProvisionedTrafficTable
+from app.models.services.city_eye.threshold_watermark import CityEyeThresholdWatermark
 from app.models.device_command import CommandType, CommandStatus, DeviceCommand
 from app.models.password_reset_token import PasswordResetToken
 from app.models.job import Job, JobType, JobStatus
\ No newline at end of file
@@ -0,0 +1,30 @@
+from app.db.async_session import Base
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, SmallInteger, Computed, cast, func
+from sqlalchemy.dialects.postgresql import UUID
+
+
+class CityEyeHumanHourlyTable(Base):
+    """
+    Hourly rollup of city_eye_human_data, maintained by database triggers as raw rows
+    are inserted or deleted. `timestamp` is the start of the hour bucket.
+    """
+    __tablename__ = "city_eye_human_hourly"
+
+    device_id = Column(UUID(as_uuid=True), ForeignKey("devices.device_id"), primary_key=True)
+    polygon_id_in = Column(String, primary_key=True)
+    polygon_id_out = Column(String, primary_key=True)
+    timestamp = Column(DateTime, primary_key=True)
+    # Stored copies of EXTRACT(hour/dow) so day and hour filters can be served from indexes
+    hour_of_day = Column(SmallInteger, Computed(cast(func.extract('hour', timestamp), SmallInteger), persisted=True))
+    day_of_week = Column(SmallInteger, Computed(cast(func.extract('dow', timestamp), SmallInteger), persisted=True))
+
+    male_less_than_18 = Column(Integer, nullable=False, default=0)
+    female_less_than_18 = Column(Integer, nullable=False, default=0)
+    male_18_to_29 = Column(Integer, nullable=False, default=0)
+    female_18_to_29 = Column(Integer, nullable=False, default=0)
+    male_30_to_49 = Column(Integer, nullable=False, default=0)
+    female_30_to_49 = Column(Integer, nullable=False, default=0)
+    male_50_to_64 = Column(Integer, nullable=False, default=0)
+    female_50_to_64 = Column(Integer, nullable=False, default=0)
+    male_65_plus = Column(Integer, nullable=False, default=0)
+    female_65_plus = Column(Integer, nullable=False, default=0)
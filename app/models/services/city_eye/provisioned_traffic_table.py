@@ -1,6 +1,6 @@
 from app.db.async_session import Base, jst_now
 import uuid
-from sqlalchemy import Column, String, DateTime, ForeignKey, Integer
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, SmallInteger, Computed, cast, func
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -13,6 +13,9 @@ class CityEyeProvisionedTrafficTable(Base):
     device_solution_id = Column(UUID(as_uuid=True), ForeignKey("device_solutions.id"), nullable=False)
 
     timestamp = Column(DateTime, nullable=False)
+    # Stored copies of EXTRACT(hour/dow) so day and hour filters can be served from indexes
+    hour_of_day = Column(SmallInteger, Computed(cast(func.extract('hour', timestamp), SmallInteger), persisted=True))
+    day_of_week = Column(SmallInteger, Computed(cast(func.extract('dow', timestamp), SmallInteger), persisted=True))
     polygon_id_in = Column(String, nullable=False)
     polygon_id_out = Column(String, nullable=False)
     large = Column(Integer, nullable=False)
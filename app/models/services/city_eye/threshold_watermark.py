@@ -0,0 +1,15 @@
+from app.db.async_session import Base, jst_now
+from sqlalchemy import Column, String, DateTime
+
+
+class CityEyeThresholdWatermark(Base):
+    """
+    How far the threshold evaluator has read the hourly rollups, one row per kind ("human" or
+    "traffic"). `evaluated_until` is the end of the last evaluated hour bucket, so each run only
+    reads the buckets completed since.
+    """
+    __tablename__ = "city_eye_threshold_watermarks"
+
+    kind = Column(String, primary_key=True)
+    evaluated_until = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=jst_now, onupdate=jst_now)
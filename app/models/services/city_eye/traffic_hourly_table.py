@@ -0,0 +1,24 @@
+from app.db.async_session import Base
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, SmallInteger, Computed, cast, func
+from sqlalchemy.dialects.postgresql import UUID
+
+
+class CityEyeTrafficHourlyTable(Base):
+    """
+    Hourly rollup of city_eye_traffic_data, maintained by database triggers as raw rows
+    are inserted or deleted. `timestamp` is the start of the hour bucket.
+    """
+    __tablename__ = "city_eye_traffic_hourly"
+
+    device_id = Column(UUID(as_uuid=True), ForeignKey("devices.device_id"), primary_key=True)
+    polygon_id_in = Column(String, primary_key=True)
+    polygon_id_out = Column(String, primary_key=True)
+    timestamp = Column(DateTime, primary_key=True)
+    # Stored copies of EXTRACT(hour/dow) so day and hour filters can be served from indexes
+    hour_of_day = Column(SmallInteger, Computed(cast(func.extract('hour', timestamp), SmallInteger), persisted=True))
+    day_of_week = Column(SmallInteger, Computed(cast(func.extract('dow', timestamp), SmallInteger), persisted=True))
+
+    large = Column(Integer, nullable=False, default=0)
+    normal = Column(Integer, nullable=False, default=0)
+    bicycle = Column(Integer, nullable=False, default=0)
+    motorcycle = Column(Integer, nullable=False, default=0)
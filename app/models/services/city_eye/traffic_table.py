@@ -1,19 +1,25 @@
 from app.db.async_session import Base, jst_now
 import uuid
-from sqlalchemy import Column, String, DateTime, ForeignKey, Integer
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, SmallInteger, Computed, cast, func
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
 
 class CityEyeTrafficTable(Base):
     __tablename__ = "city_eye_traffic_data"
+    # Monthly range partitions on timestamp, maintained by app/db/partitions.py
+    __table_args__ = {"postgresql_partition_by": "RANGE (timestamp)"}
 
     data_id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     device_id = Column(UUID(as_uuid=True), ForeignKey("devices.device_id"), nullable=False)
     solution_id = Column(UUID(as_uuid=True), ForeignKey("solutions.solution_id"), nullable=False)
     device_solution_id = Column(UUID(as_uuid=True), ForeignKey("device_solutions.id"), nullable=False)
 
-    timestamp = Column(DateTime, nullable=False)
+    # Part of the primary key because it is the partition key
+    timestamp = Column(DateTime, primary_key=True, nullable=False)
+    # Stored copies of EXTRACT(hour/dow) so day and hour filters can be served from indexes
+    hour_of_day = Column(SmallInteger, Computed(cast(func.extract('hour', timestamp), SmallInteger), persisted=True))
+    day_of_week = Column(SmallInteger, Computed(cast(func.extract('dow', timestamp), SmallInteger), persisted=True))
     polygon_id_in = Column(String, nullable=False)
     polygon_id_out = Column(String, nullable=False)
     large = Column(Integer, nullable=False)
@@ -3,7 +3,7 @@ from app.schemas.customer import Customer, CustomerCreate, CustomerUpdate, Custo
 from app.schemas.token import Token, TokenPayload
 from app.schemas.solution import SolutionCreate, SolutionUpdate, Solution, SolutionAdminView
 from app.schemas.customer_solution import CustomerSolutionUpdate, CustomerSolution, CustomerSolutionAdminView, CustomerSolutionCreate
-from app.schemas.device_metrics import MetricsResponse
+from app.schemas.device_metrics import MetricsResponse, BatchMetricsRequest, BatchMetricsResponse
 from app.schemas.audit import (
     AuditLogFilter,
     AuditLogListResponse,
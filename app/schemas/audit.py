@@ -70,6 +70,7 @@ class AuditLogActionType(str, Enum):
     # Threshold Configuration
     THRESHOLD_CONFIG_CREATE = "THRESHOLD_CONFIG_CREATE"
     THRESHOLD_CONFIG_UPDATE = "THRESHOLD_CONFIG_UPDATE"
+    THRESHOLD_CROSSED = "THRESHOLD_CROSSED"
 
     # Job Management
     JOB_CREATE = "JOB_CREATE"
@@ -1,7 +1,11 @@
-from typing import List, Optional
-from pydantic import BaseModel
+from typing import Dict, List, Literal, Optional
+from pydantic import BaseModel, Field
 from datetime import datetime
 
+# Metric families served by the /device-metrics endpoints, each defined in app.utils.influxdb.METRIC_FAMILIES
+METRIC_FAMILY_NAMES = ("memory", "cpu", "temperature")
+MetricFamily = Literal[METRIC_FAMILY_NAMES]
+
 class MetricDataPoint(BaseModel):
     timestamp: str  # ISO format time string
     value: float
@@ -15,4 +19,22 @@ class MetricsResponse(BaseModel):
     device_name: str
     start_time: datetime
     end_time: datetime
-    interval: str
\ No newline at end of file
+    interval: str
+
+class BatchMetricsRequest(BaseModel):
+    device_names: List[str] = Field(..., min_items=1, max_items=200)
+    metrics: List[MetricFamily] = Field(default=["memory", "cpu", "temperature"], min_items=1)
+    start_time: Optional[datetime] = None  # Defaults to one hour before end_time
+    end_time: Optional[datetime] = None  # Defaults to now
+    interval: int = 5
+
+class DeviceMetricsItem(BaseModel):
+    device_name: str
+    metrics: Dict[str, List[MetricSeries]] = {}  # Metric family -> series
+    error: Optional[str] = None  # Unknown or unauthorized device, or a metric family that failed to load
+
+class BatchMetricsResponse(BaseModel):
+    devices: List[DeviceMetricsItem]
+    start_time: datetime
+    end_time: datetime
+    interval: str
@@ -1,4 +1,4 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Literal
 from pydantic import BaseModel, Field, validator
 from datetime import datetime
 import uuid
@@ -8,6 +8,9 @@ from datetime import date
 class CityEyeAnalyticsBase(BaseModel):
     pass
 
+# Which table family analytics read: live device uploads or data collected during provisioning
+AnalyticsSource = Literal["live", "provisioned"]
+
 # =============================================================================
 # SHARED SCHEMAS (used by both human and traffic analytics)
 # =============================================================================
@@ -44,6 +47,12 @@ class DetectionZoneDirection(BaseModel):
 class PerDeviceDirectionData(BaseModel):
     detectionZones: List[DetectionZoneDirection]
 
+class MetricComparison(BaseModel):
+    current: int
+    baseline: int
+    delta: int # current - baseline
+    ratio: Optional[float] = None # current / baseline, None when the baseline is 0
+
 # =============================================================================
 # HUMAN ANALYTICS SCHEMAS
 # =============================================================================
@@ -81,6 +90,15 @@ class AnalyticsFilters(BaseModel):
     polygon_ids_out: Optional[List[str]] = None
     genders: Optional[List[str]] = None # ["male", "female"]
     age_groups: Optional[List[str]] = None # ["under_18", "18_to_29", "30_to_49", "50_to_64", "over_64"]
+    source: AnalyticsSource = "live"
+
+class HumanFlowComparison(BaseModel):
+    baseline_start_time: datetime
+    baseline_end_time: datetime
+    total_count: Optional[MetricComparison] = None
+    age_distribution: Optional[Dict[str, MetricComparison]] = None
+    gender_distribution: Optional[Dict[str, MetricComparison]] = None
+    age_gender_distribution: Optional[Dict[str, MetricComparison]] = None
 
 class PerDeviceAnalyticsData(BaseModel):
     total_count: Optional[TotalCount] = None
@@ -89,6 +107,8 @@ class PerDeviceAnalyticsData(BaseModel):
     age_gender_distribution: Optional[AgeGenderDistribution] = None
     hourly_distribution: Optional[List[HourlyCount]] = None
     time_series_data: Optional[List[TimeSeriesData]] = None
+    time_series_interval_minutes: Optional[int] = None # Bucket size actually used for time_series_data
+    comparison: Optional[HumanFlowComparison] = None # Only when a baseline period was requested
 
 # =============================================================================
 # TRAFFIC ANALYTICS SCHEMAS
@@ -109,12 +129,21 @@ class TrafficAnalyticsFilters(BaseModel):
     polygon_ids_in: Optional[List[str]] = None
     polygon_ids_out: Optional[List[str]] = None
     vehicle_types: Optional[List[str]] = None # ["large", "normal", "bicycle", "motorcycle"]
+    source: AnalyticsSource = "live"
+
+class TrafficFlowComparison(BaseModel):
+    baseline_start_time: datetime
+    baseline_end_time: datetime
+    total_count: Optional[MetricComparison] = None
+    vehicle_type_distribution: Optional[Dict[str, MetricComparison]] = None
 
 class PerDeviceTrafficAnalyticsData(BaseModel):
     total_count: Optional[TotalCount] = None
     vehicle_type_distribution: Optional[VehicleTypeDistribution] = None
     hourly_distribution: Optional[List[HourlyCount]] = None
     time_series_data: Optional[List[TimeSeriesData]] = None
+    time_series_interval_minutes: Optional[int] = None # Bucket size actually used for time_series_data
+    comparison: Optional[TrafficFlowComparison] = None # Only when a baseline period was requested
 
 # =============================================================================
 # DEVICE ANALYTICS ITEMS (for per-device responses)
@@ -144,6 +173,18 @@ class DeviceDirectionItem(BaseModel):
     direction_data: PerDeviceDirectionData
     error: Optional[str] = None
 
+class AggregateAnalyticsItem(BaseModel):
+    location: Optional[str] = None # Device location of the group; None for the whole site (or devices without a location)
+    device_ids: List[uuid.UUID] # Devices summed into this item
+    analytics_data: PerDeviceAnalyticsData
+    error: Optional[str] = None
+
+class AggregateTrafficAnalyticsItem(BaseModel):
+    location: Optional[str] = None
+    device_ids: List[uuid.UUID]
+    analytics_data: PerDeviceTrafficAnalyticsData
+    error: Optional[str] = None
+
 class DirectionAnalyticsFilters(BaseModel):
     """Filters specifically for direction analytics endpoints that accept date arrays"""
     device_ids: Optional[List[uuid.UUID]] = None
@@ -152,6 +193,7 @@ class DirectionAnalyticsFilters(BaseModel):
     hours: Optional[List[str]] = None  # e.g., ["10:00", "14:00"]
     genders: Optional[List[str]] = None # ["male", "female"]
     age_groups: Optional[List[str]] = None # ["under_18", "18_to_29", "30_to_49", "50_to_64", "over_64"]
+    source: AnalyticsSource = "live"
     
     @validator('dates')
     def validate_dates(cls, v):
@@ -168,6 +210,7 @@ class TrafficDirectionAnalyticsFilters(BaseModel):
     days: Optional[List[str]] = None  # e.g., ["sunday", "monday"]
     hours: Optional[List[str]] = None  # e.g., ["10:00", "14:00"]
     vehicle_types: Optional[List[str]] = None # ["large", "normal", "bicycle", "motorcycle"]
+    source: AnalyticsSource = "live"
     
     @validator('dates')
     def validate_dates(cls, v):
@@ -177,6 +220,21 @@ class TrafficDirectionAnalyticsFilters(BaseModel):
         return v
 
 
+# =============================================================================
+# INGESTION SCHEMAS
+# =============================================================================
+
+class IngestRowError(BaseModel):
+    row: Optional[int] = None  # 0-based index in the submitted batch; None when the error concerns a whole device
+    error: str
+
+class CityEyeIngestResponse(BaseModel):
+    received: int
+    inserted: int
+    duplicates: int  # Repeated within the batch or already stored
+    rejected: int
+    errors: List[IngestRowError] = []  # The first rejected rows only
+
 
 # =============================================================================
 # RESPONSE TYPES
@@ -188,5 +246,9 @@ CityEyeAnalyticsPerDeviceResponse = List[DeviceAnalyticsItem]
 # Traffic analytics response (list of devices with traffic flow data)
 CityEyeTrafficAnalyticsPerDeviceResponse = List[DeviceTrafficAnalyticsItem]
 
+# Cross-device analytics responses (one item for the site, or one per device location)
+CityEyeAggregateAnalyticsResponse = List[AggregateAnalyticsItem]
+CityEyeAggregateTrafficAnalyticsResponse = List[AggregateTrafficAnalyticsItem]
+
 # Human direction analytics response (list of devices with direction data)
 CityEyeDirectionPerDeviceResponse = List[DeviceDirectionItem]
\ No newline at end of file
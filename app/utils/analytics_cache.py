@@ -0,0 +1,371 @@
+import functools
+import hashlib
+import json
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, time as dt_time
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+from pydantic import BaseModel
+from app.core.config import settings
+from app.utils.event_broker import event_broker
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Filter list fields whose values are matched case-insensitively by crud_city_eye_analytics
+CASE_INSENSITIVE_FIELDS = {"days", "genders", "age_groups", "vehicle_types"}
+
+# Ranges ending within this window of now may still receive (late) device uploads
+LIVE_WINDOW = timedelta(hours=1)
+
+# Event broker channel handing new device generations to the per-process caches of every worker
+ANALYTICS_CACHE_GENERATIONS_CHANNEL = "analytics_cache_generations"
+
+
+def dump_cache_value(value: Any) -> bytes:
+    """
+    Encodes a result as JSON for a shared cache. Dicts with non-string keys, tuples, datetimes,
+    dates, UUIDs and Decimals are tagged so load_cache_value rebuilds them; other types raise
+    TypeError. Unlike pickle, reading the value back cannot run code.
+    """
+    return json.dumps(_tag_value(value), separators=(",", ":")).encode()
+
+
+def load_cache_value(raw: bytes) -> Any:
+    return json.loads(raw, object_hook=_untag_object)
+
+
+def _tag_value(value: Any) -> Any:
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, list):
+        return [_tag_value(item) for item in value]
+    if isinstance(value, dict):
+        if "__type__" not in value and all(isinstance(key, str) for key in value):
+            return {key: _tag_value(item) for key, item in value.items()}
+        return {"__type__": "dict", "items": [[_tag_value(key), _tag_value(item)] for key, item in value.items()]}
+    if isinstance(value, tuple):
+        return {"__type__": "tuple", "items": [_tag_value(item) for item in value]}
+    # datetime is a date subclass, check it first
+    if isinstance(value, datetime):
+        return {"__type__": "datetime", "value": value.isoformat()}
+    if isinstance(value, date):
+        return {"__type__": "date", "value": value.isoformat()}
+    if isinstance(value, uuid.UUID):
+        return {"__type__": "uuid", "value": str(value)}
+    if isinstance(value, Decimal):
+        return {"__type__": "decimal", "value": str(value)}
+    raise TypeError(f"Cannot cache values of type {type(value).__name__}")
+
+
+def _untag_object(obj: Dict[str, Any]) -> Any:
+    tag = obj.get("__type__")
+    if tag is None:
+        return obj
+    if tag == "dict":
+        return {key: item for key, item in obj["items"]}
+    if tag == "tuple":
+        return tuple(obj["items"])
+    if tag == "datetime":
+        return datetime.fromisoformat(obj["value"])
+    if tag == "date":
+        return date.fromisoformat(obj["value"])
+    if tag == "uuid":
+        return uuid.UUID(obj["value"])
+    if tag == "decimal":
+        return Decimal(obj["value"])
+    raise ValueError(f"Unknown cached value type {tag}")
+
+
+class CacheBackend(ABC):
+    """
+    Storage for cached results. Keys are strings, values are results made of dicts, lists,
+    scalars, datetimes, dates, UUIDs and Decimals (see dump_cache_value).
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        """Returns the cached value or None on a miss."""
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl_seconds: int) -> None:
+        """Stores a value for ttl_seconds."""
+
+    async def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        """Returns the cached value or None for each key."""
+        return [await self.get(key) for key in keys]
+
+    async def set_many(self, values: Dict[str, Any], ttl_seconds: int) -> None:
+        """Stores several values for ttl_seconds."""
+        for key, value in values.items():
+            await self.set(key, value, ttl_seconds)
+
+    @abstractmethod
+    async def clear(self) -> None:
+        """Removes every cached value."""
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """
+    Per-process LRU cache. Values are returned as stored, so callers must not mutate them.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any, ttl_seconds: int) -> None:
+        self.set_nowait(key, value, ttl_seconds)
+
+    def set_nowait(self, key: str, value: Any, ttl_seconds: int) -> None:
+        self._entries[key] = (time.monotonic() + ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Cache shared by all workers through Redis. Requires the optional `redis` package. Values
+    are stored as JSON (dump_cache_value by default), never pickled: anyone able to write to
+    the Redis server must not be able to run code in the API.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        prefix: str = "city_eye_analytics:",
+        dumps: Callable[[Any], Any] = dump_cache_value,
+        loads: Callable[[Any], Any] = load_cache_value,
+    ):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("ANALYTICS_CACHE_BACKEND=redis requires the 'redis' package") from e
+        self.prefix = prefix
+        self._dumps = dumps
+        self._loads = loads
+        self._client = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self._client.get(self.prefix + key)
+        return self._loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl_seconds: int) -> None:
+        await self._client.set(self.prefix + key, self._dumps(value), ex=ttl_seconds)
+
+    async def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        if not keys:
+            return []
+        raws = await self._client.mget([self.prefix + key for key in keys])
+        return [self._loads(raw) if raw is not None else None for raw in raws]
+
+    async def set_many(self, values: Dict[str, Any], ttl_seconds: int) -> None:
+        # One round trip instead of one per value
+        async with self._client.pipeline(transaction=False) as pipe:
+            for key, value in values.items():
+                pipe.set(self.prefix + key, self._dumps(value), ex=ttl_seconds)
+            await pipe.execute()
+
+    async def clear(self) -> None:
+        async for key in self._client.scan_iter(match=f"{self.prefix}*"):
+            await self._client.delete(key)
+
+
+class AnalyticsCache:
+    """
+    Caches analytics results keyed by a canonical hash of the filters, so that equivalent filter
+    bodies (e.g. device_ids in another order) share an entry. Ranges that reach into the present
+    get a short TTL, fully historical ones a long TTL.
+
+    Keys also hold the current generation of every device in filters.device_ids, stored in the
+    backend. invalidate_devices gives devices whose data changed a new generation, so results
+    computed from their old data are no longer found (and expire).
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def make_key(
+        self, namespace: str, filters: BaseModel, generations: Optional[Dict[str, Optional[str]]] = None, **params: Any
+    ) -> str:
+        canonical = {
+            "namespace": namespace,
+            "filters": self._normalize_filters(filters),
+            "params": {name: self._normalize_value(value) for name, value in params.items()},
+            "generations": generations or {},
+        }
+        return hashlib.sha256(json.dumps(canonical, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get_ttl(self, filters: BaseModel) -> int:
+        range_end = self._get_range_end(filters)
+        if range_end is None:
+            return settings.ANALYTICS_CACHE_LIVE_TTL_SECONDS
+
+        if range_end.tzinfo is None:
+            # Naive timestamps are stored in JST
+            now = datetime.now(ZoneInfo("Asia/Tokyo")).replace(tzinfo=None)
+        else:
+            now = datetime.now(range_end.tzinfo)
+
+        if range_end > now - LIVE_WINDOW:
+            return settings.ANALYTICS_CACHE_LIVE_TTL_SECONDS
+        return settings.ANALYTICS_CACHE_HISTORICAL_TTL_SECONDS
+
+    async def get_or_compute(
+        self, namespace: str, filters: BaseModel, compute: Callable[[], Awaitable[Any]], **params: Any
+    ) -> Any:
+        if not settings.ANALYTICS_CACHE_ENABLED:
+            return await compute()
+
+        key: Optional[str] = None
+        try:
+            device_ids = sorted({str(device_id) for device_id in getattr(filters, "device_ids", None) or []})
+            generations = await self.backend.get_many([self._generation_key(device_id) for device_id in device_ids])
+            key = self.make_key(namespace, filters, dict(zip(device_ids, generations)), **params)
+            cached = await self.backend.get(key)
+        except Exception as e:
+            # A cache outage must never fail the request; without the generations nothing is cached
+            self.errors += 1
+            logger.warning(f"Analytics cache read failed for {namespace}: {str(e)}")
+            cached = None
+
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        result = await compute()
+        if key is None:
+            return result
+        try:
+            await self.backend.set(key, result, self.get_ttl(filters))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Analytics cache write failed for {namespace}: {str(e)}")
+        return result
+
+    async def invalidate_devices(self, device_ids: Iterable[uuid.UUID]) -> None:
+        """
+        Gives the devices a new generation after their data changed (ingest, delete). Generations
+        outlive every result computed before them. A per-process backend gets them in every
+        worker through the event broker.
+        """
+        generations = {self._generation_key(str(device_id)): uuid.uuid4().hex for device_id in set(device_ids)}
+        if not generations:
+            return
+        if isinstance(self.backend, InMemoryCacheBackend):
+            # Applied right away here; delivered again by the broker, which is harmless
+            self.apply_generations(generations)
+            event_broker.publish(ANALYTICS_CACHE_GENERATIONS_CHANNEL, {"generations": generations})
+            return
+        try:
+            await self.backend.set_many(generations, settings.ANALYTICS_CACHE_HISTORICAL_TTL_SECONDS)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Analytics cache invalidation failed for {len(generations)} devices: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        stats = {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+        if isinstance(self.backend, InMemoryCacheBackend):
+            stats["entries"] = len(self.backend)
+            stats["max_entries"] = self.backend.max_entries
+        return stats
+
+    def apply_generations(self, generations: Dict[str, str]) -> None:
+        """Stores generations published by invalidate_devices in a per-process backend."""
+        if isinstance(self.backend, InMemoryCacheBackend):
+            for key, generation in generations.items():
+                self.backend.set_nowait(key, generation, settings.ANALYTICS_CACHE_HISTORICAL_TTL_SECONDS)
+
+    def _generation_key(self, device_id: str) -> str:
+        return f"generation:{device_id}"
+
+    def _normalize_filters(self, filters: BaseModel) -> Dict[str, Any]:
+        normalized = {}
+        for name, value in filters.model_dump(mode="json").items():
+            if isinstance(value, list):
+                if name in CASE_INSENSITIVE_FIELDS:
+                    value = [item.lower() if isinstance(item, str) else item for item in value]
+                value = sorted(set(value), key=str)
+            normalized[name] = value
+        return normalized
+
+    def _normalize_value(self, value: Any) -> Any:
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return sorted(value, key=str)
+        if isinstance(value, dict):
+            # JSON object keys must be strings (e.g. device_id -> group mappings)
+            return {str(key): self._normalize_value(item) for key, item in value.items()}
+        return value
+
+    def _get_range_end(self, filters: BaseModel) -> Optional[datetime]:
+        end_time = getattr(filters, "end_time", None)
+        if end_time is not None:
+            return end_time
+        dates = getattr(filters, "dates", None)
+        if dates:
+            return datetime.combine(max(dates), dt_time.min) + timedelta(days=1)
+        return None
+
+
+def _create_backend() -> CacheBackend:
+    if settings.ANALYTICS_CACHE_BACKEND == "redis":
+        return RedisCacheBackend(settings.ANALYTICS_CACHE_REDIS_URL)
+    return InMemoryCacheBackend(max_entries=settings.ANALYTICS_CACHE_MAX_ENTRIES)
+
+
+analytics_cache = AnalyticsCache(_create_backend())
+
+
+def _apply_generations(event: Dict[str, Any]) -> None:
+    analytics_cache.apply_generations(event["generations"])
+
+
+event_broker.subscribe(ANALYTICS_CACHE_GENERATIONS_CHANNEL, _apply_generations)
+
+
+def cached_analytics(namespace: str):
+    """
+    Caches an async `method(self, db, *, filters, **params)` in analytics_cache. The extra keyword
+    params are part of the cache key.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(self, db, *, filters, **params):
+            return await analytics_cache.get_or_compute(
+                namespace, filters, lambda: method(self, db, filters=filters, **params), **params
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,134 @@
+from datetime import date, datetime, timedelta, time as dt_time
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import Date, and_, func, or_
+
+# Day names to EXTRACT(DOW ...) numbers (0=Sunday ... 6=Saturday), as stored in day_of_week
+DAY_OF_WEEK_NUMBERS = {
+    "sunday": 0, "monday": 1, "tuesday": 2, "wednesday": 3,
+    "thursday": 4, "friday": 5, "saturday": 6,
+}
+
+# Up to this many merged date ranges are ORed together. Longer date lists become one bounding range
+# plus date(timestamp) IN (...), which keeps the statement shape (and SQLAlchemy's compiled cache key)
+# independent of the number of dates.
+MAX_OR_DATE_RANGES = 4
+
+
+def parse_hours(hours: Optional[Iterable[str]]) -> List[int]:
+    """
+    Returns the distinct valid hours of "HH:MM" strings, sorted. Invalid entries are ignored.
+    """
+    hour_numbers = set()
+    for hour_str in hours or []:
+        try:
+            hour = int(str(hour_str).split(':')[0])
+        except ValueError:
+            continue
+        if 0 <= hour <= 23:
+            hour_numbers.add(hour)
+    return sorted(hour_numbers)
+
+
+def parse_days(days: Optional[Iterable[str]]) -> List[int]:
+    """
+    Returns the distinct day_of_week numbers of day names (case-insensitive), sorted. Unknown names are ignored.
+    """
+    return sorted({DAY_OF_WEEK_NUMBERS[day.lower()] for day in days or [] if day.lower() in DAY_OF_WEEK_NUMBERS})
+
+
+def merge_date_ranges(dates: Iterable[date]) -> List[Tuple[datetime, datetime]]:
+    """
+    Collapses dates into [start, end) datetime ranges, merging consecutive days.
+    """
+    ranges: List[Tuple[datetime, datetime]] = []
+    for single_date in sorted(set(dates)):
+        start = datetime.combine(single_date, dt_time.min)
+        end = start + timedelta(days=1)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+class CompiledFilters:
+    """
+    The row-level part of an analytics filter schema (AnalyticsFilters, TrafficAnalyticsFilters and
+    the direction variants), validated and normalized once so every query of a request reuses it.
+    Value lists are sorted and de-duplicated and rendered as expanding IN parameters.
+    """
+
+    def __init__(
+        self,
+        *,
+        device_ids: Sequence[Any] = (),
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        dates: Sequence[date] = (),
+        polygon_ids_in: Sequence[str] = (),
+        polygon_ids_out: Sequence[str] = (),
+        day_numbers: Sequence[int] = (),
+        hour_numbers: Sequence[int] = (),
+    ):
+        self.device_ids = list(device_ids)
+        self.start_time = start_time
+        self.end_time = end_time
+        self.dates = sorted(set(dates))
+        self.date_ranges = merge_date_ranges(self.dates)
+        self.polygon_ids_in = list(polygon_ids_in)
+        self.polygon_ids_out = list(polygon_ids_out)
+        self.day_numbers = list(day_numbers)
+        self.hour_numbers = list(hour_numbers)
+
+    def conditions(self, table) -> List[Any]:
+        """
+        Returns the WHERE conditions for `table` (any table or subquery with the raw column names).
+        """
+        conditions = []
+        if self.device_ids:
+            conditions.append(table.device_id.in_(self.device_ids))
+        if self.start_time:
+            conditions.append(table.timestamp >= self.start_time)
+        if self.end_time:
+            conditions.append(table.timestamp < self.end_time)
+        if self.date_ranges:
+            if len(self.date_ranges) <= MAX_OR_DATE_RANGES:
+                conditions.append(or_(*[
+                    and_(table.timestamp >= start, table.timestamp < end) for start, end in self.date_ranges
+                ]))
+            else:
+                # The bounding range keeps index and partition pruning, the IN list selects the days
+                conditions.append(table.timestamp >= self.date_ranges[0][0])
+                conditions.append(table.timestamp < self.date_ranges[-1][1])
+                conditions.append(func.date(table.timestamp, type_=Date).in_(self.dates))
+        if self.polygon_ids_in:
+            conditions.append(table.polygon_id_in.in_(self.polygon_ids_in))
+        if self.polygon_ids_out:
+            conditions.append(table.polygon_id_out.in_(self.polygon_ids_out))
+        if self.day_numbers:
+            conditions.append(table.day_of_week.in_(self.day_numbers))
+        if self.hour_numbers:
+            conditions.append(table.hour_of_day.in_(self.hour_numbers))
+        return conditions
+
+    def apply(self, query, table):
+        conditions = self.conditions(table)
+        return query.filter(*conditions) if conditions else query
+
+
+def compile_filters(filters) -> CompiledFilters:
+    """
+    Compiles any of the analytics filter schemas. A CompiledFilters is returned unchanged.
+    """
+    if isinstance(filters, CompiledFilters):
+        return filters
+    return CompiledFilters(
+        device_ids=sorted(set(getattr(filters, "device_ids", None) or []), key=str),
+        start_time=getattr(filters, "start_time", None),
+        end_time=getattr(filters, "end_time", None),
+        dates=getattr(filters, "dates", None) or [],
+        polygon_ids_in=sorted(set(getattr(filters, "polygon_ids_in", None) or [])),
+        polygon_ids_out=sorted(set(getattr(filters, "polygon_ids_out", None) or [])),
+        day_numbers=parse_days(getattr(filters, "days", None)),
+        hour_numbers=parse_hours(getattr(filters, "hours", None)),
+    )
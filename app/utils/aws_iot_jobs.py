@@ -2,7 +2,7 @@
 import boto3
 import json
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from app.core.config import settings
 from app.utils.logger import get_logger
 import uuid
@@ -177,6 +177,33 @@ class IoTJobsService:
             logger.error(f"Error getting job execution status: {str(e)}")
             raise
 
+    def list_job_execution_statuses_for_thing(
+        self,
+        thing_name: str,
+        next_token: Optional[str] = None
+    ) -> Tuple[Dict[str, str], Optional[str]]:
+        """
+        Get the status of one page of a thing's job executions, by job id, with the token of the
+        next page (None on the last one)
+        """
+        try:
+            kwargs = {"thingName": thing_name, "maxResults": 100}
+            if next_token:
+                kwargs["nextToken"] = next_token
+            response = self.iot_client.list_job_executions_for_thing(**kwargs)
+            statuses = {
+                summary['jobId']: summary.get('jobExecutionSummary', {}).get('status')
+                for summary in response.get('executionSummaries', [])
+            }
+            return statuses, response.get('nextToken')
+
+        except self.iot_client.exceptions.ResourceNotFoundException:
+            logger.warning(f"Thing not found when listing job executions: {thing_name}")
+            return {}, None
+        except Exception as e:
+            logger.error(f"Error listing job executions for thing {thing_name}: {str(e)}")
+            raise
+
     def cancel_job(self, job_id: str, reason: str = "Canceled by user") -> bool:
         """
         Cancel a job
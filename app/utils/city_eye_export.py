@@ -0,0 +1,147 @@
+import csv
+import io
+import json
+from typing import Any, Dict, List, Sequence, Tuple
+
+# format -> (media type, file extension)
+EXPORT_FORMATS: Dict[str, Tuple[str, str]] = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def _format_value(value: Any) -> Any:
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if value is not None and not isinstance(value, (str, int, float)):
+        return str(value)  # UUIDs
+    return value
+
+
+class CsvExportEncoder:
+    """Encodes row chunks as CSV with a header line."""
+
+    def __init__(self, columns: Sequence[str]):
+        self.columns = list(columns)
+
+    def _write(self, rows) -> bytes:
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerows(rows)
+        return output.getvalue().encode()
+
+    def begin(self) -> bytes:
+        return self._write([self.columns])
+
+    def encode(self, rows: Sequence[Sequence[Any]]) -> bytes:
+        return self._write([[_format_value(value) for value in row] for row in rows])
+
+    def end(self) -> bytes:
+        return b""
+
+
+class NdjsonExportEncoder:
+    """Encodes row chunks as one JSON object per line."""
+
+    def __init__(self, columns: Sequence[str]):
+        self.columns = list(columns)
+
+    def begin(self) -> bytes:
+        return b""
+
+    def encode(self, rows: Sequence[Sequence[Any]]) -> bytes:
+        return "".join(
+            json.dumps({column: _format_value(value) for column, value in zip(self.columns, row)}) + "\n"
+            for row in rows
+        ).encode()
+
+    def end(self) -> bytes:
+        return b""
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file that hands out whatever was written since the last drain(), so the Arrow and
+    Parquet writers can stream without holding the whole file. tell() keeps counting from the start
+    of the file, which Parquet needs for its footer offsets.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class ArrowExportEncoder:
+    """
+    Encodes row chunks as record batches of an Arrow IPC stream, or as row groups of a Parquet
+    file. Requires the optional `pyarrow` package.
+    """
+
+    def __init__(self, columns: Sequence[str], *, parquet: bool = False):
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise RuntimeError("Arrow and Parquet exports require the 'pyarrow' package") from e
+        self._pa = pa
+        self.columns = list(columns)
+        self.parquet = parquet
+        self.schema = pa.schema([
+            (column, pa.string() if column in ("device_id", "polygon_id_in", "polygon_id_out")
+             else pa.timestamp("us") if column == "timestamp" else pa.int64())
+            for column in self.columns
+        ])
+        self._sink = _ChunkSink()
+        self._writer = None
+
+    def begin(self) -> bytes:
+        if self.parquet:
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(self._sink, self.schema)
+        else:
+            self._writer = self._pa.ipc.new_stream(self._sink, self.schema)
+        return self._sink.drain()
+
+    def encode(self, rows: Sequence[Sequence[Any]]) -> bytes:
+        arrays = []
+        for index, field in enumerate(self.schema):
+            values = [row[index] for row in rows]
+            if field.name == "device_id":
+                values = [str(value) for value in values]
+            arrays.append(self._pa.array(values, type=field.type))
+        self._writer.write_batch(self._pa.record_batch(arrays, schema=self.schema))
+        return self._sink.drain()
+
+    def end(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+def create_export_encoder(format: str, columns: Sequence[str]):
+    """
+    Returns the encoder for an EXPORT_FORMATS format. Raises RuntimeError when the format needs an
+    optional package that is not installed.
+    """
+    if format == "csv":
+        return CsvExportEncoder(columns)
+    if format == "ndjson":
+        return NdjsonExportEncoder(columns)
+    return ArrowExportEncoder(columns, parquet=format == "parquet")
@@ -0,0 +1,203 @@
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+HUMAN_COUNT_COLUMNS = (
+    "male_less_than_18", "female_less_than_18", "male_18_to_29", "female_18_to_29",
+    "male_30_to_49", "female_30_to_49", "male_50_to_64", "female_50_to_64",
+    "male_65_plus", "female_65_plus",
+)
+TRAFFIC_COUNT_COLUMNS = ("large", "normal", "bicycle", "motorcycle")
+
+KEY_COLUMNS = ("device_id", "timestamp", "polygon_id_in", "polygon_id_out")
+
+# Only the first rejections are reported back, the rest are just counted
+MAX_REPORTED_ERRORS = 100
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+# No row encodes in fewer bytes (its device UUID alone takes 36), so a body of n bytes holds at
+# most n // MIN_ROW_BYTES rows
+MIN_ROW_BYTES = 64
+
+
+class IngestPayloadError(ValueError):
+    """The payload as a whole cannot be parsed (as opposed to individual invalid rows)."""
+
+
+class IngestBackpressure:
+    """
+    Per-worker bound on the number of ingested rows held in memory (parsed but not yet committed).
+    Batches that would exceed it are refused instead of queued, so a slow database turns into
+    429 responses for the edge devices rather than unbounded memory growth.
+    """
+
+    def __init__(self, max_rows: int):
+        self.max_rows = max_rows
+        self.in_flight = 0
+
+    def try_reserve(self, rows: int) -> bool:
+        # Single-threaded event loop: check and increment cannot interleave
+        if self.in_flight and self.in_flight + rows > self.max_rows:
+            return False
+        self.in_flight += rows
+        return True
+
+    def release(self, rows: int) -> None:
+        self.in_flight = max(0, self.in_flight - rows)
+
+
+def parse_columns(body: bytes, content_type: Optional[str], columns: Tuple[str, ...]) -> Dict[str, List[Any]]:
+    """
+    Parses an NDJSON body (one row object per line) or a columnar JSON body
+    ({"device_id": [...], "timestamp": [...], ...} with equally long lists) into columns.
+    Raises IngestPayloadError when the body is malformed as a whole.
+    """
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type in NDJSON_CONTENT_TYPES:
+        rows = []
+        for line_number, line in enumerate(body.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise IngestPayloadError(f"Line {line_number} is not valid JSON: {str(e)}")
+            if not isinstance(row, dict):
+                raise IngestPayloadError(f"Line {line_number} is not a JSON object")
+            rows.append(row)
+        # Transpose once so validation works column by column
+        return {column: [row.get(column) for row in rows] for column in columns}
+
+    try:
+        payload = json.loads(body)
+    except json.JSONDecodeError as e:
+        raise IngestPayloadError(f"Body is not valid JSON: {str(e)}")
+    if not isinstance(payload, dict):
+        raise IngestPayloadError("Columnar payload must be a JSON object of column lists")
+
+    missing = [column for column in columns if not isinstance(payload.get(column), list)]
+    if missing:
+        raise IngestPayloadError(f"Columnar payload is missing column lists: {', '.join(missing)}")
+    lengths = {len(payload[column]) for column in columns}
+    if len(lengths) > 1:
+        raise IngestPayloadError("All column lists must have the same length")
+    return {column: payload[column] for column in columns}
+
+
+def _parse_uuid(value: Any) -> uuid.UUID:
+    if not isinstance(value, str):
+        raise ValueError("device_id must be a UUID string")
+    return uuid.UUID(value)
+
+
+def _parse_timestamp(value: Any) -> datetime:
+    if not isinstance(value, str):
+        raise ValueError("timestamp must be an ISO 8601 string")
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        # Timestamps are stored as naive JST
+        parsed = parsed.astimezone(ZoneInfo("Asia/Tokyo")).replace(tzinfo=None)
+    return parsed
+
+
+def _value_key(value: Any) -> Any:
+    # Non-string JSON values (numbers, lists, null) are keyed by type and repr so they never collide with strings
+    return value if isinstance(value, str) else (type(value).__name__, repr(value))
+
+
+def _parse_distinct(values: List[Any], parser) -> Dict[Any, Any]:
+    """
+    Parses every distinct value once; batches repeat the same devices and timestamps many times.
+    Unparseable values map to the ValueError describing them.
+    """
+    parsed: Dict[Any, Any] = {}
+    for value in values:
+        key = _value_key(value)
+        if key in parsed:
+            continue
+        try:
+            parsed[key] = parser(value)
+        except (ValueError, TypeError, AttributeError) as e:
+            parsed[key] = ValueError(str(e) or "invalid value")
+    return parsed
+
+
+def validate_columns(
+    columns: Dict[str, List[Any]],
+    count_columns: Tuple[str, ...],
+    timestamp_range: Optional[Tuple[datetime, datetime]] = None,
+) -> Tuple[Dict[str, List[Any]], List[Dict[str, Any]], int]:
+    """
+    Validates and converts parsed columns one column at a time. With timestamp_range (naive JST
+    bounds, both included) rows timestamped outside of it are rejected. Returns the valid rows as
+    columns, the reported errors ({"row": index, "error": message}) and the number of rejected rows.
+    """
+    row_count = len(columns["device_id"])
+    row_errors: Dict[int, str] = {}
+
+    def reject(index: int, message: str) -> None:
+        row_errors.setdefault(index, message)
+
+    converted: Dict[str, List[Any]] = {}
+    for column, parser in (("device_id", _parse_uuid), ("timestamp", _parse_timestamp)):
+        values = columns[column]
+        parsed = _parse_distinct(values, parser)
+        converted_values = []
+        for index, value in enumerate(values):
+            result = parsed[_value_key(value)]
+            if isinstance(result, ValueError):
+                reject(index, f"Invalid {column}: {str(result)}")
+                result = None
+            converted_values.append(result)
+        converted[column] = converted_values
+
+    if timestamp_range:
+        earliest, latest = timestamp_range
+        for index, timestamp in enumerate(converted["timestamp"]):
+            if timestamp is not None and not earliest <= timestamp <= latest:
+                reject(index, f"Invalid timestamp: outside {earliest.isoformat()} to {latest.isoformat()}")
+
+    for column in ("polygon_id_in", "polygon_id_out"):
+        values = columns[column]
+        for index, value in enumerate(values):
+            if isinstance(value, int) and not isinstance(value, bool):
+                value = str(value)
+            if not isinstance(value, str) or not value:
+                reject(index, f"Invalid {column}: must be a non-empty string")
+        converted[column] = [str(value) if value is not None else None for value in values]
+
+    for column in count_columns:
+        values = columns[column]
+        for index, value in enumerate(values):
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                reject(index, f"Invalid {column}: must be a non-negative integer")
+        converted[column] = values
+
+    valid_indexes = [index for index in range(row_count) if index not in row_errors]
+    valid = {column: [values[index] for index in valid_indexes] for column, values in converted.items()}
+    errors = [
+        {"row": index, "error": message}
+        for index, message in sorted(row_errors.items())[:MAX_REPORTED_ERRORS]
+    ]
+    return valid, errors, len(row_errors)
+
+
+def deduplicate_rows(columns: Dict[str, List[Any]]) -> Tuple[Dict[str, List[Any]], int]:
+    """
+    Keeps the last row for every (device_id, timestamp, polygon_id_in, polygon_id_out) key of the
+    batch. Returns the remaining rows as columns and the number of dropped duplicates.
+    """
+    row_count = len(columns["device_id"])
+    last_index_by_key: Dict[Tuple[Any, ...], int] = {}
+    for index, key in enumerate(zip(*(columns[column] for column in KEY_COLUMNS))):
+        last_index_by_key[key] = index
+
+    if len(last_index_by_key) == row_count:
+        return columns, 0
+
+    kept = sorted(last_index_by_key.values())
+    return {column: [values[index] for index in kept] for column, values in columns.items()}, row_count - len(kept)
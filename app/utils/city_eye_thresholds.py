@@ -0,0 +1,155 @@
+import asyncio
+import uuid
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.routes.sse import notify_threshold_crossing
+from app.core.config import settings
+from app.crud import solution as crud_solution
+from app.crud.audit_log import audit_log as crud_audit_log
+from app.crud.crud_city_eye_thresholds import THRESHOLD_SOURCES, crud_city_eye_thresholds
+from app.db.async_session import AsyncSessionLocal, jst_now
+from app.schemas.audit import AuditLogActionType, AuditLogCreate, AuditLogResourceType
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Thresholds are compared with per-device totals of one hourly rollup bucket
+BUCKET = timedelta(hours=1)
+
+
+def threshold_level(count: int, thresholds: List[float]) -> int:
+    """Number of the (sorted) thresholds that count has reached."""
+    return bisect_right(thresholds, count)
+
+
+def find_crossings(
+    rows: List[Tuple[uuid.UUID, uuid.UUID, datetime, int]],
+    thresholds_by_customer: Dict[uuid.UUID, List[float]],
+    *,
+    kind: str,
+    start_time: datetime,
+    end_time: datetime,
+) -> List[Dict[str, Any]]:
+    """
+    Compares every bucket in [start_time, end_time) with the bucket before it, per device.
+    `rows` are (customer_id, device_id, bucket start, total) and must include the bucket before
+    start_time; buckets without a row count as 0. Returns one event per device and bucket whose
+    count moved past one or more thresholds, in either direction.
+    """
+    totals: Dict[Tuple[uuid.UUID, uuid.UUID], Dict[datetime, int]] = defaultdict(dict)
+    for customer_id, device_id, bucket_start, total in rows:
+        totals[(customer_id, device_id)][bucket_start] = total
+
+    events = []
+    for (customer_id, device_id), counts in totals.items():
+        thresholds = thresholds_by_customer[customer_id]
+        previous_count = counts.get(start_time - BUCKET, 0)
+        previous_level = threshold_level(previous_count, thresholds)
+        bucket_start = start_time
+        while bucket_start < end_time:
+            count = counts.get(bucket_start, 0)
+            level = threshold_level(count, thresholds)
+            if level != previous_level:
+                events.append({
+                    "kind": kind,
+                    "customer_id": str(customer_id),
+                    "device_id": str(device_id),
+                    "bucket_start": bucket_start.isoformat(),
+                    "bucket_end": (bucket_start + BUCKET).isoformat(),
+                    "count": count,
+                    "previous_count": previous_count,
+                    "direction": "up" if level > previous_level else "down",
+                    "thresholds_crossed": thresholds[min(level, previous_level):max(level, previous_level)],
+                })
+            previous_count, previous_level = count, level
+            bucket_start += BUCKET
+    return events
+
+
+async def _evaluate_kind(
+    db: AsyncSession, *, kind: str, thresholds_by_customer: Dict[uuid.UUID, List[float]], cutoff: datetime
+) -> List[Dict[str, Any]]:
+    """
+    Evaluates the buckets of `kind` completed since its watermark and records the crossings in the
+    audit log in the same transaction that advances the watermark.
+    """
+    # The first run only sets the watermark, history is not replayed
+    watermark = await crud_city_eye_thresholds.lock_watermark(db, kind=kind, initial=cutoff)
+    if watermark is None:
+        logger.debug(f"City Eye {kind} thresholds are being evaluated by another worker")
+        return []
+
+    start_time = max(
+        watermark.evaluated_until, cutoff - timedelta(hours=settings.CITY_EYE_THRESHOLD_MAX_CATCHUP_HOURS)
+    )
+    if start_time >= cutoff:
+        await db.rollback()
+        return []
+
+    rows = await crud_city_eye_thresholds.get_hourly_totals(
+        db, kind=kind, customer_ids=set(thresholds_by_customer), start_time=start_time - BUCKET, end_time=cutoff
+    )
+    events = find_crossings(rows, thresholds_by_customer, kind=kind, start_time=start_time, end_time=cutoff)
+
+    crud_audit_log.add_many(db, objs_in=[
+        AuditLogCreate(
+            user_id=None,
+            action_type=AuditLogActionType.THRESHOLD_CROSSED,
+            resource_type=AuditLogResourceType.DEVICE,
+            resource_id=event["device_id"],
+            details=event,
+        )
+        for event in events
+    ])
+    watermark.evaluated_until = cutoff
+    await db.commit()
+    return events
+
+
+async def evaluate_thresholds(db: AsyncSession, *, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """
+    Evaluates the hour buckets completed since the last run against every customer's City Eye
+    thresholds, with one rollup query per kind for all customers. Crossings are written to the
+    audit log and pushed to the customers' threshold SSE streams. Returns the crossing events.
+    """
+    solution_id = await crud_solution.get_id_by_name_cached(db, name="City Eye")
+    if not solution_id:
+        return []
+    thresholds = await crud_city_eye_thresholds.get_customer_thresholds(db, solution_id=solution_id)
+
+    # Timestamps are stored as naive JST. Buckets are evaluated once they have settled, so
+    # uploads arriving a little late are still counted.
+    now = now or jst_now().replace(tzinfo=None)
+    settled = now - timedelta(seconds=settings.CITY_EYE_THRESHOLD_SETTLE_SECONDS)
+    cutoff = settled.replace(minute=0, second=0, microsecond=0)
+
+    events = []
+    for kind in THRESHOLD_SOURCES:
+        kind_events = await _evaluate_kind(db, kind=kind, thresholds_by_customer=thresholds[kind], cutoff=cutoff)
+        # Pushed as soon as they are committed, even if a later kind fails
+        for event in kind_events:
+            notify_threshold_crossing(uuid.UUID(event["customer_id"]), event)
+        events += kind_events
+
+    if events:
+        logger.info(f"City Eye threshold evaluation up to {cutoff}: {len(events)} crossings")
+    return events
+
+
+async def run_threshold_evaluator() -> None:
+    """
+    Runs evaluate_thresholds every CITY_EYE_THRESHOLD_EVALUATION_INTERVAL_SECONDS until cancelled.
+    Each window is evaluated by whichever worker locks the watermark first.
+    """
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                await evaluate_thresholds(session)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"City Eye threshold evaluation failed: {str(e)}")
+        await asyncio.sleep(settings.CITY_EYE_THRESHOLD_EVALUATION_INTERVAL_SECONDS)
@@ -0,0 +1,156 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy.engine import make_url
+from app.core.config import settings
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+NOTIFY_MAX_PAYLOAD_BYTES = 7999
+
+EventHandler = Callable[[Dict[str, Any]], None]
+
+
+class EventBroker(ABC):
+    """
+    Publish/subscribe for events that must reach every worker, e.g. SSE updates whose client is
+    connected to another worker than the one handling the update. Each process subscribes its
+    handlers once, at import time; they run on the event loop for every event published on their
+    channel and must not block.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, List[EventHandler]] = {}
+
+    def subscribe(self, channel: str, handler: EventHandler) -> None:
+        self._handlers.setdefault(channel, []).append(handler)
+
+    @abstractmethod
+    def publish(self, channel: str, event: Dict[str, Any], trimmed_event: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Publishes a JSON serializable event without waiting for its delivery. Other processes
+        receive trimmed_event instead when the event is too large to relay.
+        """
+
+    async def run(self) -> None:
+        """Relays events between processes until cancelled. Nothing to relay by default."""
+
+    def _dispatch(self, channel: str, event: Dict[str, Any]) -> None:
+        for handler in self._handlers.get(channel, ()):
+            try:
+                handler(event)
+            except Exception as e:
+                logger.error(f"Event handler for {channel} failed: {str(e)}")
+
+
+class InProcessEventBroker(EventBroker):
+    """Delivers events to this process only. Enough for a single worker, and for tests."""
+
+    def publish(self, channel: str, event: Dict[str, Any], trimmed_event: Optional[Dict[str, Any]] = None) -> None:
+        self._dispatch(channel, event)
+
+
+class PostgresEventBroker(EventBroker):
+    """
+    Delivers events to every process through PostgreSQL LISTEN/NOTIFY. run() holds one connection
+    per process that listens on all subscribed channels and sends this process's events in the
+    order they were published. A process delivers its own events right away, whether or not the
+    connection is up, and ignores them when they come back through its connection. Events too
+    large for NOTIFY reach the other processes as their trimmed_event, if they have one.
+
+    While the connection is down, published events wait (up to max_pending) to be sent to the
+    other processes after reconnecting, events of other processes are missed. Until run() is
+    started, events are delivered in this process only.
+    """
+
+    def __init__(self, dsn: str, max_pending: int, reconnect_delay_seconds: float):
+        super().__init__()
+        self.dsn = dsn
+        self.reconnect_delay_seconds = reconnect_delay_seconds
+        self._pending: "asyncio.Queue[Tuple[str, str]]" = asyncio.Queue(maxsize=max_pending)
+        self._unsent: Optional[Tuple[str, str]] = None
+        self._running = False
+
+    def publish(self, channel: str, event: Dict[str, Any], trimmed_event: Optional[Dict[str, Any]] = None) -> None:
+        if not self._running:
+            self._dispatch(channel, event)
+            return
+
+        # Handlers get the event as the other processes do, decoded from JSON
+        payload = json.dumps(event, default=str)
+        self._dispatch(channel, json.loads(payload))
+        if len(payload.encode()) > NOTIFY_MAX_PAYLOAD_BYTES and trimmed_event is not None:
+            payload = json.dumps(trimmed_event, default=str)
+        if len(payload.encode()) > NOTIFY_MAX_PAYLOAD_BYTES:
+            logger.warning(f"Event on {channel} is too large for NOTIFY, delivered to this process only")
+            return
+        try:
+            self._pending.put_nowait((channel, payload))
+        except asyncio.QueueFull:
+            logger.warning(f"Dropped event on {channel}: {self._pending.maxsize} events are waiting to be sent")
+
+    async def run(self) -> None:
+        import asyncpg
+
+        self._running = True
+        try:
+            while True:
+                connection = None
+                try:
+                    connection = await asyncpg.connect(self.dsn)
+                    for channel in self._handlers:
+                        await connection.add_listener(channel, self._on_notification)
+                    logger.info(f"Listening for events on {', '.join(self._handlers) or 'no channels'}")
+                    await self._send_pending(connection)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Event broker connection failed, reconnecting in {self.reconnect_delay_seconds}s: {str(e)}")
+                finally:
+                    if connection is not None:
+                        connection.terminate()
+                await asyncio.sleep(self.reconnect_delay_seconds)
+        finally:
+            self._running = False
+
+    async def _send_pending(self, connection) -> None:
+        while True:
+            if self._unsent is None:
+                try:
+                    self._unsent = await asyncio.wait_for(self._pending.get(), timeout=30)
+                except asyncio.TimeoutError:
+                    # Idle: make sure the connection (and so the listeners) is still alive
+                    await connection.execute("SELECT 1")
+                    continue
+            channel, payload = self._unsent
+            await connection.execute("SELECT pg_notify($1, $2)", channel, payload)
+            self._unsent = None
+
+    def _on_notification(self, connection, pid: int, channel: str, payload: str) -> None:
+        if pid == connection.get_server_pid():
+            # Sent through this connection, already delivered when published
+            return
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.error(f"Ignored malformed event on {channel}")
+            return
+        self._dispatch(channel, event)
+
+
+def _create_event_broker() -> EventBroker:
+    if settings.EVENT_BROKER_BACKEND == "postgres":
+        # asyncpg takes plain postgresql:// URLs
+        dsn = make_url(settings.ASYNC_DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        return PostgresEventBroker(
+            dsn,
+            max_pending=settings.EVENT_BROKER_MAX_PENDING,
+            reconnect_delay_seconds=settings.EVENT_BROKER_RECONNECT_SECONDS,
+        )
+    return InProcessEventBroker()
+
+
+event_broker = _create_event_broker()
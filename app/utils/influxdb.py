@@ -1,20 +1,410 @@
-import os
+import asyncio
+import functools
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from typing import Dict, Any
-from influxdb_client_3 import InfluxDBClient3
+from typing import Callable, Dict, Any, List, Optional, Sequence, Tuple
 from app.core.config import settings
+from app.utils.analytics_cache import CacheBackend, InMemoryCacheBackend, RedisCacheBackend
 from app.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
-# Initialize the InfluxDB client
-influx_client = InfluxDBClient3(
-    host=settings.INFLUXDB_HOST,
-    token=settings.INFLUXDB_TOKEN,
-    database=settings.INFLUXDB_DATABASE
+
+class InfluxQueryTimeout(Exception):
+    """An InfluxDB query did not finish within INFLUXDB_QUERY_TIMEOUT_SECONDS."""
+
+
+class InfluxMetricsClient:
+    """
+    Runs the blocking InfluxDBClient3 queries on a small dedicated thread pool, so metric
+    dashboards never stall the event loop. The pool size bounds the queries in flight per worker,
+    further queries wait for a free thread within their timeout. The client is only built on the
+    first query, so the app starts even when InfluxDB is unreachable or not configured.
+    """
+
+    def __init__(self, max_concurrent_queries: int, timeout_seconds: float):
+        self.timeout_seconds = timeout_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_queries, thread_name_prefix="influxdb")
+        self._client = None
+
+    def _get_client(self):
+        # Runs on a pool thread; a race builds two clients at worst and keeps the last one
+        if self._client is None:
+            from influxdb_client_3 import InfluxDBClient3
+
+            self._client = InfluxDBClient3(
+                host=settings.INFLUXDB_HOST,
+                token=settings.INFLUXDB_TOKEN,
+                database=settings.INFLUXDB_DATABASE
+            )
+        return self._client
+
+    def _query_sync(self, query: str, parameters: Optional[Dict[str, Any]] = None):
+        return self._get_client().query(query=query, query_parameters=parameters or {})
+
+    async def query(
+        self,
+        query: str,
+        transform: Optional[Callable[[Any], Any]] = None,
+        parameters: Optional[Dict[str, Any]] = None,
+    ) -> Any:
+        """
+        Runs a SQL query, with `$name` placeholders bound to parameters, and returns its result as
+        an Arrow table, or transform(table) when given. The transform also runs on the query
+        thread, so processing large results does not stall the event loop either. Raises
+        InfluxQueryTimeout.
+        """
+        def run():
+            result = self._query_sync(query, parameters)
+            return transform(result) if transform is not None else result
+
+        future = asyncio.get_running_loop().run_in_executor(self._executor, run)
+        try:
+            # On timeout a query still waiting for a thread is dropped; a running one finishes in
+            # the background and its result is discarded
+            return await asyncio.wait_for(future, timeout=self.timeout_seconds)
+        except asyncio.TimeoutError:
+            raise InfluxQueryTimeout(f"InfluxDB query timed out after {self.timeout_seconds} seconds")
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+influx_client = InfluxMetricsClient(
+    max_concurrent_queries=settings.INFLUXDB_MAX_CONCURRENT_QUERIES,
+    timeout_seconds=settings.INFLUXDB_QUERY_TIMEOUT_SECONDS,
 )
 
+# Metric family -> measurement, tag values the rows must have, and (column, series name) pairs
+# averaged per time window. A family added here and to app.schemas.device_metrics.METRIC_FAMILY_NAMES
+# is served by query_metrics_batch and the batch endpoint as is.
+METRIC_FAMILIES = {
+    "memory": {
+        "measurement": "memory_metrics",
+        "filters": {"memory_type": "main"},
+        "fields": (("used", "Mem Used"), ("free", "Mem Free")),
+    },
+    "cpu": {
+        "measurement": "cpu_metrics",
+        "filters": {},
+        "fields": (("overall_cpu", "CPU Usage"), ("overall_user", "User CPU"), ("overall_system", "System CPU")),
+    },
+    "temperature": {
+        "measurement": "temperature_metrics",
+        "filters": {},
+        "fields": (("cpu_celsius", "CPU Temperature"), ("gpu_celsius", "GPU Temperature")),
+    },
+}
+
+# Window sizes (minutes) that intervals are coarsened to when the requested one yields too many points
+METRIC_INTERVALS_MINUTES = (1, 5, 15, 30, 60, 3 * 60, 6 * 60, 12 * 60, 24 * 60)
+# Windows per cached block; blocks start at multiples of their length since the epoch, like date_bin windows
+METRICS_CACHE_BLOCK_WINDOWS = 144
+
+
+def _format_time(value: datetime) -> str:
+    # InfluxDB timestamps are compared in UTC
+    return value.astimezone(ZoneInfo("UTC")).isoformat().replace('+00:00', 'Z')
+
+
+@functools.lru_cache(maxsize=256)
+def build_metrics_query(family: str, device_count: int, span_count: int, interval: int) -> str:
+    """
+    Returns the SQL averaging a metric family's fields per device and interval window over
+    device_count devices ($device_0, ...) and span_count time spans ($start_0/$end_0, ...; the
+    last span includes its end). All values are bound by metrics_query_parameters, so the text
+    only depends on the shape of the request and is built once per shape.
+    """
+    definition = METRIC_FAMILIES[family]
+    averages = ",\n        ".join(f"mean({column}) AS avg_{column}" for column, _ in definition["fields"])
+    filters = "".join(f"\n        AND {tag} = $filter_{tag}" for tag in definition["filters"])
+    devices = ", ".join(f"$device_{index}" for index in range(device_count))
+    spans = " OR ".join(
+        f"(time >= $start_{index} AND time {'<=' if index == span_count - 1 else '<'} $end_{index})"
+        for index in range(span_count)
+    )
+
+    return f"""
+    SELECT
+        device_id,
+        date_bin(INTERVAL '{int(interval)} minutes', time) AS time_window,
+        {averages}
+    FROM {definition["measurement"]}
+    WHERE
+        device_id IN ({devices}){filters}
+        AND ({spans})
+    GROUP BY device_id, time_window
+    ORDER BY device_id, time_window ASC
+    """
+
+
+def metrics_query_parameters(
+    family: str, device_names: Sequence[str], spans: Sequence[Tuple[datetime, datetime]]
+) -> Dict[str, str]:
+    """Returns the parameters of build_metrics_query(family, len(device_names), len(spans), ...)."""
+    parameters = {f"filter_{tag}": value for tag, value in METRIC_FAMILIES[family]["filters"].items()}
+    parameters.update({f"device_{index}": device_name for index, device_name in enumerate(device_names)})
+    for index, (span_start, span_end) in enumerate(spans):
+        parameters[f"start_{index}"] = _format_time(span_start)
+        parameters[f"end_{index}"] = _format_time(span_end)
+    return parameters
+
+
+class RawJson(str):
+    """Already encoded JSON, embedded as is by dump_json."""
+
+
+def dump_json(value: Any) -> str:
+    """
+    Encodes a response document whose parts may already be encoded (RawJson), so metric series
+    are written out without building a Python object per data point.
+    """
+    if isinstance(value, RawJson):
+        return value
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{json.dumps(str(key))}:{dump_json(item)}" for key, item in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(dump_json(item) for item in value) + "]"
+    if isinstance(value, datetime):
+        return json.dumps(value.isoformat())
+    return json.dumps(value)
+
+
+def _encode_series(series_name: str, points: List[str]) -> RawJson:
+    return RawJson(f'{{"name":{json.dumps(series_name)},"data":[{",".join(points)}]}}')
+
+
+def _encode_device_blocks(table, fields, block_seconds: int) -> Dict[Tuple[str, int], List[List[str]]]:
+    """
+    Turns the Arrow result of a metrics query into encoded points per field for each (device,
+    block index) pair, a block being block_seconds of windows counted from the epoch. Timestamps
+    are converted to JST, values rounded, points with null values dropped and points encoded to
+    JSON in vectorized passes over the whole table; each pair's points are then a slice of it,
+    since the rows are ordered by device and time.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    row_count = table.num_rows
+    if not row_count:
+        return {}
+
+    times = table.column('time_window')
+    if pa.types.is_string(times.type):
+        times = pc.cast(times, pa.timestamp("ns", tz="UTC"))
+    elif times.type.tz is None:
+        # InfluxDB times are UTC
+        times = pc.assume_timezone(times, "UTC")
+    times = pc.cast(times, pa.timestamp("s", tz="UTC"), safe=False)
+    # JST has no DST, so the offset is written literally (same output as datetime.isoformat())
+    timestamps = pc.strftime(
+        pc.cast(times, pa.timestamp("s", tz="Asia/Tokyo")), format="%Y-%m-%dT%H:%M:%S+09:00"
+    )
+    blocks = pc.divide(pc.cast(times, pa.int64()), block_seconds)
+
+    points_by_column = {}
+    for column, _ in fields:
+        values = pc.round(pc.cast(table.column(f"avg_{column}"), pa.float64()), ndigits=2)
+        # NaN and infinity have no JSON encoding
+        values = pc.if_else(pc.is_finite(values), values, pa.scalar(None, pa.float64()))
+        # Null values (and timestamps) give null points, dropped below
+        points_by_column[column] = pc.binary_join_element_wise(
+            '{"timestamp":"', timestamps, '","value":', pc.cast(values, pa.string()), "}", ""
+        )
+
+    # Tags may come dictionary encoded
+    device_ids = pc.cast(table.column('device_id'), pa.string())
+    run_starts = [0]
+    if row_count > 1:
+        # Rows where the device or block differs from the previous row start a new run
+        changes = pc.or_(
+            pc.not_equal(device_ids.slice(1), device_ids.slice(0, row_count - 1)),
+            pc.not_equal(blocks.slice(1), blocks.slice(0, row_count - 1)),
+        )
+        run_starts += [index + 1 for index in pc.indices_nonzero(changes).to_pylist()]
+    run_ends = run_starts[1:] + [row_count]
+    run_indices = pa.array(run_starts)
+    run_keys = zip(device_ids.take(run_indices).to_pylist(), blocks.take(run_indices).to_pylist())
+
+    return {
+        run_key: [
+            points_by_column[column].slice(run_start, run_end - run_start).drop_null().to_pylist()
+            for column, _ in fields
+        ]
+        for run_key, run_start, run_end in zip(run_keys, run_starts, run_ends)
+    }
+
+
+def _stitch_series(
+    fields, device_names: Sequence[str], blocks: Dict[Tuple[str, int], List[List[str]]]
+) -> Dict[str, List[RawJson]]:
+    """
+    Joins the encoded points of each device's blocks in time order into one encoded series per
+    field. Devices without blocks get series without points.
+    """
+    device_blocks: Dict[str, List[Tuple[int, List[List[str]]]]] = {device_name: [] for device_name in device_names}
+    for (device_name, block_index), points in blocks.items():
+        if device_name in device_blocks:
+            device_blocks[device_name].append((block_index, points))
+
+    encoded = {}
+    for device_name, pieces in device_blocks.items():
+        pieces.sort(key=lambda piece: piece[0])
+        encoded[device_name] = [
+            _encode_series(series_name, [point for _, points in pieces for point in points[position]])
+            for position, (_, series_name) in enumerate(fields)
+        ]
+    return encoded
+
+
+def choose_metrics_interval(
+    start_time: datetime, end_time: datetime, interval: int, max_points: Optional[int] = None
+) -> int:
+    """
+    Returns the window size (minutes) to query [start_time, end_time] with: the requested
+    interval, or the smallest coarser one in METRIC_INTERVALS_MINUTES (then whole days) that
+    keeps each series within max_points points.
+    """
+    max_points = max_points or settings.DEVICE_METRICS_MAX_POINTS
+    range_minutes = (end_time - start_time).total_seconds() / 60
+    if range_minutes <= interval * max_points:
+        return interval
+
+    for candidate in METRIC_INTERVALS_MINUTES:
+        if candidate > interval and range_minutes <= candidate * max_points:
+            return candidate
+    day_minutes = METRIC_INTERVALS_MINUTES[-1]
+    return max(interval, math.ceil(range_minutes / max_points / day_minutes) * day_minutes)
+
+
+def _create_metrics_cache_backend() -> CacheBackend:
+    # Same backend choice as the analytics cache, with its own keys and LRU bound. Blocks are
+    # lists of JSON strings, plain JSON holds them.
+    if settings.ANALYTICS_CACHE_BACKEND == "redis":
+        return RedisCacheBackend(
+            settings.ANALYTICS_CACHE_REDIS_URL, prefix="device_metrics:", dumps=json.dumps, loads=json.loads
+        )
+    return InMemoryCacheBackend(max_entries=settings.DEVICE_METRICS_CACHE_MAX_ENTRIES)
+
+
+metrics_cache_backend = _create_metrics_cache_backend()
+
+
+async def _read_cached_blocks(keys: Dict[Tuple[str, int], str]) -> Dict[Tuple[str, int], List[List[str]]]:
+    if not keys:
+        return {}
+    try:
+        values = await metrics_cache_backend.get_many(list(keys.values()))
+    except Exception as e:
+        # A cache outage must never fail the request
+        logger.warning(f"Device metrics cache read failed: {str(e)}")
+        return {}
+    return {block: value for block, value in zip(keys, values) if value is not None}
+
+
+async def _write_cached_blocks(values: Dict[str, List[List[str]]]) -> None:
+    if not values:
+        return
+    try:
+        await metrics_cache_backend.set_many(values, settings.DEVICE_METRICS_CACHE_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"Device metrics cache write failed: {str(e)}")
+
+
+def _utc(seconds: float) -> datetime:
+    return datetime.fromtimestamp(seconds, ZoneInfo("UTC"))
+
+
+async def query_metrics_batch(
+    family: str,
+    device_names: Sequence[str],
+    start_time: datetime,
+    end_time: datetime,
+    interval: int
+) -> Dict[str, List[RawJson]]:
+    """
+    Query one metric family for many devices with a single InfluxDB query grouped by device.
+    Returns device name -> encoded series; devices without data get series without points.
+
+    The windows are grouped into blocks of METRICS_CACHE_BLOCK_WINDOWS windows counted from the
+    epoch. Blocks that lie entirely inside the range and ended at least
+    DEVICE_METRICS_CACHE_SETTLE_SECONDS ago are cached per device, so only the partial first
+    block, blocks not cached yet and the trailing live part are read from InfluxDB.
+    """
+    fields = METRIC_FAMILIES[family]["fields"]
+    block_seconds = interval * 60 * METRICS_CACHE_BLOCK_WINDOWS
+    start_seconds = start_time.timestamp()
+    end_seconds = end_time.timestamp()
+
+    cacheable = range(0)
+    if settings.DEVICE_METRICS_CACHE_ENABLED:
+        settled_until = min(end_seconds, time.time() - settings.DEVICE_METRICS_CACHE_SETTLE_SECONDS)
+        cacheable = range(math.ceil(start_seconds / block_seconds), math.floor(settled_until / block_seconds))
+    cache_keys = {
+        (device_name, block_index): f"{family}:{interval}:{block_index}:{device_name}"
+        for device_name in device_names
+        for block_index in cacheable
+    }
+    cached = await _read_cached_blocks(cache_keys)
+    missing = sorted({block_index for (_, block_index) in cache_keys.keys() - cached.keys()})
+
+    # [start, end) spans read from InfluxDB; the last one ends at end_time and includes it
+    if cacheable:
+        first_cached_start = cacheable.start * block_seconds
+        spans = [(start_seconds, first_cached_start)] if start_seconds < first_cached_start else []
+        spans += [(block_index * block_seconds, (block_index + 1) * block_seconds) for block_index in missing]
+        spans.append((cacheable.stop * block_seconds, end_seconds))
+    else:
+        spans = [(start_seconds, end_seconds)]
+    merged_spans = [spans[0]]
+    for span_start, span_end in spans[1:]:
+        if span_start == merged_spans[-1][1]:
+            merged_spans[-1] = (merged_spans[-1][0], span_end)
+        else:
+            merged_spans.append((span_start, span_end))
+    time_spans = [(_utc(span_start), _utc(span_end)) for span_start, span_end in merged_spans]
+
+    try:
+        fresh = await influx_client.query(
+            build_metrics_query(family, len(device_names), len(time_spans), interval),
+            transform=lambda table: _encode_device_blocks(table, fields, block_seconds),
+            parameters=metrics_query_parameters(family, device_names, time_spans),
+        )
+    except Exception as e:
+        logger.error(f"Error querying {family} metrics from InfluxDB: {str(e)}")
+        raise
+
+    # Blocks without any data are cached too, as series without points
+    missing_blocks = set(missing)
+    await _write_cached_blocks({
+        cache_key: fresh.get(block) or [[] for _ in fields]
+        for block, cache_key in cache_keys.items()
+        if block[1] in missing_blocks
+    })
+    return _stitch_series(fields, device_names, {**cached, **fresh})
+
+
+async def _query_device_metrics(
+    family: str, device_name: str, start_time: datetime, end_time: datetime, interval: int
+) -> Dict[str, Any]:
+    interval = choose_metrics_interval(start_time, end_time, interval)
+    series = await query_metrics_batch(family, [device_name], start_time, end_time, interval)
+    return {
+        "series": series[device_name],
+        "device_name": device_name,
+        "start_time": start_time,
+        "end_time": end_time,
+        "interval": f"{interval}m"
+    }
+
+
 async def query_memory_metrics(
     device_name: str, 
     start_time: datetime, 
@@ -24,75 +414,7 @@ async def query_memory_metrics(
     """
     Query memory metrics from InfluxDB for a specific device
     """
-    # Convert input times to UTC for InfluxDB query
-    start_time_utc = start_time.astimezone(ZoneInfo("UTC"))
-    end_time_utc = end_time.astimezone(ZoneInfo("UTC"))
-    
-    # InfluxQL query with aggregation
-    query = f"""
-    SELECT
-        date_bin(INTERVAL '{interval} minutes', time) AS time_window,
-        mean(used) as avg_used,
-        mean(free) as avg_free
-    FROM memory_metrics
-    WHERE 
-        device_id = '{device_name}'
-        AND memory_type = 'main'
-        AND time >= '{start_time_utc.isoformat().replace('+00:00', 'Z')}'
-        AND time <= '{end_time_utc.isoformat().replace('+00:00', 'Z')}'
-    GROUP BY time_window
-    ORDER BY time_window ASC
-    """
-    
-    try:
-        # Execute the query
-        result = influx_client.query(query=query).to_pylist()
-        
-        used_series = {"name": "Mem Used", "data": []}
-        free_series = {"name": "Mem Free", "data": []}
-        
-        # Process the results
-        for row in result:
-            # Parse the timestamp - using the time_window field from the query result
-            timestamp_utc = row.get('time_window')
-            if timestamp_utc:
-                # Convert string timestamp to datetime if needed
-                if isinstance(timestamp_utc, str):
-                    timestamp_dt = datetime.fromisoformat(timestamp_utc.replace('Z', '+00:00'))
-                else:
-                    timestamp_dt = timestamp_utc
-                    
-                # Ensure UTC timezone
-                if timestamp_dt.tzinfo is None:
-                    timestamp_dt = timestamp_dt.replace(tzinfo=ZoneInfo("UTC"))
-                
-                # Convert to JST
-                timestamp_jst = timestamp_dt.astimezone(ZoneInfo("Asia/Tokyo"))
-                timestamp = timestamp_jst.isoformat()
-                
-                # Add data points
-                if row.get('avg_used') is not None:
-                    used_series["data"].append({
-                        "timestamp": timestamp,
-                        "value": round(row['avg_used'], 2)
-                    })
-                
-                if row.get('avg_free') is not None:
-                    free_series["data"].append({
-                        "timestamp": timestamp,
-                        "value": round(row['avg_free'], 2)
-                    })
-        
-        return {
-            "series": [used_series, free_series],
-            "device_name": device_name,
-            "start_time": start_time,
-            "end_time": end_time,
-            "interval": f"{interval}m"
-        }
-    except Exception as e:
-        logger.error(f"Error querying memory metrics from InfluxDB: {str(e)}")
-        raise
+    return await _query_device_metrics("memory", device_name, start_time, end_time, interval)
 
 
 async def query_cpu_metrics(
@@ -104,80 +426,7 @@ async def query_cpu_metrics(
     """
     Query CPU metrics from InfluxDB for a specific device
     """
-    # Convert input times to UTC for InfluxDB query
-    start_time_utc = start_time.astimezone(ZoneInfo("UTC"))
-    end_time_utc = end_time.astimezone(ZoneInfo("UTC"))
-    # InfluxQL query with aggregation
-    query = f"""
-    SELECT
-        date_bin(INTERVAL '{interval} minutes', time) AS time_window,
-        mean(overall_cpu) as avg_overall_cpu,
-        mean(overall_user) as avg_overall_user,
-        mean(overall_system) as avg_overall_system
-    FROM cpu_metrics
-    WHERE 
-        device_id = '{device_name}'
-        AND time >= '{start_time_utc.isoformat().replace('+00:00', 'Z')}'
-        AND time <= '{end_time_utc.isoformat().replace('+00:00', 'Z')}'
-    GROUP BY time_window
-    ORDER BY time_window ASC
-    """
-    
-    try:
-        # Execute the query
-        result = influx_client.query(query=query).to_pylist()
-        overall_series = {"name": "CPU Usage", "data": []}
-        user_series = {"name": "User CPU", "data": []}
-        system_series = {"name": "System CPU", "data": []}
-        
-        # Process the results
-        for row in result:
-            # Parse the timestamp - using the time_window field from the query result
-            timestamp_utc = row.get('time_window')
-            if timestamp_utc:
-                # Convert string timestamp to datetime if needed
-                if isinstance(timestamp_utc, str):
-                    timestamp_dt = datetime.fromisoformat(timestamp_utc.replace('Z', '+00:00'))
-                else:
-                    timestamp_dt = timestamp_utc
-                    
-                # Ensure UTC timezone
-                if timestamp_dt.tzinfo is None:
-                    timestamp_dt = timestamp_dt.replace(tzinfo=ZoneInfo("UTC"))
-                
-                # Convert to JST
-                timestamp_jst = timestamp_dt.astimezone(ZoneInfo("Asia/Tokyo"))
-                timestamp = timestamp_jst.isoformat()
-                
-                # Add data points
-                if row.get('avg_overall_cpu') is not None:
-                    overall_series["data"].append({
-                        "timestamp": timestamp,
-                        "value": round(row['avg_overall_cpu'], 2)
-                    })
-                
-                if row.get('avg_overall_user') is not None:
-                    user_series["data"].append({
-                        "timestamp": timestamp,
-                        "value": round(row['avg_overall_user'], 2)
-                    })
-                
-                if row.get('avg_overall_system') is not None:
-                    system_series["data"].append({
-                        "timestamp": timestamp,
-                        "value": round(row['avg_overall_system'], 2)
-                    })
-        
-        return {
-            "series": [overall_series, user_series, system_series],
-            "device_name": device_name,
-            "start_time": start_time,
-            "end_time": end_time,
-            "interval": f"{interval}m"
-        }
-    except Exception as e:
-        logger.error(f"Error querying CPU metrics from InfluxDB: {str(e)}")
-        raise
+    return await _query_device_metrics("cpu", device_name, start_time, end_time, interval)
 
 
 async def query_temperature_metrics(
@@ -189,71 +438,4 @@ async def query_temperature_metrics(
     """
     Query temperature metrics from InfluxDB for a specific device
     """
-    # Convert input times to UTC for InfluxDB query
-    start_time_utc = start_time.astimezone(ZoneInfo("UTC"))
-    end_time_utc = end_time.astimezone(ZoneInfo("UTC"))
-    
-    # InfluxQL query with aggregation
-    query = f"""
-    SELECT
-        date_bin(INTERVAL '{interval} minutes', time) AS time_window,
-        mean(cpu_celsius) as avg_cpu_temp,
-        mean(gpu_celsius) as avg_gpu_temp
-    FROM temperature_metrics
-    WHERE 
-        device_id = '{device_name}'
-        AND time >= '{start_time_utc.isoformat().replace('+00:00', 'Z')}'
-        AND time <= '{end_time_utc.isoformat().replace('+00:00', 'Z')}'
-    GROUP BY time_window
-    ORDER BY time_window ASC
-    """
-    
-    try:
-        # Execute the query
-        result = influx_client.query(query=query).to_pylist()
-        
-        cpu_series = {"name": "CPU Temperature", "data": []}
-        gpu_series = {"name": "GPU Temperature", "data": []}
-        
-        # Process the results
-        for row in result:
-            # Parse the timestamp - using the time_window field from the query result
-            timestamp_utc = row.get('time_window')
-            if timestamp_utc:
-                # Convert string timestamp to datetime if needed
-                if isinstance(timestamp_utc, str):
-                    timestamp_dt = datetime.fromisoformat(timestamp_utc.replace('Z', '+00:00'))
-                else:
-                    timestamp_dt = timestamp_utc
-                    
-                # Ensure UTC timezone
-                if timestamp_dt.tzinfo is None:
-                    timestamp_dt = timestamp_dt.replace(tzinfo=ZoneInfo("UTC"))
-                
-                # Convert to JST
-                timestamp_jst = timestamp_dt.astimezone(ZoneInfo("Asia/Tokyo"))
-                timestamp = timestamp_jst.isoformat()
-                
-                # Add data points
-                if row.get('avg_cpu_temp') is not None:
-                    cpu_series["data"].append({
-                        "timestamp": timestamp,
-                        "value": round(row['avg_cpu_temp'], 2)
-                    })
-                
-                if row.get('avg_gpu_temp') is not None:
-                    gpu_series["data"].append({
-                        "timestamp": timestamp,
-                        "value": round(row['avg_gpu_temp'], 2)
-                    })
-        
-        return {
-            "series": [cpu_series, gpu_series],
-            "device_name": device_name,
-            "start_time": start_time,
-            "end_time": end_time,
-            "interval": f"{interval}m"
-        }
-    except Exception as e:
-        logger.error(f"Error querying temperature metrics from InfluxDB: {str(e)}")
-        raise
\ No newline at end of file
+    return await _query_device_metrics("temperature", device_name, start_time, end_time, interval)
@@ -0,0 +1,155 @@
+import asyncio
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.routes.sse import notify_job_update
+from app.core.config import settings
+from app.crud import job as crud_job
+from app.db.async_session import AsyncSessionLocal
+from app.models import Job, JobStatus
+from app.utils.aws_iot_jobs import iot_jobs_service
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# AWS IoT job execution statuses that we track, the others (REJECTED, REMOVED) leave jobs as they are
+AWS_JOB_STATUSES = {
+    "QUEUED": JobStatus.QUEUED,
+    "IN_PROGRESS": JobStatus.IN_PROGRESS,
+    "SUCCEEDED": JobStatus.SUCCEEDED,
+    "FAILED": JobStatus.FAILED,
+    "TIMED_OUT": JobStatus.TIMED_OUT,
+    "CANCELED": JobStatus.CANCELED,
+}
+
+TERMINAL_JOB_STATUSES = (JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.TIMED_OUT, JobStatus.CANCELED, JobStatus.ARCHIVED)
+
+# Status read from the database, status reported by AWS and its status details
+StatusChange = Tuple[JobStatus, JobStatus, Optional[Dict[str, Any]]]
+
+
+class AWSRequestLimiter:
+    """
+    Runs blocking AWS calls in threads, at most max_concurrent at once and starting at most
+    requests_per_second of them, so a large backlog of jobs does not get throttled by AWS.
+    """
+
+    def __init__(self, max_concurrent: int, requests_per_second: float):
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._start_lock = asyncio.Lock()
+        self._interval = 1 / requests_per_second
+        self._next_start = 0.0
+
+    async def call(self, func: Callable[..., Any], *args: Any) -> Any:
+        async with self._semaphore:
+            async with self._start_lock:
+                loop = asyncio.get_running_loop()
+                delay = self._next_start - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self._next_start = max(loop.time(), self._next_start) + self._interval
+            return await asyncio.to_thread(func, *args)
+
+
+async def _fetch_thing_changes(
+    limiter: AWSRequestLimiter, thing_name: str, job_statuses: Dict[str, JobStatus]
+) -> Dict[str, StatusChange]:
+    """
+    Lists the job executions of a thing, one rate-limited request per page and only until every
+    job of job_statuses is found, then describes only the executions whose status changed, for
+    their status details.
+    """
+    try:
+        statuses: Dict[str, str] = {}
+        next_token = None
+        while True:
+            page, next_token = await limiter.call(
+                iot_jobs_service.list_job_execution_statuses_for_thing, thing_name, next_token
+            )
+            statuses.update(page)
+            if not next_token or statuses.keys() >= job_statuses.keys():
+                break
+
+        changes = {}
+        for job_id, status in job_statuses.items():
+            new_status = AWS_JOB_STATUSES.get(statuses.get(job_id))
+            if new_status is None or new_status == status:
+                continue
+            execution = await limiter.call(iot_jobs_service.get_job_execution_status, job_id, thing_name)
+            changes[job_id] = (status, new_status, execution.get("status_details") if execution else None)
+        return changes
+    except Exception as e:
+        logger.error(f"Failed to fetch job statuses of thing {thing_name}: {str(e)}")
+        return {}
+
+
+def _progress_percentage(status: JobStatus) -> int:
+    if status in TERMINAL_JOB_STATUSES:
+        return 100
+    return 50 if status == JobStatus.IN_PROGRESS else 0
+
+
+async def reconcile_jobs(db: AsyncSession) -> List[Job]:
+    """
+    Brings the status of every unfinished job in line with AWS IoT, listing the job executions
+    of each thing (usually a single page), writes the changes in one commit and pushes them to
+    the job SSE streams. Returns the changed jobs.
+
+    No transaction is held while AWS is queried. The changed jobs are then locked only for the
+    update, skipping jobs locked by others; a job whose status changed in the meantime (e.g.
+    canceled by a user) is left alone and looked at again on the next run.
+    """
+    rows = await crud_job.get_unfinished_with_thing_names(db)
+    # End the read transaction, AWS can take minutes to answer for many things
+    await db.rollback()
+    statuses_by_thing: Dict[str, Dict[str, JobStatus]] = defaultdict(dict)
+    for job_id, status, thing_name in rows:
+        statuses_by_thing[thing_name][job_id] = status
+
+    limiter = AWSRequestLimiter(
+        settings.JOB_RECONCILER_MAX_CONCURRENT_REQUESTS, settings.JOB_RECONCILER_REQUESTS_PER_SECOND
+    )
+    results = await asyncio.gather(*(
+        _fetch_thing_changes(limiter, thing_name, job_statuses)
+        for thing_name, job_statuses in statuses_by_thing.items()
+    ))
+    changes = {job_id: change for thing_changes in results for job_id, change in thing_changes.items()}
+    if not changes:
+        return []
+
+    updates = []
+    for job_obj in await crud_job.lock_by_job_ids(db, job_ids=list(changes)):
+        status, new_status, status_details = changes[job_obj.job_id]
+        if job_obj.status == status:
+            updates.append((job_obj, new_status, status_details))
+    if not updates:
+        await db.rollback()
+        return []
+
+    await crud_job.update_statuses(db, updates=updates)
+    for job_obj, status, _ in updates:
+        notify_job_update(
+            job_id=job_obj.job_id,
+            status=status.value,
+            progress_percentage=_progress_percentage(status),
+            status_details=job_obj.status_details,
+            error_message=job_obj.error_message,
+            device_id=job_obj.device_id,
+        )
+    logger.info(f"Reconciled {len(rows)} unfinished jobs with AWS IoT: {len(updates)} changed")
+    return [job_obj for job_obj, _, _ in updates]
+
+
+async def run_job_reconciler() -> None:
+    """
+    Runs reconcile_jobs every JOB_RECONCILER_INTERVAL_SECONDS until cancelled.
+    """
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                await reconcile_jobs(session)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Job status reconciliation failed: {str(e)}")
+        await asyncio.sleep(settings.JOB_RECONCILER_INTERVAL_SECONDS)
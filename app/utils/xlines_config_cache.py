@@ -0,0 +1,134 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from app.core.config import settings
+from app.utils.aws_iot_commands import iot_command_service
+from app.utils.event_broker import event_broker
+from app.utils.util import calculate_offset_route
+from app.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Position used for polygons without (usable) center coordinates in the shadow
+DEFAULT_POINT = {"lat": 35.681236, "lng": 139.767125}
+
+# Event broker channel telling every worker that a thing applied a new xlines config
+XLINES_CONFIG_UPDATES_CHANNEL = "xlines_config_updates"
+
+
+def parse_polygon_geometry(polygon_index: int, polygon_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Returns the name and in/out route end points of the polygon at `polygon_index` of an
+    xlines config. Missing data falls back to "Zone <n>" and DEFAULT_POINT.
+    """
+    polygon_data = polygon_data or {}
+    geometry = {
+        "polygon_name": polygon_data.get("name", f"Zone {polygon_index + 1}"),
+        "in_start_point": dict(DEFAULT_POINT),
+        "in_end_point": dict(DEFAULT_POINT),
+        "out_start_point": dict(DEFAULT_POINT),
+        "out_end_point": dict(DEFAULT_POINT),
+    }
+
+    # Get center coordinates
+    center = polygon_data.get("center", {})
+    if center:
+        start_point = center.get("startPoint", {})
+        end_point = center.get("endPoint", {})
+
+        if start_point and end_point:
+            geometry["in_start_point"] = {
+                "lat": start_point.get("lat", DEFAULT_POINT["lat"]),
+                "lng": start_point.get("lng", DEFAULT_POINT["lng"]),
+            }
+            geometry["in_end_point"] = {
+                "lat": end_point.get("lat", DEFAULT_POINT["lat"]),
+                "lng": end_point.get("lng", DEFAULT_POINT["lng"]),
+            }
+
+            # Calculate out coordinates using the helper function
+            geometry["out_start_point"], geometry["out_end_point"] = calculate_offset_route(center)
+
+    return geometry
+
+
+class XLinesConfigCache:
+    """
+    Per-process cache of the polygon geometry reported in each thing's XLinesConfigShadow.
+
+    Shadow reads are blocking boto3 calls, so they run in a worker thread instead of on the event
+    loop. Entries expire after XLINES_CONFIG_CACHE_TTL_SECONDS (XLINES_CONFIG_CACHE_MISS_TTL_SECONDS
+    for missing or unreadable shadows) and are dropped in every worker once a device reports that
+    it applied a new config (see notify_xlines_config_applied).
+    Returned geometry is shared between callers and must not be mutated.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+
+    async def get_polygons(self, thing_name: str) -> List[Dict[str, Any]]:
+        """
+        Returns parse_polygon_geometry() for every polygon in the thing's reported xlines config,
+        in config order. A missing or unreadable shadow yields [], cached for the shorter miss TTL.
+        """
+        entry = self._entries.get(thing_name)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        shadow_document = await asyncio.to_thread(iot_command_service.get_xlines_config_shadow, thing_name)
+        if not shadow_document:
+            self._entries[thing_name] = (time.monotonic() + settings.XLINES_CONFIG_CACHE_MISS_TTL_SECONDS, [])
+            return []
+
+        xlines_config = []
+        state = shadow_document.get("state", {})
+        reported = state.get("reported", {})
+        xlines_cfg_content = reported.get("xlines_cfg_content")
+        if xlines_cfg_content:
+            try:
+                xlines_config = json.loads(xlines_cfg_content)
+            except json.JSONDecodeError:
+                logger.error(f"Failed to parse xlines configuration for thing {thing_name}")
+
+        polygons = [parse_polygon_geometry(index, polygon_data) for index, polygon_data in enumerate(xlines_config)]
+        self._entries[thing_name] = (time.monotonic() + settings.XLINES_CONFIG_CACHE_TTL_SECONDS, polygons)
+        return polygons
+
+    async def get_polygons_by_thing(
+        self, thing_names: Iterable[str]
+    ) -> Dict[str, Union[List[Dict[str, Any]], Exception]]:
+        """
+        Returns get_polygons() of every distinct thing, or the exception it raised, reading up to
+        XLINES_CONFIG_MAX_CONCURRENT_READS uncached shadows at once.
+        """
+        semaphore = asyncio.Semaphore(settings.XLINES_CONFIG_MAX_CONCURRENT_READS)
+
+        async def read(thing_name: str) -> List[Dict[str, Any]]:
+            async with semaphore:
+                return await self.get_polygons(thing_name)
+
+        thing_names = list(dict.fromkeys(thing_names))
+        outcomes = await asyncio.gather(*(read(thing_name) for thing_name in thing_names), return_exceptions=True)
+        return dict(zip(thing_names, outcomes))
+
+    def invalidate(self, thing_name: str) -> None:
+        self._entries.pop(thing_name, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+xlines_config_cache = XLinesConfigCache()
+
+
+def notify_xlines_config_applied(thing_name: str) -> None:
+    """Drops the thing's cached geometry in every worker, once its reported shadow holds the new config."""
+    event_broker.publish(XLINES_CONFIG_UPDATES_CHANNEL, {"thing_name": thing_name})
+
+
+def _drop_applied_config(event: Dict[str, Any]) -> None:
+    xlines_config_cache.invalidate(event["thing_name"])
+
+
+event_broker.subscribe(XLINES_CONFIG_UPDATES_CHANNEL, _drop_applied_config)
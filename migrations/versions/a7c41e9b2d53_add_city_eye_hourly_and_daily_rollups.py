@@ -0,0 +1,125 @@
+"""Add City Eye hourly and daily rollup tables
+
+Revision ID: a7c41e9b2d53
+Revises: 8fd43cf310d1
+Create Date: 2026-10-16 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c41e9b2d53'
+down_revision = '8fd43cf310d1'
+branch_labels = None
+depends_on = None
+
+
+HUMAN_COUNT_COLUMNS = [
+    'male_less_than_18', 'female_less_than_18', 'male_18_to_29', 'female_18_to_29',
+    'male_30_to_49', 'female_30_to_49', 'male_50_to_64', 'female_50_to_64',
+    'male_65_plus', 'female_65_plus',
+]
+TRAFFIC_COUNT_COLUMNS = ['large', 'normal', 'bicycle', 'motorcycle']
+
+# raw table -> (count columns, [(rollup table, date_trunc unit)])
+ROLLUPS = {
+    'city_eye_human_data': (
+        HUMAN_COUNT_COLUMNS,
+        [('city_eye_human_hourly', 'hour'), ('city_eye_human_daily', 'day')],
+    ),
+    'city_eye_traffic_data': (
+        TRAFFIC_COUNT_COLUMNS,
+        [('city_eye_traffic_hourly', 'hour'), ('city_eye_traffic_daily', 'day')],
+    ),
+}
+
+KEY_COLUMNS = 'device_id, polygon_id_in, polygon_id_out, "timestamp"'
+
+
+def _create_rollup_table(table_name, count_columns):
+    op.create_table(table_name,
+    sa.Column('device_id', sa.UUID(), nullable=False),
+    sa.Column('polygon_id_in', sa.String(), nullable=False),
+    sa.Column('polygon_id_out', sa.String(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    *[sa.Column(column, sa.Integer(), nullable=False) for column in count_columns],
+    sa.ForeignKeyConstraint(['device_id'], ['devices.device_id'], ),
+    sa.PrimaryKeyConstraint('device_id', 'polygon_id_in', 'polygon_id_out', 'timestamp')
+    )
+    op.create_index(f'idx_{table_name}_timestamp_device', table_name, ['timestamp', 'device_id'], unique=False)
+
+
+def _aggregate_select(source, unit, count_columns):
+    sums = ', '.join(f'sum({column}) AS {column}' for column in count_columns)
+    return (
+        f'SELECT device_id, polygon_id_in, polygon_id_out, date_trunc(\'{unit}\', "timestamp") AS "timestamp", {sums} '
+        f'FROM {source} GROUP BY 1, 2, 3, 4'
+    )
+
+
+def _rollup_function_sql(raw_table, count_columns, rollups):
+    """
+    One statement-level trigger function per raw table. Deleted (or pre-update) rows are
+    subtracted from their buckets and inserted (or post-update) rows are upserted into them.
+    """
+    statements = []
+    for rollup_table, unit in rollups:
+        subtract = ', '.join(f'{column} = r.{column} - d.{column}' for column in count_columns)
+        add = ', '.join(f'{column} = {rollup_table}.{column} + EXCLUDED.{column}' for column in count_columns)
+        statements.append(f"""
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE {rollup_table} AS r SET {subtract}
+        FROM ({_aggregate_select('old_rows', unit, count_columns)}) AS d
+        WHERE r.device_id = d.device_id AND r.polygon_id_in = d.polygon_id_in
+          AND r.polygon_id_out = d.polygon_id_out AND r."timestamp" = d."timestamp";
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO {rollup_table} ({KEY_COLUMNS}, {', '.join(count_columns)})
+        {_aggregate_select('new_rows', unit, count_columns)}
+        ON CONFLICT ({KEY_COLUMNS}) DO UPDATE SET {add};
+    END IF;""")
+
+    return f"""
+CREATE OR REPLACE FUNCTION {raw_table}_rollup() RETURNS trigger AS $$
+BEGIN{''.join(statements)}
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    for raw_table, (count_columns, rollups) in ROLLUPS.items():
+        for rollup_table, unit in rollups:
+            _create_rollup_table(rollup_table, count_columns)
+            # Backfill from the existing raw rows
+            op.execute(
+                f'INSERT INTO {rollup_table} ({KEY_COLUMNS}, {", ".join(count_columns)}) '
+                f'{_aggregate_select(raw_table, unit, count_columns)}'
+            )
+
+        op.execute(_rollup_function_sql(raw_table, count_columns, rollups))
+        op.execute(
+            f'CREATE TRIGGER {raw_table}_rollup_insert AFTER INSERT ON {raw_table} '
+            f'REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION {raw_table}_rollup()'
+        )
+        op.execute(
+            f'CREATE TRIGGER {raw_table}_rollup_delete AFTER DELETE ON {raw_table} '
+            f'REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION {raw_table}_rollup()'
+        )
+        op.execute(
+            f'CREATE TRIGGER {raw_table}_rollup_update AFTER UPDATE ON {raw_table} '
+            f'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION {raw_table}_rollup()'
+        )
+
+
+def downgrade() -> None:
+    for raw_table, (count_columns, rollups) in ROLLUPS.items():
+        for operation in ('insert', 'delete', 'update'):
+            op.execute(f'DROP TRIGGER IF EXISTS {raw_table}_rollup_{operation} ON {raw_table}')
+        op.execute(f'DROP FUNCTION IF EXISTS {raw_table}_rollup()')
+        for rollup_table, _ in rollups:
+            op.drop_index(f'idx_{rollup_table}_timestamp_device', table_name=rollup_table)
+            op.drop_table(rollup_table)
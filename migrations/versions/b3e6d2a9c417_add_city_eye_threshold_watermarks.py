@@ -0,0 +1,29 @@
+"""Add City Eye threshold evaluator watermarks
+
+Revision ID: b3e6d2a9c417
+Revises: f1a8d3c6b259
+Create Date: 2026-10-16 20:05:17.684210
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e6d2a9c417'
+down_revision = 'f1a8d3c6b259'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('city_eye_threshold_watermarks',
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('evaluated_until', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('kind')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('city_eye_threshold_watermarks')
@@ -0,0 +1,134 @@
+"""Partition City Eye human and traffic data by month
+
+Revision ID: c5f1a2d7e8b4
+Revises: a7c41e9b2d53
+Create Date: 2026-10-16 14:02:17.554310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5f1a2d7e8b4'
+down_revision = 'a7c41e9b2d53'
+branch_labels = None
+depends_on = None
+
+
+HUMAN_COUNT_COLUMNS = [
+    'male_less_than_18', 'female_less_than_18', 'male_18_to_29', 'female_18_to_29',
+    'male_30_to_49', 'female_30_to_49', 'male_50_to_64', 'female_50_to_64',
+    'male_65_plus', 'female_65_plus',
+]
+TRAFFIC_COUNT_COLUMNS = ['large', 'normal', 'bicycle', 'motorcycle']
+
+# raw table -> (index prefix, count columns)
+TABLES = {
+    'city_eye_human_data': ('human', HUMAN_COUNT_COLUMNS),
+    'city_eye_traffic_data': ('traffic', TRAFFIC_COUNT_COLUMNS),
+}
+
+# Monthly partitions created beyond the current month (app/db/partitions.py keeps extending them)
+MONTHS_AHEAD = 3
+
+
+def _columns(count_columns):
+    return ['data_id', 'device_id', 'solution_id', 'device_solution_id', 'timestamp',
+            'polygon_id_in', 'polygon_id_out', *count_columns, 'created_at', 'updated_at']
+
+
+def _create_data_table(table_name, count_columns, partitioned):
+    op.create_table(table_name,
+    sa.Column('data_id', sa.UUID(), nullable=False),
+    sa.Column('device_id', sa.UUID(), nullable=False),
+    sa.Column('solution_id', sa.UUID(), nullable=False),
+    sa.Column('device_solution_id', sa.UUID(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.Column('polygon_id_in', sa.String(), nullable=False),
+    sa.Column('polygon_id_out', sa.String(), nullable=False),
+    *[sa.Column(column, sa.Integer(), nullable=False) for column in count_columns],
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['device_id'], ['devices.device_id'], ),
+    sa.ForeignKeyConstraint(['device_solution_id'], ['device_solutions.id'], ),
+    sa.ForeignKeyConstraint(['solution_id'], ['solutions.solution_id'], ),
+    # The partition key has to be part of every unique constraint of a partitioned table
+    sa.PrimaryKeyConstraint('data_id', 'timestamp') if partitioned else sa.PrimaryKeyConstraint('data_id'),
+    **({'postgresql_partition_by': 'RANGE ("timestamp")'} if partitioned else {})
+    )
+
+
+def _create_indexes_and_triggers(table_name, index_prefix):
+    op.create_index(f'idx_{index_prefix}_timestamp_device', table_name, ['timestamp', 'device_id'], unique=False)
+    op.create_index(f'idx_{index_prefix}_polygon_in_out', table_name, ['polygon_id_in', 'polygon_id_out'], unique=False)
+
+    # The rollup functions from a7c41e9b2d53 survive the table swap, only the triggers need recreating
+    op.execute(
+        f'CREATE TRIGGER {table_name}_rollup_insert AFTER INSERT ON {table_name} '
+        f'REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION {table_name}_rollup()'
+    )
+    op.execute(
+        f'CREATE TRIGGER {table_name}_rollup_delete AFTER DELETE ON {table_name} '
+        f'REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION {table_name}_rollup()'
+    )
+    op.execute(
+        f'CREATE TRIGGER {table_name}_rollup_update AFTER UPDATE ON {table_name} '
+        f'REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION {table_name}_rollup()'
+    )
+
+
+def _create_monthly_partitions_sql(table_name, source_table):
+    """
+    Creates <table>_pYYYY_MM partitions from the oldest month in source_table through
+    MONTHS_AHEAD months from now, plus a default partition for rows outside of them.
+    """
+    return f"""
+DO $$
+DECLARE
+    month_start date := date_trunc('month', coalesce((SELECT min("timestamp") FROM {source_table}), now()));
+    last_month date := date_trunc('month', now()) + interval '{MONTHS_AHEAD} months';
+BEGIN
+    WHILE month_start <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF {table_name} FOR VALUES FROM (%L) TO (%L)',
+            '{table_name}_p' || to_char(month_start, 'YYYY_MM'), month_start, month_start + interval '1 month'
+        );
+        month_start := month_start + interval '1 month';
+    END LOOP;
+END $$;
+CREATE TABLE {table_name}_default PARTITION OF {table_name} DEFAULT;
+"""
+
+
+def _swap_table(table_name, index_prefix, count_columns, partitioned):
+    """
+    Replaces table_name with a (non-)partitioned copy holding the same rows. Rows are copied
+    before the rollup triggers exist, so the rollups are not counted twice.
+    """
+    old_table = f'{table_name}_old'
+    op.execute(f'ALTER TABLE {table_name} RENAME TO {old_table}')
+    op.execute(f'ALTER TABLE {old_table} RENAME CONSTRAINT {table_name}_pkey TO {old_table}_pkey')
+    op.drop_index(f'idx_{index_prefix}_polygon_in_out', table_name=old_table)
+    op.drop_index(f'idx_{index_prefix}_timestamp_device', table_name=old_table)
+
+    _create_data_table(table_name, count_columns, partitioned)
+    if partitioned:
+        op.execute(_create_monthly_partitions_sql(table_name, old_table))
+
+    columns = ', '.join(f'"{column}"' for column in _columns(count_columns))
+    op.execute(f'INSERT INTO {table_name} ({columns}) SELECT {columns} FROM {old_table}')
+    # CASCADE also drops the partitions of a partitioned old table
+    op.execute(f'DROP TABLE {old_table} CASCADE')
+
+    _create_indexes_and_triggers(table_name, index_prefix)
+
+
+def upgrade() -> None:
+    for table_name, (index_prefix, count_columns) in TABLES.items():
+        _swap_table(table_name, index_prefix, count_columns, partitioned=True)
+
+
+def downgrade() -> None:
+    for table_name, (index_prefix, count_columns) in TABLES.items():
+        _swap_table(table_name, index_prefix, count_columns, partitioned=False)
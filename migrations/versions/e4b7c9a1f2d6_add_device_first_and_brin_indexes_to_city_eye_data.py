@@ -0,0 +1,74 @@
+"""Add device-first covering, BRIN indexes and hour/dow columns to City Eye data
+
+Revision ID: e4b7c9a1f2d6
+Revises: c5f1a2d7e8b4
+Create Date: 2026-10-16 16:45:03.129874
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7c9a1f2d6'
+down_revision = 'c5f1a2d7e8b4'
+branch_labels = None
+depends_on = None
+
+
+HUMAN_COUNT_COLUMNS = [
+    'male_less_than_18', 'female_less_than_18', 'male_18_to_29', 'female_18_to_29',
+    'male_30_to_49', 'female_30_to_49', 'male_50_to_64', 'female_50_to_64',
+    'male_65_plus', 'female_65_plus',
+]
+TRAFFIC_COUNT_COLUMNS = ['large', 'normal', 'bicycle', 'motorcycle']
+
+# raw table -> (index prefix, count columns)
+RAW_TABLES = {
+    'city_eye_human_data': ('human', HUMAN_COUNT_COLUMNS),
+    'city_eye_traffic_data': ('traffic', TRAFFIC_COUNT_COLUMNS),
+}
+ROLLUP_TABLES = ['city_eye_human_hourly', 'city_eye_human_daily', 'city_eye_traffic_hourly', 'city_eye_traffic_daily']
+
+# Generated column -> EXTRACT field. Both are immutable on "timestamp without time zone".
+TIME_PART_COLUMNS = {'hour_of_day': 'hour', 'day_of_week': 'dow'}
+
+
+def _add_time_part_columns(table_name):
+    for column, field in TIME_PART_COLUMNS.items():
+        op.add_column(table_name, sa.Column(
+            column, sa.SmallInteger(),
+            sa.Computed(f'CAST(EXTRACT({field} FROM "timestamp") AS smallint)', persisted=True),
+            nullable=True,
+        ))
+
+
+def upgrade() -> None:
+    for table_name in [*RAW_TABLES, *ROLLUP_TABLES]:
+        _add_time_part_columns(table_name)
+
+    for table_name, (index_prefix, count_columns) in RAW_TABLES.items():
+        # Every analytics query filters device_id IN (...) and a time range, so the device leads.
+        # The INCLUDE columns are everything those queries read, enabling index-only scans.
+        op.create_index(
+            f'idx_{index_prefix}_device_timestamp', table_name, ['device_id', 'timestamp'], unique=False,
+            postgresql_include=['polygon_id_in', 'polygon_id_out', *TIME_PART_COLUMNS, *count_columns],
+        )
+        # Superseded by the device-first index above (time-only scans use the BRIN index)
+        op.drop_index(f'idx_{index_prefix}_timestamp_device', table_name=table_name)
+        # Rows arrive in time order, so a tiny BRIN index prunes blocks for time range scans
+        op.create_index(
+            f'idx_{index_prefix}_timestamp_brin', table_name, ['timestamp'], unique=False,
+            postgresql_using='brin',
+        )
+
+
+def downgrade() -> None:
+    for table_name, (index_prefix, _) in RAW_TABLES.items():
+        op.drop_index(f'idx_{index_prefix}_timestamp_brin', table_name=table_name)
+        op.create_index(f'idx_{index_prefix}_timestamp_device', table_name, ['timestamp', 'device_id'], unique=False)
+        op.drop_index(f'idx_{index_prefix}_device_timestamp', table_name=table_name)
+
+    for table_name in [*RAW_TABLES, *ROLLUP_TABLES]:
+        for column in reversed(list(TIME_PART_COLUMNS)):
+            op.drop_column(table_name, column)
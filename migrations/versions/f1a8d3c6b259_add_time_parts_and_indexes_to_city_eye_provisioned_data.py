@@ -0,0 +1,54 @@
+"""Add hour/dow columns and device-first indexes to City Eye provisioned data
+
+Revision ID: f1a8d3c6b259
+Revises: e4b7c9a1f2d6
+Create Date: 2026-10-16 18:12:40.512308
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a8d3c6b259'
+down_revision = 'e4b7c9a1f2d6'
+branch_labels = None
+depends_on = None
+
+
+HUMAN_COUNT_COLUMNS = [
+    'male_less_than_18', 'female_less_than_18', 'male_18_to_29', 'female_18_to_29',
+    'male_30_to_49', 'female_30_to_49', 'male_50_to_64', 'female_50_to_64',
+    'male_65_plus', 'female_65_plus',
+]
+TRAFFIC_COUNT_COLUMNS = ['large', 'normal', 'bicycle', 'motorcycle']
+
+# provisioned table -> (index prefix, count columns)
+PROVISIONED_TABLES = {
+    'city_eye_provisioned_human_data': ('provisioned_human', HUMAN_COUNT_COLUMNS),
+    'city_eye_provisioned_traffic_data': ('provisioned_traffic', TRAFFIC_COUNT_COLUMNS),
+}
+
+# Same generated columns as the live tables (e4b7c9a1f2d6), so the analytics filters apply unchanged
+TIME_PART_COLUMNS = {'hour_of_day': 'hour', 'day_of_week': 'dow'}
+
+
+def upgrade() -> None:
+    for table_name, (index_prefix, count_columns) in PROVISIONED_TABLES.items():
+        for column, field in TIME_PART_COLUMNS.items():
+            op.add_column(table_name, sa.Column(
+                column, sa.SmallInteger(),
+                sa.Computed(f'CAST(EXTRACT({field} FROM "timestamp") AS smallint)', persisted=True),
+                nullable=True,
+            ))
+        op.create_index(
+            f'idx_{index_prefix}_device_timestamp', table_name, ['device_id', 'timestamp'], unique=False,
+            postgresql_include=['polygon_id_in', 'polygon_id_out', *TIME_PART_COLUMNS, *count_columns],
+        )
+
+
+def downgrade() -> None:
+    for table_name, (index_prefix, _) in PROVISIONED_TABLES.items():
+        op.drop_index(f'idx_{index_prefix}_device_timestamp', table_name=table_name)
+        for column in reversed(list(TIME_PART_COLUMNS)):
+            op.drop_column(table_name, column)
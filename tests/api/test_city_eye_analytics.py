@@ -3,6 +3,7 @@ Test cases for City Eye analytics routes.
 """
 import pytest
 import uuid
+import json
 from datetime import date
 from unittest.mock import patch
 from fastapi.testclient import TestClient
@@ -12,7 +13,7 @@ from sqlalchemy import select
 from app.models import User, UserRole, UserStatus, Device, Solution, CustomerSolution, DeviceSolution, Customer,SolutionPackage
 from app.core.config import settings
 from app.core.security import create_access_token, get_password_hash
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 # Test cases for successful analytics requests
 @pytest.mark.asyncio
@@ -396,6 +397,42 @@ async def test_get_human_flow_analytics_device_no_city_eye_deployed(
     assert isinstance(data, list)
     assert len(data) == 0
 
+@pytest.mark.asyncio
+async def test_get_human_flow_analytics_customer_mixed_devices(
+    client: TestClient,
+    customer_admin_token: str,
+    device: Device,
+    city_eye_solution: Solution,
+    city_eye_customer_solution: CustomerSolution,
+    city_eye_device_solution: DeviceSolution,
+    db: AsyncSession
+):
+    """Test that only deployed, owned devices are kept and the solution lookup is cached"""
+    result = await db.execute(select(Device).filter(Device.name == "Raspberry Pi Device"))
+    undeployed_device = result.scalars().first()
+
+    filters = {
+        "device_ids": [str(uuid.uuid4()), str(undeployed_device.device_id), str(device.device_id)],
+        "start_time": "2025-01-01T00:00:00",
+        "end_time": "2025-12-31T23:59:59"
+    }
+
+    from app.crud import solution as crud_solution
+    with patch.object(crud_solution, "get_by_name", wraps=crud_solution.get_by_name) as mock_get_by_name:
+        for _ in range(2):
+            response = client.post(
+                f"{settings.API_V1_STR}/analytics/city-eye/human-flow",
+                headers={"Authorization": f"Bearer {customer_admin_token}"},
+                json=filters,
+                params={"include_total_count": True}
+            )
+
+            assert response.status_code == 200
+            data = response.json()
+            assert [item["device_id"] for item in data] == [str(device.device_id)]
+
+    assert mock_get_by_name.call_count == 1
+
 @pytest.mark.asyncio
 async def test_get_human_flow_analytics_user_no_customer(
     client: TestClient,
@@ -659,6 +696,184 @@ async def test_get_human_flow_analytics_end_before_start(
     assert "total_count" in analytics_data
     assert analytics_data["total_count"]["total_count"] == 0
 
+@pytest.mark.asyncio
+async def test_get_human_flow_analytics_multiple_devices_values(
+    client: TestClient,
+    admin_token: str,
+    device: Device,
+    raspberry_device: Device,
+    city_eye_solution: Solution,
+    city_eye_customer_solution: CustomerSolution,
+    city_eye_device_solution: DeviceSolution,
+    city_eye_analytics_data
+):
+    """Test that metrics computed for several devices at once are split correctly per device"""
+    now = datetime.now()
+    filters = {
+        "device_ids": [str(device.device_id), str(raspberry_device.device_id)],
+        "start_time": (now - timedelta(days=1)).isoformat(),
+        "end_time": (now + timedelta(days=1)).isoformat()
+    }
+
+    response = client.post(
+        f"{settings.API_V1_STR}/analytics/city-eye/human-flow",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        json=filters,
+    )
+
+    assert response.status_code == 200
+    data = {item["device_id"]: item for item in response.json()}
+    assert len(data) == 2
+
+    device_data = data[str(device.device_id)]["analytics_data"]
+    assert data[str(device.device_id)]["error"] is None
+    assert device_data["total_count"]["total_count"] == 155
+    assert device_data["gender_distribution"] == {"male": 83, "female": 72}
+    assert device_data["age_distribution"]["under_18"] == 15
+    assert device_data["age_distribution"]["over_64"] == 14
+    assert device_data["age_gender_distribution"]["male_30_to_49"] == 33
+    assert sorted(item["count"] for item in device_data["hourly_distribution"]) == [72, 83]
+    assert [item["count"] for item in device_data["time_series_data"]] == [72, 83]
+
+    # A device without data still gets zeroed metrics
+    empty_data = data[str(raspberry_device.device_id)]["analytics_data"]
+    assert empty_data["total_count"]["total_count"] == 0
+    assert empty_data["gender_distribution"] == {"male": 0, "female": 0}
+    assert empty_data["hourly_distribution"] == []
+    assert empty_data["time_series_data"] == []
+
+@pytest.mark.asyncio
+async def test_get_human_flow_analytics_gender_filter_values(
+    client: TestClient,
+    admin_token: str,
+    device: Device,
+    city_eye_solution: Solution,
+    city_eye_customer_solution: CustomerSolution,
+    city_eye_device_solution: DeviceSolution,
+    city_eye_analytics_data
+):
+    """Test that gender and age group filters are applied to every metric"""
+    now = datetime.now()
+    filters = {
+        "device_ids": [str(device.device_id)],
+        "start_time": (now - timedelta(days=1)).isoformat(),
+        "end_time": (now + timedelta(days=1)).isoformat(),
+        "genders": ["female"],
+        "age_groups": ["18_to_29"]
+    }
+
+    response = client.post(
+        f"{settings.API_V1_STR}/analytics/city-eye/human-flow",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        json=filters,
+    )
+
+    assert response.status_code == 200
+    analytics_data = response.json()[0]["analytics_data"]
+    assert analytics_data["total_count"]["total_count"] == 17
+    assert analytics_data["gender_distribution"] == {"male": 0, "female": 17}
+    assert analytics_data["age_distribution"]["age_18_to_29"] == 17
+    assert analytics_data["age_gender_distribution"]["male_18_to_29"] == 0
+    assert sum(item["count"] for item in analytics_data["time_series_data"]) == 17
+
+@pytest.mark.asyncio
+async def test_get_human_flow_analytics_interval_minutes(
+    client: TestClient,
+    db: AsyncSession,
+    admin_token: str,
+    device: Device,
+    city_eye_solution: Solution,
+    city_eye_customer_solution: CustomerSolution,
+    city_eye_device_solution: DeviceSolution,
+):
+    """Test that time series are bucketed by interval_minutes"""
+    from app.models import CityEyeHumanTable
+
+    for minute, count in [(5, 1), (20, 2), (25, 3), (50, 4)]:
+        db.add(CityEyeHumanTable(
+            device_id=device.device_id,
+            solution_id=city_eye_solution.solution_id,
+            device_solution_id=city_eye_device_solution.id,
+            timestamp=datetime(2025, 3, 1, 10, minute),
+            polygon_id_in="1",
+            polygon_id_out="2",
+            male_less_than_18=0, female_less_than_18=0, male_18_to_29=count, female_18_to_29=0,
+            male_30_to_49=0, female_30_to_49=0, male_50_to_64=0, female_50_to_64=0,
+            male_65_plus=0, female_65_plus=0,
+        ))
+    await db.commit()
+
+    filters = {
+        "device_ids": [str(device.device_id)],
+        "start_time": "2025-03-01T00:00:00",
+        "end_time": "2025-03-02T00:00:00"
+    }
+
+    response = client.post(
+        f"{settings.API_V1_STR}/analytics/city-eye/human-flow",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        params={"interval_minutes": 15},
+        json=filters,
+    )
+
+    assert response.status_code == 200
+    analytics_data = response.json()[0]["analytics_data"]
+    assert analytics_data["time_series_interval_minutes"] == 15
+    assert [(item["timestamp"], item["count"]) for item in analytics_data["time_series_data"]] == [
+        ("2025-03-01T10:00:00", 1),
+        ("2025-03-01T10:15:00", 5),
+        ("2025-03-01T10:45:00", 4),
+    ]
+
+@pytest.mark.asyncio
+async def test_get_human_flow_analytics_interval_coarsened_for_long_range(
+    client: TestClient,
+    admin_token: str,
+    device: Device,
+    city_eye_solution: Solution,
+    city_eye_customer_solution: CustomerSolution,
+    city_eye_device_solution: DeviceSolution,
+):
+    """Test that hourly buckets over a year are coarsened to stay under the max number of points"""
+    filters = {
+        "device_ids": [str(device.device_id)],
+        "start_time": "2025-01-01T00:00:00",
+        "end_time": "2026-01-01T00:00:00"
+    }
+
+    response = client.post(
+        f"{settings.API_V1_STR}/analytics/city-eye/human-flow",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        params={"interval_minutes": 60},
+        json=filters,
+    )
+
+    assert response.status_code == 200
+    # 8760 hourly points exceed ANALYTICS_MAX_TIME_SERIES_POINTS, 12 hour buckets give 730
+    assert response.json()[0]["analytics_data"]["time_series_interval_minutes"] == 720
+
+@pytest.mark.asyncio
+async def test_get_human_flow_analytics_invalid_interval(
+    client: TestClient,
+    admin_token: str,
+    device: Device,
+):
+    """Test that a non-positive interval is rejected"""
+    filters = {
+        "device_ids": [str(device.device_id)],
+        "start_time": "2025-01-01T00:00:00",
+        "end_time": "2025-01-02T00:00:00"
+    }
+
+    response = client.post(
+        f"{settings.API_V1_STR}/analytics/city-eye/human-flow",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        params={"interval_minutes": 0},
+        json=filters,
+    )
+
+    assert response.status_code == 422
+
 # =============================================================================
 # TRAFFIC FLOW ANALYTICS TESTS
 # =============================================================================
@@ -840,6 +1055,92 @@ async def test_get_traffic_flow_analytics_selective_includes(
     assert analytics_data.get("hourly_distribution") is None
     assert analytics_data.get("time_series_data") is None
 
+@pytest.mark.asyncio
+async def test_get_traffic_flow_analytics_daily_interval(
+    client: TestClient,
+    admin_token: str,
+    device: Device,
+    city_eye_solution: Solution,
+    city_eye_customer_solution: CustomerSolution,
+    city_eye_device_solution: DeviceSolution,
+    city_eye_traffic_data
+):
+    """Test traffic time series with day-sized buckets"""
+    now = datetime.now()
+    filters = {
+        "device_ids": [str(device.device_id)],
+        "start_time": (now - timedelta(days=1)).isoformat(),
+        "end_time": (now + timedelta(days=1)).isoformat()
+    }
+
+    response = client.post(
+        f"{settings.API_V1_STR}/analytics/city-eye/traffic-flow",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        json=filters,
+        params={"interval_minutes": 1440}
+    )
+
+    assert response.status_code == 200
+    analytics_data = response.json()[0]["analytics_data"]
+    assert analytics_data["time_series_interval_minutes"] == 1440
+    assert all(item["timestamp"].endswith("T00:00:00") for item in analytics_data["time_series_data"])
+    assert sum(item["count"] for item in analytics_data["time_series_data"]) == analytics_data["total_count"]["total_count"]
+
+@pytest.mark.asyncio
+async def test_get_traffic_flow_analytics_single_scan_for_all_devices(
+    client: TestClient,
+    admin_token: str,
+    device: Device,
+    raspberry_device: Device,
+    city_eye_solution: Solution,
+    city_eye_customer_solution: CustomerSolution,
+    city_eye_device_solution: DeviceSolution,
+):
+    """Test that the metrics of all devices are computed by one call, and a failing call is reported on every device"""
+    from app.crud.crud_city_eye_analytics import crud_city_eye_analytics
+
+    calls = []
+
+    async def traffic_flow_metrics(db, *, filters, metrics, interval_minutes):
+        calls.append(set(filters.device_ids))
+        return {device_id: {"total_count": 7} for device_id in filters.device_ids}
+
+    filters = {
+        "device_ids": [str(device.device_id), str(raspberry_device.device_id)],
+        "start_time": "2025-01-01T00:00:00",
+        "end_time": "2025-12-31T23:59:59"
+    }
+
+    with patch.object(crud_city_eye_analytics, "get_traffic_flow_metrics", side_effect=traffic_flow_metrics):
+        response = client.post(
+            f"{settings.API_V1_STR}/analytics/city-eye/traffic-flow",
+            headers={"Authorization": f"Bearer {admin_token}"},
+            json=filters,
+            params={
+                "include_vehicle_type_distribution": False,
+                "include_hourly_distribution": False,
+                "include_time_series": False,
+            },
+        )
+
+    assert response.status_code == 200
+    assert calls == [{device.device_id, raspberry_device.device_id}]
+    for item in response.json():
+        assert item["error"] is None
+        assert item["analytics_data"]["total_count"]["total_count"] == 7
+
+    with patch.object(crud_city_eye_analytics, "get_traffic_flow_metrics", side_effect=Exception("query failed")):
+        response = client.post(
+            f"{settings.API_V1_STR}/analytics/city-eye/traffic-flow",
+            headers={"Authorization": f"Bearer {admin_token}"},
+            json=filters,
+        )
+
+    assert response.status_code == 200
+    for item in response.json():
+        assert "query failed" in item["error"]
+        assert item["analytics_data"]["total_count"] is None
+
 @pytest.mark.asyncio
 async def test_get_traffic_flow_analytics_with_optional_filters(
     client: TestClient,
@@ -1508,4 +1809,451 @@ def test_update_threshold_config_success(
     assert response.status_code == 200
     data = response.json()
     assert data["thresholds"]["traffic_count_thresholds"] == [10, 20, 30]
-    assert data["thresholds"]["human_count_thresholds"] == [50, 100]
\ No newline at end of file
+    assert data["thresholds"]["human_count_thresholds"] == [50, 100]
+
+def test_rollup_segments_prefer_coarsest_tier():
+    """Partial buckets at the range edges fall through to finer tiers and the raw table"""
+    from types import SimpleNamespace
+    from app.crud.crud_city_eye_analytics import crud_city_eye_analytics
+    from app.models import CityEyeHumanTable, CityEyeHumanHourlyTable, CityEyeHumanDailyTable
+
+    postgres = SimpleNamespace(bind=SimpleNamespace(dialect=SimpleNamespace(name="postgresql")))
+    tiers = crud_city_eye_analytics._get_rollup_tiers(postgres, CityEyeHumanTable, resolution_minutes=None)
+    segments = crud_city_eye_analytics._plan_time_segments(
+        datetime(2025, 1, 1, 10, 30), datetime(2025, 4, 1, 15, 20), tiers, CityEyeHumanTable
+    )
+
+    assert segments == [
+        (CityEyeHumanTable, datetime(2025, 1, 1, 10, 30), datetime(2025, 1, 1, 11)),
+        (CityEyeHumanHourlyTable, datetime(2025, 1, 1, 11), datetime(2025, 1, 2)),
+        (CityEyeHumanDailyTable, datetime(2025, 1, 2), datetime(2025, 4, 1)),
+        (CityEyeHumanHourlyTable, datetime(2025, 4, 1), datetime(2025, 4, 1, 15)),
+        (CityEyeHumanTable, datetime(2025, 4, 1, 15), datetime(2025, 4, 1, 15, 20)),
+    ]
+
+    # Hour-aligned ranges never touch the raw table; day buckets are skipped for tz-aware bounds
+    jst = datetime.fromisoformat("2025-01-01T00:00:00+09:00").tzinfo
+    segments = crud_city_eye_analytics._plan_time_segments(
+        datetime(2025, 1, 1, tzinfo=jst), datetime(2025, 1, 3, 6, tzinfo=jst), tiers, CityEyeHumanTable
+    )
+    assert segments == [(CityEyeHumanHourlyTable, datetime(2025, 1, 1, tzinfo=jst), datetime(2025, 1, 3, 6, tzinfo=jst))]
+
+    # SQLite has no rollup triggers, so it always reads the raw table
+    sqlite = SimpleNamespace(bind=SimpleNamespace(dialect=SimpleNamespace(name="sqlite")))
+    assert crud_city_eye_analytics._get_rollup_tiers(sqlite, CityEyeHumanTable, resolution_minutes=None) == []
+
+
+@pytest.mark.asyncio
+async def test_human_flow_metrics_combines_rollup_and_raw_segments(
+    db: AsyncSession,
+    device: Device,
+    city_eye_solution: Solution,
+    city_eye_device_solution: DeviceSolution,
+):
+    """Rollup buckets inside the range and raw rows at its edges are summed exactly once"""
+    from app.crud.crud_city_eye_analytics import crud_city_eye_analytics
+    from app.models import CityEyeHumanTable, CityEyeHumanHourlyTable
+    from app.schemas.services.city_eye_analytics import AnalyticsFilters
+
+    def raw_row(timestamp, count):
+        return CityEyeHumanTable(
+            device_id=device.device_id,
+            solution_id=city_eye_solution.solution_id,
+            device_solution_id=city_eye_device_solution.id,
+            timestamp=timestamp,
+            polygon_id_in="1",
+            polygon_id_out="2",
+            male_less_than_18=0, female_less_than_18=0, male_18_to_29=count, female_18_to_29=0,
+            male_30_to_49=0, female_30_to_49=0, male_50_to_64=0, female_50_to_64=0,
+            male_65_plus=0, female_65_plus=0,
+        )
+
+    def hourly_row(timestamp, count):
+        return CityEyeHumanHourlyTable(
+            device_id=device.device_id,
+            polygon_id_in="1",
+            polygon_id_out="2",
+            timestamp=timestamp,
+            male_less_than_18=0, female_less_than_18=0, male_18_to_29=count, female_18_to_29=0,
+            male_30_to_49=0, female_30_to_49=0, male_50_to_64=0, female_50_to_64=0,
+            male_65_plus=0, female_65_plus=0,
+        )
+
+    db.add_all([
+        raw_row(datetime(2025, 3, 1, 10, 40), 1),   # leading edge, read from raw
+        raw_row(datetime(2025, 3, 1, 11, 10), 50),  # covered by the 11:00 rollup bucket below
+        hourly_row(datetime(2025, 3, 1, 11), 50),
+        hourly_row(datetime(2025, 3, 1, 12), 20),
+        raw_row(datetime(2025, 3, 1, 13, 5), 7),    # trailing edge, read from raw
+        hourly_row(datetime(2025, 3, 1, 13), 999),  # partial bucket, must not be used
+    ])
+    await db.commit()
+
+    filters = AnalyticsFilters(
+        device_ids=[device.device_id],
+        start_time=datetime(2025, 3, 1, 10, 30),
+        end_time=datetime(2025, 3, 1, 13, 30),
+    )
+    with patch.object(
+        crud_city_eye_analytics, "_get_rollup_tiers", return_value=[("hour", CityEyeHumanHourlyTable)]
+    ):
+        metrics = await crud_city_eye_analytics.get_human_flow_metrics(
+            db, filters=filters, metrics=["total_count", "hourly_distribution"]
+        )
+
+    device_metrics = metrics[device.device_id]
+    assert device_metrics["total_count"] == 78
+    assert device_metrics["hourly_distribution"] == [
+        {"hour": 10, "count": 1},
+        {"hour": 11, "count": 50},
+        {"hour": 12, "count": 20},
+        {"hour": 13, "count": 7},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_direction_counts_by_device_merges_in_and_out(
+    db: AsyncSession,
+    device: Device,
+    raspberry_device: Device,
+    city_eye_solution: Solution,
+    city_eye_device_solution: DeviceSolution,
+):
+    """In and out counts of all devices come from one grouped scan, without 'loss' polygons"""
+    from app.crud.crud_city_eye_analytics import crud_city_eye_analytics
+    from app.models import CityEyeHumanTable
+    from app.schemas.services.city_eye_analytics import DirectionAnalyticsFilters
+
+    def raw_row(device_id, polygon_id_in, polygon_id_out, count):
+        return CityEyeHumanTable(
+            device_id=device_id,
+            solution_id=city_eye_solution.solution_id,
+            device_solution_id=city_eye_device_solution.id,
+            timestamp=datetime(2025, 3, 1, 10),
+            polygon_id_in=polygon_id_in,
+            polygon_id_out=polygon_id_out,
+            male_less_than_18=0, female_less_than_18=0, male_18_to_29=count, female_18_to_29=0,
+            male_30_to_49=0, female_30_to_49=0, male_50_to_64=0, female_50_to_64=0,
+            male_65_plus=0, female_65_plus=0,
+        )
+
+    db.add_all([
+        raw_row(device.device_id, "1", "2", 5),
+        raw_row(device.device_id, "2", "loss", 3),
+        raw_row(device.device_id, "loss", "1", 4),
+        raw_row(raspberry_device.device_id, "1", "1", 10),
+    ])
+    await db.commit()
+
+    filters = DirectionAnalyticsFilters(
+        device_ids=[device.device_id, raspberry_device.device_id],
+        dates=[date(2025, 3, 1)],
+    )
+    counts_by_device = await crud_city_eye_analytics.get_direction_counts_by_device(db, filters=filters)
+
+    assert counts_by_device == {
+        device.device_id: {
+            "1": {"in_count": 5, "out_count": 4},
+            "2": {"in_count": 3, "out_count": 5},
+        },
+        raspberry_device.device_id: {
+            "1": {"in_count": 10, "out_count": 10},
+        },
+    }
+
+    counts = await crud_city_eye_analytics.get_direction_counts(db, filters=filters)
+    assert counts == {
+        "1": {"in_count": 15, "out_count": 14},
+        "2": {"in_count": 3, "out_count": 5},
+    }
+
+
+@pytest.mark.asyncio
+async def test_human_flow_analytics_repeated_request_served_from_cache(
+    client: TestClient,
+    admin_token: str,
+    customer_admin_token: str,
+    device: Device,
+    city_eye_solution: Solution,
+    city_eye_customer_solution: CustomerSolution,
+    city_eye_device_solution: DeviceSolution,
+    city_eye_analytics_data
+):
+    """Test that an identical filter body is answered from the analytics cache"""
+    filters = {
+        "device_ids": [str(device.device_id)],
+        "start_time": "2025-01-01T00:00:00",
+        "end_time": "2025-02-01T00:00:00",
+        "days": ["monday", "tuesday"]
+    }
+    url = f"{settings.API_V1_STR}/analytics/city-eye/human-flow"
+    headers = {"Authorization": f"Bearer {admin_token}"}
+
+    first = client.post(url, headers=headers, json=filters)
+    hits_before = client.get(f"{settings.API_V1_STR}/analytics/city-eye/cache-stats", headers=headers).json()["hits"]
+
+    filters["days"] = ["Tuesday", "monday"]
+    second = client.post(url, headers=headers, json=filters)
+    stats = client.get(f"{settings.API_V1_STR}/analytics/city-eye/cache-stats", headers=headers).json()
+
+    assert first.status_code == 200
+    assert second.json() == first.json()
+    assert stats["hits"] == hits_before + 1
+
+    # Cache statistics are restricted to admins and engineers
+    response = client.get(
+        f"{settings.API_V1_STR}/analytics/city-eye/cache-stats",
+        headers={"Authorization": f"Bearer {customer_admin_token}"},
+    )
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_human_flow_analytics_provisioned_source(
+    client: TestClient,
+    db: AsyncSession,
+    admin_token: str,
+    device: Device,
+    city_eye_solution: Solution,
+    city_eye_customer_solution: CustomerSolution,
+    city_eye_device_solution: DeviceSolution,
+):
+    """Test that source=provisioned reads the provisioned tables instead of the live ones"""
+    from app.models import CityEyeHumanTable, CityEyeProvisionedHumanTable
+
+    common = dict(
+        device_id=device.device_id,
+        solution_id=city_eye_solution.solution_id,
+        device_solution_id=city_eye_device_solution.id,
+        timestamp=datetime(2025, 3, 1, 10, 0),
+        polygon_id_in="1",
+        polygon_id_out="2",
+    )
+    db.add_all([
+        CityEyeProvisionedHumanTable(**common, male_18_to_29=4, female_30_to_49=6),
+        CityEyeHumanTable(**common, male_18_to_29=100),
+    ])
+    await db.commit()
+
+    filters = {
+        "device_ids": [str(device.device_id)],
+        "start_time": "2025-03-01T00:00:00",
+        "end_time": "2025-03-02T00:00:00",
+        "source": "provisioned",
+    }
+    response = client.post(
+        f"{settings.API_V1_STR}/analytics/city-eye/human-flow",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        json=filters,
+    )
+
+    assert response.status_code == 200
+    analytics_data = response.json()[0]["analytics_data"]
+    assert analytics_data["total_count"]["total_count"] == 10
+    assert analytics_data["hourly_distribution"] == [{"hour": 10, "count": 10}]
+
+    # The default source still reads live data
+    del filters["source"]
+    response = client.post(
+        f"{settings.API_V1_STR}/analytics/city-eye/human-flow",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        json=filters,
+    )
+    assert response.json()[0]["analytics_data"]["total_count"]["total_count"] == 100
+
+
+@pytest.mark.asyncio
+async def test_export_human_flow_data_csv_and_ndjson(
+    client: TestClient,
+    db: AsyncSession,
+    admin_token: str,
+    device: Device,
+    city_eye_solution: Solution,
+    city_eye_customer_solution: CustomerSolution,
+    city_eye_device_solution: DeviceSolution,
+):
+    """Test streaming raw human flow rows as CSV and NDJSON"""
+    from app.models import CityEyeHumanTable
+
+    db.add_all([
+        CityEyeHumanTable(
+            device_id=device.device_id,
+            solution_id=city_eye_solution.solution_id,
+            device_solution_id=city_eye_device_solution.id,
+            timestamp=datetime(2025, 3, 1, hour, 0),
+            polygon_id_in="1",
+            polygon_id_out="2",
+            male_18_to_29=hour,
+        )
+        for hour in (11, 10, 23)
+    ])
+    await db.commit()
+
+    url = f"{settings.API_V1_STR}/analytics/city-eye/human-flow/export"
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    filters = {
+        "device_ids": [str(device.device_id)],
+        "start_time": "2025-03-01T00:00:00",
+        "end_time": "2025-03-01T12:00:00",
+    }
+
+    response = client.post(url, headers=headers, json=filters)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    lines = response.text.strip().splitlines()
+    assert lines[0].startswith("device_id,timestamp,polygon_id_in,polygon_id_out,male_less_than_18")
+    assert len(lines) == 3
+    assert lines[1].startswith(f"{device.device_id},2025-03-01T10:00:00,1,2")
+
+    response = client.post(url, headers=headers, json=filters, params={"format": "ndjson"})
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["male_18_to_29"] for row in rows] == [10, 11]
+
+    # Without any authorized device nothing is exported
+    response = client.post(url, headers=headers, json={**filters, "device_ids": [str(uuid.uuid4())]})
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_direction_counts_with_many_dates(
+    db: AsyncSession,
+    device: Device,
+    city_eye_solution: Solution,
+    city_eye_device_solution: DeviceSolution,
+):
+    """A long, non-contiguous date list selects exactly the listed days"""
+    from app.crud.crud_city_eye_analytics import crud_city_eye_analytics
+    from app.models import CityEyeHumanTable
+    from app.schemas.services.city_eye_analytics import DirectionAnalyticsFilters
+
+    db.add_all([
+        CityEyeHumanTable(
+            device_id=device.device_id,
+            solution_id=city_eye_solution.solution_id,
+            device_solution_id=city_eye_device_solution.id,
+            timestamp=datetime(2025, 3, day, 23, 30),
+            polygon_id_in="1",
+            polygon_id_out="2",
+            male_18_to_29=1,
+        )
+        for day in range(1, 31)
+    ])
+    await db.commit()
+
+    # Every other day of March, i.e. 15 separate ranges
+    filters = DirectionAnalyticsFilters(
+        device_ids=[device.device_id],
+        dates=[date(2025, 3, day) for day in range(1, 31, 2)],
+    )
+    counts = await crud_city_eye_analytics.get_direction_counts(db, filters=filters)
+
+    assert counts == {"1": {"in_count": 15, "out_count": 0}, "2": {"in_count": 0, "out_count": 15}}
+
+
+@pytest.mark.asyncio
+async def test_human_flow_analytics_week_over_week_comparison(
+    client: TestClient,
+    db: AsyncSession,
+    admin_token: str,
+    device: Device,
+    city_eye_solution: Solution,
+    city_eye_customer_solution: CustomerSolution,
+    city_eye_device_solution: DeviceSolution,
+):
+    """Test that a baseline offset adds current/baseline/delta/ratio per total metric"""
+    from app.models import CityEyeHumanTable
+
+    db.add_all([
+        CityEyeHumanTable(
+            device_id=device.device_id,
+            solution_id=city_eye_solution.solution_id,
+            device_solution_id=city_eye_device_solution.id,
+            timestamp=timestamp,
+            polygon_id_in="1",
+            polygon_id_out="2",
+            male_18_to_29=count,
+        )
+        for timestamp, count in ((datetime(2025, 3, 8, 10), 6), (datetime(2025, 3, 1, 10), 4))
+    ])
+    await db.commit()
+
+    url = f"{settings.API_V1_STR}/analytics/city-eye/human-flow"
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    filters = {
+        "device_ids": [str(device.device_id)],
+        "start_time": "2025-03-08T00:00:00",
+        "end_time": "2025-03-09T00:00:00",
+    }
+
+    response = client.post(url, headers=headers, json=filters, params={"baseline_offset_days": 7})
+    assert response.status_code == 200
+    analytics_data = response.json()[0]["analytics_data"]
+    comparison = analytics_data["comparison"]
+    assert comparison["baseline_start_time"] == "2025-03-01T00:00:00"
+    assert comparison["total_count"] == {"current": 6, "baseline": 4, "delta": 2, "ratio": 1.5}
+    assert comparison["gender_distribution"]["female"] == {"current": 0, "baseline": 0, "delta": 0, "ratio": None}
+    assert analytics_data["total_count"]["total_count"] == 6
+
+    # Without a baseline there is no comparison
+    response = client.post(url, headers=headers, json=filters)
+    assert response.json()[0]["analytics_data"]["comparison"] is None
+
+    # Offset and explicit baseline are mutually exclusive
+    response = client.post(
+        url, headers=headers, json=filters,
+        params={"baseline_offset_days": 7, "baseline_start_time": "2025-03-01T00:00:00"},
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_aggregate_human_flow_analytics_by_site_and_location(
+    client: TestClient,
+    db: AsyncSession,
+    admin_token: str,
+    device: Device,
+    raspberry_device: Device,
+    city_eye_solution: Solution,
+    city_eye_device_solution: DeviceSolution,
+):
+    """Test summing all devices into one site item, or one item per device location"""
+    from app.models import CityEyeHumanTable
+
+    device.location = "Gate A"
+    raspberry_device.location = "Gate B"
+    db.add_all([
+        CityEyeHumanTable(
+            device_id=device_id,
+            solution_id=city_eye_solution.solution_id,
+            device_solution_id=city_eye_device_solution.id,
+            timestamp=datetime(2025, 3, 1, 10),
+            polygon_id_in="1",
+            polygon_id_out="2",
+            male_18_to_29=count,
+        )
+        for device_id, count in ((device.device_id, 5), (device.device_id, 2), (raspberry_device.device_id, 3))
+    ])
+    await db.commit()
+
+    url = f"{settings.API_V1_STR}/analytics/city-eye/human-flow/aggregate"
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    filters = {
+        "device_ids": [str(device.device_id), str(raspberry_device.device_id)],
+        "start_time": "2025-03-01T00:00:00",
+        "end_time": "2025-03-02T00:00:00",
+    }
+
+    response = client.post(url, headers=headers, json=filters)
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 1
+    assert data[0]["location"] is None
+    assert set(data[0]["device_ids"]) == {str(device.device_id), str(raspberry_device.device_id)}
+    assert data[0]["analytics_data"]["total_count"]["total_count"] == 10
+    assert data[0]["analytics_data"]["hourly_distribution"] == [{"hour": 10, "count": 10}]
+
+    response = client.post(url, headers=headers, json=filters, params={"aggregate": "location"})
+    assert response.status_code == 200
+    totals = {item["location"]: item["analytics_data"]["total_count"]["total_count"] for item in response.json()}
+    assert totals == {"Gate A": 7, "Gate B": 3}
@@ -0,0 +1,204 @@
+"""
+Test cases for City Eye bulk ingestion routes.
+"""
+import json
+import pytest
+import uuid
+from datetime import timedelta
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func
+
+from app.models import Device, Solution, DeviceSolution, CityEyeHumanTable, CityEyeTrafficTable
+from app.core.config import settings
+from app.db.async_session import jst_now
+
+
+@pytest.fixture(autouse=True)
+def accept_fixed_timestamps():
+    # The rows below are timestamped in 2025, however long ago that is when the tests run
+    with patch.object(settings, "CITY_EYE_INGEST_MAX_PAST_DAYS", 100 * 365):
+        yield
+
+
+def _human_row(device_id, timestamp="2025-03-01T10:00:00", polygon_id_in="1", polygon_id_out="2", count=1):
+    return {
+        "device_id": str(device_id),
+        "timestamp": timestamp,
+        "polygon_id_in": polygon_id_in,
+        "polygon_id_out": polygon_id_out,
+        "male_less_than_18": 0, "female_less_than_18": 0, "male_18_to_29": count, "female_18_to_29": 0,
+        "male_30_to_49": 0, "female_30_to_49": 0, "male_50_to_64": 0, "female_50_to_64": 0,
+        "male_65_plus": 0, "female_65_plus": 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_ingest_human_flow_ndjson(
+    client: TestClient,
+    db: AsyncSession,
+    device: Device,
+    raspberry_device: Device,
+    city_eye_solution: Solution,
+    city_eye_device_solution: DeviceSolution,
+):
+    """Test that valid rows are loaded once and invalid, undeployed and duplicate rows are reported"""
+    rows = [
+        _human_row(device.device_id, count=5),
+        _human_row(device.device_id, timestamp="2025-03-01T11:00:00+09:00", count=3),
+        _human_row(device.device_id, count=7),  # same key as the first row, the last one wins
+        _human_row(device.device_id, count=-1),
+        _human_row(raspberry_device.device_id),  # City Eye is not deployed on this device
+    ]
+    body = "\n".join(json.dumps(row) for row in rows)
+
+    def post():
+        return client.post(
+            f"{settings.API_V1_STR}/ingest/city-eye/human-flow",
+            headers={"X-API-Key": settings.INTERNAL_API_KEY, "Content-Type": "application/x-ndjson"},
+            content=body,
+        )
+
+    response = post()
+    assert response.status_code == 200
+    data = response.json()
+    assert data["received"] == 5
+    assert data["inserted"] == 2
+    assert data["duplicates"] == 1
+    assert data["rejected"] == 2
+    assert data["errors"][0] == {"row": 3, "error": "Invalid male_18_to_29: must be a non-negative integer"}
+
+    result = await db.execute(
+        select(func.sum(CityEyeHumanTable.male_18_to_29)).filter(CityEyeHumanTable.device_id == device.device_id)
+    )
+    assert result.scalar() == 10
+
+    # Retrying the same batch stores nothing new
+    retry = post().json()
+    assert retry["inserted"] == 0
+    assert retry["duplicates"] == 3
+
+
+@pytest.mark.asyncio
+async def test_ingest_traffic_flow_columnar(
+    client: TestClient,
+    db: AsyncSession,
+    device: Device,
+    city_eye_solution: Solution,
+    city_eye_device_solution: DeviceSolution,
+):
+    """Test ingestion of a columnar traffic payload"""
+    payload = {
+        "device_id": [str(device.device_id)] * 2,
+        "timestamp": ["2025-03-01T10:00:00", "2025-03-01T10:05:00"],
+        "polygon_id_in": ["1", "2"],
+        "polygon_id_out": ["2", "1"],
+        "large": [1, 0],
+        "normal": [4, 2],
+        "bicycle": [0, 1],
+        "motorcycle": [0, 0],
+    }
+
+    response = client.post(
+        f"{settings.API_V1_STR}/ingest/city-eye/traffic-flow",
+        headers={"X-API-Key": settings.INTERNAL_API_KEY},
+        json=payload,
+    )
+
+    assert response.status_code == 200
+    assert response.json()["inserted"] == 2
+    result = await db.execute(
+        select(func.count()).select_from(CityEyeTrafficTable).filter(CityEyeTrafficTable.device_id == device.device_id)
+    )
+    assert result.scalar() == 2
+
+
+@pytest.mark.asyncio
+async def test_ingest_rejects_implausible_timestamps(
+    client: TestClient,
+    device: Device,
+    city_eye_solution: Solution,
+    city_eye_device_solution: DeviceSolution,
+):
+    """Test that rows timestamped far from now are reported as row errors"""
+    now = jst_now().replace(tzinfo=None)
+    rows = [
+        _human_row(device.device_id, timestamp=now.isoformat()),
+        _human_row(device.device_id, timestamp=(now + timedelta(days=1)).isoformat()),
+        _human_row(device.device_id, timestamp="1970-01-01T00:00:00"),
+    ]
+
+    response = client.post(
+        f"{settings.API_V1_STR}/ingest/city-eye/human-flow",
+        headers={"X-API-Key": settings.INTERNAL_API_KEY, "Content-Type": "application/x-ndjson"},
+        content="\n".join(json.dumps(row) for row in rows),
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["inserted"] == 1
+    assert data["rejected"] == 2
+    assert [error["row"] for error in data["errors"]] == [1, 2]
+    assert all(error["error"].startswith("Invalid timestamp: outside") for error in data["errors"])
+
+
+@pytest.mark.asyncio
+async def test_ingest_columnar_length_mismatch(client: TestClient):
+    """Test that columns of different lengths reject the whole batch"""
+    payload = {
+        "device_id": [str(uuid.uuid4())], "timestamp": [], "polygon_id_in": [], "polygon_id_out": [],
+        "large": [], "normal": [], "bicycle": [], "motorcycle": [],
+    }
+    response = client.post(
+        f"{settings.API_V1_STR}/ingest/city-eye/traffic-flow",
+        headers={"X-API-Key": settings.INTERNAL_API_KEY},
+        json=payload,
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_ingest_backpressure(client: TestClient, device: Device):
+    """Test that a saturated worker answers 429 with Retry-After"""
+    from app.api.routes.services.city_eye.city_eye_ingest import ingest_backpressure
+
+    with patch.object(ingest_backpressure, "in_flight", settings.CITY_EYE_INGEST_MAX_BUFFERED_ROWS):
+        response = client.post(
+            f"{settings.API_V1_STR}/ingest/city-eye/human-flow",
+            headers={"X-API-Key": settings.INTERNAL_API_KEY, "Content-Type": "application/x-ndjson"},
+            content=json.dumps(_human_row(device.device_id)),
+        )
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == str(settings.CITY_EYE_INGEST_RETRY_AFTER_SECONDS)
+
+
+@pytest.mark.asyncio
+async def test_ingest_oversized_body_is_refused_before_parsing(client: TestClient, device: Device):
+    """Test that a body over the byte limit gets 413 without being parsed or holding rows"""
+    from app.api.routes.services.city_eye.city_eye_ingest import ingest_backpressure
+
+    body = "\n".join(json.dumps(_human_row(device.device_id, count=count)) for count in range(10))
+    with patch.object(settings, "CITY_EYE_INGEST_MAX_BODY_BYTES", len(body) - 1), \
+            patch("app.api.routes.services.city_eye.city_eye_ingest.parse_columns") as mock_parse:
+        response = client.post(
+            f"{settings.API_V1_STR}/ingest/city-eye/human-flow",
+            headers={"X-API-Key": settings.INTERNAL_API_KEY, "Content-Type": "application/x-ndjson"},
+            content=body,
+        )
+
+    assert response.status_code == 413
+    mock_parse.assert_not_called()
+    assert ingest_backpressure.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_ingest_invalid_api_key(client: TestClient):
+    """Test ingestion with an invalid API key"""
+    response = client.post(
+        f"{settings.API_V1_STR}/ingest/city-eye/human-flow",
+        headers={"X-API-Key": "invalid-key"},
+        json={},
+    )
+    assert response.status_code == 401
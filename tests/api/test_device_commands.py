@@ -12,6 +12,7 @@ from app.core.config import settings
 from app.models import User, Device, DeviceSolution, CommandType
 from app.crud import device_command
 from app.schemas.device_command import DeviceCommandCreate
+from app.utils.xlines_config_cache import xlines_config_cache
 from app.models.customer import Customer
 
 
@@ -222,6 +223,42 @@ async def test_update_command_status_internal_success(
     assert data["message_id"] == str(db_command.message_id)
 
 
+@pytest.mark.asyncio
+async def test_applied_polygon_update_drops_cached_geometry(
+    client: TestClient,
+    db: AsyncSession,
+    active_device: Device,
+    city_eye_device_solution: DeviceSolution,
+    admin_user: User
+):
+    """Cached polygon geometry is dropped once the device reports the new config, not before"""
+    command_create = DeviceCommandCreate(
+        device_id=active_device.device_id,
+        command_type=CommandType.UPDATE_POLYGON,
+        payload={"xlines_config": []},
+        user_id=admin_user.user_id,
+        solution_id=city_eye_device_solution.solution_id
+    )
+    db_command = await device_command.create(db, obj_in=command_create)
+    xlines_config_cache._entries[active_device.thing_name] = (float("inf"), [])
+
+    response = client.put(
+        f"{settings.API_V1_STR}/device-commands/internal/{db_command.message_id}/status",
+        headers={"X-API-Key": settings.INTERNAL_API_KEY},
+        json={"status": "FAILED", "error_message": "Shadow rejected"}
+    )
+    assert response.status_code == 200
+    assert active_device.thing_name in xlines_config_cache._entries
+
+    response = client.put(
+        f"{settings.API_V1_STR}/device-commands/internal/{db_command.message_id}/status",
+        headers={"X-API-Key": settings.INTERNAL_API_KEY},
+        json={"status": "SUCCESS"}
+    )
+    assert response.status_code == 200
+    assert active_device.thing_name not in xlines_config_cache._entries
+
+
 @pytest.mark.asyncio
 async def test_update_command_status_internal_invalid_api_key(
     client: TestClient
@@ -220,6 +220,81 @@ async def test_get_memory_metrics_error(mock_query_memory, client: TestClient, a
     assert "Error" in data["detail"]
 
 
+@pytest.mark.asyncio
+@patch('app.api.routes.device_metrics.query_memory_metrics')
+async def test_get_memory_metrics_timeout(mock_query_memory, client: TestClient, admin_token: str, device: Device):
+    """Test that an InfluxDB query timeout is reported as a gateway timeout"""
+    from app.utils.influxdb import InfluxQueryTimeout
+    mock_query_memory.side_effect = InfluxQueryTimeout("InfluxDB query timed out after 30 seconds")
+
+    response = client.get(
+        f"{settings.API_V1_STR}/device-metrics/memory?device_name={device.name}",
+        headers={"Authorization": f"Bearer {admin_token}"}
+    )
+
+    assert response.status_code == 504
+    assert "timed out" in response.json()["detail"]
+
+
+@pytest.mark.asyncio
+@patch('app.api.routes.device_metrics.query_metrics_batch')
+async def test_get_batch_metrics(mock_query_batch, client: TestClient, admin_token: str, device: Device):
+    """Test one InfluxDB query per metric family for all devices, with unknown devices reported per item"""
+    async def query_batch(family, device_names, start_time, end_time, interval):
+        if family == "cpu":
+            raise Exception("Influx unavailable")
+        return {name: [{"name": "Mem Used", "data": [{"timestamp": "2025-01-01T00:00:00+09:00", "value": 1.5}]}] for name in device_names}
+    mock_query_batch.side_effect = query_batch
+
+    response = client.post(
+        f"{settings.API_V1_STR}/device-metrics/batch",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        json={"device_names": [device.name, "nonexistent-device", device.name], "metrics": ["memory", "cpu"]}
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["interval"] == "5m"
+    assert [item["device_name"] for item in data["devices"]] == [device.name, "nonexistent-device"]
+
+    # One call per family, each with only the known devices
+    assert sorted(call.args[0] for call in mock_query_batch.call_args_list) == ["cpu", "memory"]
+    assert all(call.args[1] == [device.name] for call in mock_query_batch.call_args_list)
+
+    known, unknown = data["devices"]
+    assert known["metrics"]["memory"][0]["data"][0]["value"] == 1.5
+    assert "cpu" not in known["metrics"]
+    assert "Error querying cpu metrics" in known["error"]
+    assert unknown["metrics"] == {}
+    assert unknown["error"] == "Device not found"
+
+
+@pytest.mark.asyncio
+@patch('app.api.routes.device_metrics.query_metrics_batch')
+async def test_get_batch_metrics_coarsens_long_ranges(mock_query_batch, client: TestClient, admin_token: str, device: Device):
+    """Test that a range with too many points at the requested interval is read with a coarser one"""
+    async def query_batch(family, device_names, start_time, end_time, interval):
+        return {name: [] for name in device_names}
+    mock_query_batch.side_effect = query_batch
+
+    response = client.post(
+        f"{settings.API_V1_STR}/device-metrics/batch",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        json={
+            "device_names": [device.name],
+            "metrics": ["memory"],
+            "start_time": "2025-01-01T00:00:00+09:00",
+            "end_time": "2025-01-31T00:00:00+09:00",
+            "interval": 1,
+        }
+    )
+
+    assert response.status_code == 200
+    # 30 days at 1 minute would be 43200 points
+    assert response.json()["interval"] == "60m"
+    assert mock_query_batch.call_args.args[4] == 60
+
+
 # Test cases for CPU metrics endpoint (GET /device-metrics/cpu)
 @pytest.mark.asyncio
 @patch('app.api.routes.device_metrics.query_cpu_metrics')
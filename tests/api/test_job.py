@@ -146,18 +146,15 @@ async def test_create_reboot_job_aws_failure(client: TestClient, db: AsyncSessio
 
 # Test cases for retrieving jobs
 @pytest.mark.asyncio
-@patch('app.api.routes.jobs.sync_job_status')
+@patch('app.utils.aws_iot_jobs.iot_jobs_service.get_job_execution_status')
 async def test_get_device_jobs_success(
-    mock_sync: MagicMock,
+    mock_get_aws_status: MagicMock,
     client: TestClient,
     admin_token: str,
     active_device: Device,
     test_job: Job
 ):
     """Test retrieving jobs for a specific device."""
-    # The mock will just return the job object passed to it
-    mock_sync.side_effect = lambda db, job_obj: job_obj
-
     response = client.get(
         f"{settings.API_V1_STR}/jobs/device/{active_device.device_id}",
         headers={"Authorization": f"Bearer {admin_token}"},
@@ -168,7 +165,8 @@ async def test_get_device_jobs_success(
     assert len(data) > 0
     assert data[0]["job_id"] == test_job.job_id
     assert data[0]["device_id"] == str(active_device.device_id)
-    mock_sync.assert_called()
+    # Reads come from the database, the job reconciler talks to AWS
+    mock_get_aws_status.assert_not_called()
 
 @pytest.mark.asyncio
 async def test_get_device_jobs_unauthorized(
@@ -184,16 +182,12 @@ async def test_get_device_jobs_unauthorized(
     assert response.status_code == 403
 
 @pytest.mark.asyncio
-@patch('app.api.routes.jobs.sync_job_status')
 async def test_get_latest_job_success(
-    mock_sync: MagicMock,
     client: TestClient,
     admin_token: str,
     test_job: Job
 ):
     """Test retrieving the latest job for a device."""
-    mock_sync.side_effect = lambda db, job_obj: job_obj
-
     response = client.get(
         f"{settings.API_V1_STR}/jobs/device/{test_job.device_id}/latest",
         headers={"Authorization": f"Bearer {admin_token}"},
@@ -204,18 +198,16 @@ async def test_get_latest_job_success(
 
 # Test cases for job status and cancellation
 @pytest.mark.asyncio
-@patch('app.api.routes.jobs.sync_job_status')
 async def test_get_job_status_success(
-    mock_sync: MagicMock,
     client: TestClient,
+    db: AsyncSession,
     admin_token: str,
     test_job: Job
 ):
     """Test retrieving the status of a specific job."""
-    # Make the mock return an updated job object
-    updated_job = test_job
-    updated_job.status = JobStatus.IN_PROGRESS
-    mock_sync.return_value = updated_job
+    # As updated by the job reconciler
+    test_job.status = JobStatus.IN_PROGRESS
+    await db.commit()
 
     response = client.get(
         f"{settings.API_V1_STR}/jobs/{test_job.job_id}/status",
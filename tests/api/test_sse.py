@@ -0,0 +1,102 @@
+"""
+Test cases for SSE routes (multiple subscribers per key and the multiplexed stream)
+"""
+import asyncio
+import pytest
+import uuid
+from fastapi.testclient import TestClient
+
+from app.api.routes import sse
+from app.core.config import settings
+from app.models import Device
+
+
+def test_command_updates_reach_every_subscriber():
+    """A second tab on the same command gets the updates too instead of taking them over"""
+    message_id = str(uuid.uuid4())
+    first_tab, second_tab = asyncio.Queue(), asyncio.Queue()
+    sse.active_command_connections[message_id] = {first_tab, second_tab}
+    try:
+        sse.notify_command_update(message_id=message_id, status="SUCCESS")
+    finally:
+        sse.active_command_connections.pop(message_id, None)
+
+    assert first_tab.get_nowait()["status"] == "SUCCESS"
+    assert second_tab.get_nowait()["status"] == "SUCCESS"
+
+
+def test_stream_events_are_routed_by_topic_and_replayed():
+    message_id, job_id, device_id = str(uuid.uuid4()), f"job-{uuid.uuid4().hex[:8]}", uuid.uuid4()
+    device_stream = asyncio.Queue()
+    sse.active_stream_connections[f"device:{device_id}"] = {device_stream}
+    try:
+        sse.notify_command_update(message_id=message_id, status="SENT", device_id=device_id)
+        sse.notify_job_update(job_id=job_id, status="IN_PROGRESS", progress_percentage=50, device_id=device_id)
+        sse.notify_command_update(message_id=message_id, status="SUCCESS")  # Device unknown: command topic only
+    finally:
+        sse.active_stream_connections.pop(f"device:{device_id}", None)
+
+    received = [device_stream.get_nowait() for _ in range(device_stream.qsize())]
+    assert [(event_type, data["status"]) for _, event_type, data in received] == [("command", "SENT"), ("job", "IN_PROGRESS")]
+    assert received[0][2]["message_id"] == message_id
+
+    # A client that saw the first event gets the rest of its topics from the replay buffer
+    replayed = sse._replay_events(received[0][0], {f"command:{message_id}", f"job:{job_id}"})
+    assert [(event_type, data["status"]) for _, event_type, data in replayed] == [("job", "IN_PROGRESS"), ("command", "SUCCESS")]
+
+
+def test_command_responses_stay_off_device_topics():
+    message_id, device_id = str(uuid.uuid4()), uuid.uuid4()
+    device_stream, owner_stream = asyncio.Queue(), asyncio.Queue()
+    sse.active_stream_connections[f"device:{device_id}"] = {device_stream, owner_stream}
+    sse.active_stream_connections[f"command:{message_id}"] = {owner_stream}
+    try:
+        sse.notify_command_update(
+            message_id=message_id, status="SUCCESS", response_payload={"url": "s3://image"}, device_id=device_id
+        )
+    finally:
+        sse.active_stream_connections.pop(f"device:{device_id}", None)
+        sse.active_stream_connections.pop(f"command:{message_id}", None)
+
+    _, _, data = device_stream.get_nowait()
+    assert data["status"] == "SUCCESS"
+    assert "response_payload" not in data and "error_message" not in data
+
+    # A stream on both topics gets the event once, with the owner's data
+    assert owner_stream.qsize() == 1
+    assert owner_stream.get_nowait()[2]["response_payload"] == {"url": "s3://image"}
+
+    replayed = sse._replay_events(None, {f"device:{device_id}"})
+    assert "response_payload" not in replayed[-1][2]
+
+
+def test_format_event():
+    assert sse._format_event("job", {"status": "QUEUED"}, "abc") == 'id: abc\nevent: job\ndata: {"status": "QUEUED"}\n\n'
+    assert sse._format_event("job", {"status": "QUEUED"}) == 'event: job\ndata: {"status": "QUEUED"}\n\n'
+
+
+@pytest.mark.asyncio
+async def test_stream_requires_a_subscription(client: TestClient, admin_token: str):
+    response = client.get(f"{settings.API_V1_STR}/sse/stream", headers={"Authorization": f"Bearer {admin_token}"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_stream_unknown_command(client: TestClient, admin_token: str):
+    response = client.get(
+        f"{settings.API_V1_STR}/sse/stream",
+        headers={"Authorization": f"Bearer {admin_token}"},
+        params={"commands": [str(uuid.uuid4())]},
+    )
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_stream_other_customers_device(client: TestClient, customer_admin_token3: str, device: Device):
+    response = client.get(
+        f"{settings.API_V1_STR}/sse/stream",
+        headers={"Authorization": f"Bearer {customer_admin_token3}"},
+        params={"devices": [str(device.device_id)]},
+    )
+    assert response.status_code == 403
+    assert not sse.active_stream_connections
@@ -21,6 +21,8 @@ from typing import AsyncGenerator
 from app.core.config import settings
 from app.core.security import create_access_token, get_password_hash
 from app.db.async_session import Base, get_async_db
+from app.crud import solution as crud_solution
+from app.utils.xlines_config_cache import xlines_config_cache
 from app.main import app
 from app.models import (
     User, UserRole, UserStatus, Customer, CustomerStatus, Device, DeviceStatus,
@@ -28,6 +30,12 @@ from app.models import (
     LicenseStatus, SolutionStatus, SolutionPackage, CityEyeHumanTable, CityEyeTrafficTable, Job, JobType, JobStatus
 )
 
+# Tests must not run the background tasks against the app's configured database
+settings.CITY_EYE_PARTITION_MAINTENANCE_ENABLED = False
+settings.CITY_EYE_THRESHOLD_EVALUATOR_ENABLED = False
+settings.JOB_RECONCILER_ENABLED = False
+settings.EVENT_BROKER_BACKEND = "memory"  # SSE updates are delivered in the test process
+
 # Test database URL - use SQLite for tests
 TEST_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
@@ -62,6 +70,10 @@ async def db() -> AsyncGenerator[AsyncSession, None]:
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
+    # Solution IDs and device shadows differ per test, so drop any cached lookups
+    crud_solution.clear_name_cache()
+    xlines_config_cache.clear()
+
     # Create a db session
     async with TestingSessionLocal() as session:
         # Create test data
@@ -0,0 +1,154 @@
+"""
+Test cases for the City Eye analytics result cache.
+"""
+import uuid
+import pytest
+from datetime import datetime, timedelta, date
+from decimal import Decimal
+from unittest.mock import patch
+from zoneinfo import ZoneInfo
+
+from app.core.config import settings
+from app.schemas.services.city_eye_analytics import AnalyticsFilters, DirectionAnalyticsFilters
+from app.utils.analytics_cache import (
+    AnalyticsCache, CacheBackend, InMemoryCacheBackend, dump_cache_value, load_cache_value,
+)
+
+
+def _filters(**overrides) -> AnalyticsFilters:
+    values = {
+        "device_ids": [uuid.UUID(int=1), uuid.UUID(int=2)],
+        "start_time": datetime(2025, 1, 1),
+        "end_time": datetime(2025, 2, 1),
+        "days": ["monday", "friday"],
+    }
+    values.update(overrides)
+    return AnalyticsFilters(**values)
+
+
+def test_key_ignores_list_order_and_case():
+    cache = AnalyticsCache(InMemoryCacheBackend(max_entries=10))
+
+    key = cache.make_key("human", _filters(), metrics=["total_count", "time_series_data"])
+    same_key = cache.make_key(
+        "human",
+        _filters(device_ids=[uuid.UUID(int=2), uuid.UUID(int=1)], days=["Friday", "monday"]),
+        metrics=["time_series_data", "total_count"],
+    )
+
+    assert key == same_key
+    assert key != cache.make_key("traffic", _filters(), metrics=["total_count", "time_series_data"])
+    assert key != cache.make_key("human", _filters(days=["monday"]), metrics=["total_count", "time_series_data"])
+    assert key != cache.make_key("human", _filters(), metrics=["total_count"])
+
+
+def test_ttl_depends_on_range_touching_now():
+    cache = AnalyticsCache(InMemoryCacheBackend(max_entries=10))
+    now = datetime.now()
+
+    assert cache.get_ttl(_filters()) == settings.ANALYTICS_CACHE_HISTORICAL_TTL_SECONDS
+    assert cache.get_ttl(_filters(end_time=now + timedelta(days=1))) == settings.ANALYTICS_CACHE_LIVE_TTL_SECONDS
+    assert cache.get_ttl(DirectionAnalyticsFilters(dates=[date(2025, 1, 1)])) == settings.ANALYTICS_CACHE_HISTORICAL_TTL_SECONDS
+    today_jst = datetime.now(ZoneInfo("Asia/Tokyo")).date()
+    assert cache.get_ttl(DirectionAnalyticsFilters(dates=[date(2025, 1, 1), today_jst])) == settings.ANALYTICS_CACHE_LIVE_TTL_SECONDS
+
+
+@pytest.mark.asyncio
+async def test_in_memory_backend_evicts_least_recently_used_and_expired():
+    backend = InMemoryCacheBackend(max_entries=2)
+    await backend.set("a", 1, ttl_seconds=60)
+    await backend.set("b", 2, ttl_seconds=60)
+    assert await backend.get("a") == 1  # "b" is now least recently used
+    await backend.set("c", 3, ttl_seconds=60)
+
+    assert await backend.get("b") is None
+    assert await backend.get("a") == 1
+    assert await backend.get("c") == 3
+
+    await backend.set("d", 4, ttl_seconds=0)
+    assert await backend.get("d") is None
+
+
+@pytest.mark.asyncio
+async def test_get_or_compute_counts_hits_and_misses():
+    cache = AnalyticsCache(InMemoryCacheBackend(max_entries=10))
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return {"total_count": 5}
+
+    assert await cache.get_or_compute("human", _filters(), compute) == {"total_count": 5}
+    assert await cache.get_or_compute("human", _filters(days=["FRIDAY", "Monday"]), compute) == {"total_count": 5}
+
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+    with patch.object(settings, "ANALYTICS_CACHE_ENABLED", False):
+        await cache.get_or_compute("human", _filters(), compute)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_backend_failures_fall_back_to_computing():
+    class BrokenBackend(CacheBackend):
+        async def get(self, key):
+            raise ConnectionError("kv store unreachable")
+
+        async def set(self, key, value, ttl_seconds):
+            raise ConnectionError("kv store unreachable")
+
+        async def clear(self):
+            pass
+
+    cache = AnalyticsCache(BrokenBackend())
+
+    async def compute():
+        return 42
+
+    assert await cache.get_or_compute("traffic", _filters(), compute) == 42
+    # Without the device generations nothing is written
+    assert cache.stats()["errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_invalidated_devices_are_recomputed():
+    cache = AnalyticsCache(InMemoryCacheBackend(max_entries=10))
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return len(calls)
+
+    other_device_filters = _filters(device_ids=[uuid.UUID(int=3)])
+    assert await cache.get_or_compute("human", _filters(), compute) == 1
+    assert await cache.get_or_compute("human", other_device_filters, compute) == 2
+
+    # New rows of device 2 change the results covering it, not the others
+    await cache.invalidate_devices([uuid.UUID(int=2)])
+
+    assert await cache.get_or_compute("human", _filters(), compute) == 3
+    assert await cache.get_or_compute("human", _filters(), compute) == 3
+    assert await cache.get_or_compute("human", other_device_filters, compute) == 2
+
+
+def test_cache_values_round_trip_through_json():
+    device_id = uuid.UUID(int=7)
+    value = {
+        device_id: {
+            "time_series_data": [{"timestamp": datetime(2025, 1, 1, 9, tzinfo=ZoneInfo("Asia/Tokyo")), "count": Decimal("12")}],
+            "dates": (date(2025, 1, 1), None),
+            "ratio": 0.5,
+        },
+        "__type__": "not a tag",
+    }
+
+    raw = dump_cache_value(value)
+
+    assert raw.startswith(b"{")
+    assert load_cache_value(raw) == value
+    with pytest.raises(TypeError):
+        dump_cache_value({"filters": _filters()})
@@ -0,0 +1,60 @@
+"""
+Test cases for compiled City Eye analytics filters.
+"""
+import uuid
+from datetime import date, datetime, timedelta
+
+from app.models import CityEyeHumanTable
+from app.schemas.services.city_eye_analytics import AnalyticsFilters, DirectionAnalyticsFilters
+from app.utils.analytics_filters import (
+    MAX_OR_DATE_RANGES,
+    compile_filters,
+    merge_date_ranges,
+    parse_days,
+    parse_hours,
+)
+
+
+def test_merge_date_ranges_collapses_consecutive_days():
+    dates = [date(2025, 3, 3), date(2025, 3, 1), date(2025, 3, 2), date(2025, 3, 5), date(2025, 3, 2)]
+
+    assert merge_date_ranges(dates) == [
+        (datetime(2025, 3, 1), datetime(2025, 3, 4)),
+        (datetime(2025, 3, 5), datetime(2025, 3, 6)),
+    ]
+
+
+def test_parse_days_and_hours_normalize_and_skip_invalid():
+    assert parse_days(["Monday", "sunday", "funday", "monday"]) == [0, 1]
+    assert parse_hours(["14:00", "9:00", "noon", "25:00", "09:30"]) == [9, 14]
+    assert parse_hours(None) == []
+
+
+def test_compile_filters_is_reused():
+    device_id = uuid.uuid4()
+    filters = AnalyticsFilters(
+        device_ids=[device_id, device_id],
+        start_time=datetime(2025, 3, 1),
+        end_time=datetime(2025, 4, 1),
+        days=["Monday"],
+    )
+
+    compiled = compile_filters(filters)
+
+    assert compiled.device_ids == [device_id]
+    assert compiled.day_numbers == [1]
+    assert compile_filters(compiled) is compiled
+
+
+def test_many_dates_keep_a_fixed_statement_shape():
+    def condition_sql(day_count):
+        filters = DirectionAnalyticsFilters(dates=[date(2025, 1, 1) + timedelta(days=2 * day) for day in range(day_count)])
+        conditions = compile_filters(filters).conditions(CityEyeHumanTable)
+        return [str(condition) for condition in conditions]
+
+    few = condition_sql(2)
+    assert len(few) == 1 and " OR " in few[0]
+
+    # Beyond MAX_OR_DATE_RANGES ranges the SQL no longer grows with the number of dates
+    assert condition_sql(MAX_OR_DATE_RANGES + 1) == condition_sql(60)
+    assert not any(" OR " in condition for condition in condition_sql(60))
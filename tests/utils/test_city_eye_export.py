@@ -0,0 +1,61 @@
+"""
+Test cases for the City Eye raw data export encoders.
+"""
+import json
+import uuid
+import pytest
+from datetime import datetime
+
+from app.utils.city_eye_export import create_export_encoder, _ChunkSink
+
+COLUMNS = ["device_id", "timestamp", "polygon_id_in", "polygon_id_out", "large"]
+DEVICE_ID = uuid.UUID("00000000-0000-0000-0000-000000000001")
+ROWS = [(DEVICE_ID, datetime(2025, 3, 1, 10, 0), "1", "2", 3)]
+
+
+def test_csv_encoder_writes_header_then_rows():
+    encoder = create_export_encoder("csv", COLUMNS)
+
+    output = encoder.begin() + encoder.encode(ROWS) + encoder.encode(ROWS) + encoder.end()
+
+    assert output.decode().splitlines() == [
+        "device_id,timestamp,polygon_id_in,polygon_id_out,large",
+        f"{DEVICE_ID},2025-03-01T10:00:00,1,2,3",
+        f"{DEVICE_ID},2025-03-01T10:00:00,1,2,3",
+    ]
+
+
+def test_ndjson_encoder_writes_one_object_per_row():
+    encoder = create_export_encoder("ndjson", COLUMNS)
+
+    output = encoder.begin() + encoder.encode(ROWS) + encoder.end()
+
+    assert [json.loads(line) for line in output.decode().splitlines()] == [{
+        "device_id": str(DEVICE_ID),
+        "timestamp": "2025-03-01T10:00:00",
+        "polygon_id_in": "1",
+        "polygon_id_out": "2",
+        "large": 3,
+    }]
+
+
+def test_chunk_sink_drains_but_keeps_position():
+    sink = _ChunkSink()
+    sink.write(b"abc")
+    assert sink.drain() == b"abc"
+    sink.write(b"de")
+
+    assert sink.tell() == 5
+    assert sink.drain() == b"de"
+    assert sink.drain() == b""
+
+
+def test_arrow_stream_round_trip():
+    pa = pytest.importorskip("pyarrow")
+    encoder = create_export_encoder("arrow", COLUMNS)
+
+    output = encoder.begin() + encoder.encode(ROWS) + encoder.end()
+
+    table = pa.ipc.open_stream(output).read_all()
+    assert table.column("device_id").to_pylist() == [str(DEVICE_ID)]
+    assert table.column("large").to_pylist() == [3]
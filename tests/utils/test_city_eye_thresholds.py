@@ -0,0 +1,101 @@
+"""
+Test cases for the City Eye threshold evaluator.
+"""
+import asyncio
+import pytest
+import uuid
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.routes import sse
+from app.models import AuditLog, CityEyeHumanHourlyTable, CityEyeThresholdWatermark, CustomerSolution, Device, Solution
+from app.utils.city_eye_thresholds import evaluate_thresholds, find_crossings, threshold_level
+
+
+def test_threshold_level():
+    assert threshold_level(0, [10.0, 100.0]) == 0
+    assert threshold_level(10, [10.0, 100.0]) == 1
+    assert threshold_level(250, [10.0, 100.0]) == 2
+
+
+def test_find_crossings_compares_each_bucket_with_the_previous_one():
+    customer_id, device_id = uuid.uuid4(), uuid.uuid4()
+    rows = [
+        (customer_id, device_id, datetime(2025, 3, 1, 9), 5),    # bucket before the window
+        (customer_id, device_id, datetime(2025, 3, 1, 10), 120),  # up past 10 and 100
+        (customer_id, device_id, datetime(2025, 3, 1, 11), 150),  # same level, no event
+        # 12:00 has no row and counts as 0: down past both thresholds
+    ]
+    events = find_crossings(
+        rows, {customer_id: [10.0, 100.0]}, kind="human",
+        start_time=datetime(2025, 3, 1, 10), end_time=datetime(2025, 3, 1, 13),
+    )
+
+    assert [(event["bucket_start"], event["direction"], event["thresholds_crossed"]) for event in events] == [
+        ("2025-03-01T10:00:00", "up", [10.0, 100.0]),
+        ("2025-03-01T12:00:00", "down", [10.0, 100.0]),
+    ]
+    assert events[0]["previous_count"] == 5 and events[0]["count"] == 120
+    assert events[1]["device_id"] == str(device_id)
+
+
+@pytest.mark.asyncio
+async def test_evaluate_thresholds_is_incremental(
+    db: AsyncSession,
+    device: Device,
+    city_eye_solution: Solution,
+    city_eye_customer_solution: CustomerSolution,
+):
+    """Each run only evaluates the buckets completed since the previous one"""
+    city_eye_customer_solution.configuration_template = {"thresholds": {"human_count_thresholds": [50]}}
+    db.add(city_eye_customer_solution)
+
+    def hourly_row(timestamp, count):
+        return CityEyeHumanHourlyTable(
+            device_id=device.device_id,
+            polygon_id_in="1",
+            polygon_id_out="2",
+            timestamp=timestamp,
+            male_less_than_18=0, female_less_than_18=0, male_18_to_29=count, female_18_to_29=0,
+            male_30_to_49=0, female_30_to_49=0, male_50_to_64=0, female_50_to_64=0,
+            male_65_plus=0, female_65_plus=0,
+        )
+
+    db.add_all([
+        hourly_row(datetime(2025, 3, 1, 10), 20),
+        hourly_row(datetime(2025, 3, 1, 11), 80),
+        hourly_row(datetime(2025, 3, 1, 12), 90),
+        hourly_row(datetime(2025, 3, 1, 13), 30),
+    ])
+    await db.commit()
+    # Evaluations roll back when there is nothing to do, which expires the fixtures
+    customer_id, device_id = device.customer_id, device.device_id
+
+    queue = asyncio.Queue()
+    sse.active_threshold_connections[customer_id] = {queue}
+    try:
+        # The first run only sets the watermark (end of the settled 10:00 bucket)
+        assert await evaluate_thresholds(db, now=datetime(2025, 3, 1, 11, 10)) == []
+
+        # 11:00 and 12:00 settled: one upward crossing
+        events = await evaluate_thresholds(db, now=datetime(2025, 3, 1, 13, 10))
+        assert [(event["bucket_start"], event["direction"]) for event in events] == [("2025-03-01T11:00:00", "up")]
+
+        # Same window again: nothing new
+        assert await evaluate_thresholds(db, now=datetime(2025, 3, 1, 13, 20)) == []
+
+        events = await evaluate_thresholds(db, now=datetime(2025, 3, 1, 14, 10))
+        assert [(event["bucket_start"], event["direction"]) for event in events] == [("2025-03-01T13:00:00", "down")]
+    finally:
+        sse.active_threshold_connections.pop(customer_id, None)
+
+    assert queue.qsize() == 2
+
+    result = await db.execute(select(AuditLog).filter(AuditLog.action_type == "THRESHOLD_CROSSED"))
+    logs = result.scalars().all()
+    assert len(logs) == 2
+    assert {log.resource_id for log in logs} == {str(device_id)}
+
+    result = await db.execute(select(CityEyeThresholdWatermark).filter(CityEyeThresholdWatermark.kind == "human"))
+    assert result.scalars().first().evaluated_until == datetime(2025, 3, 1, 14)
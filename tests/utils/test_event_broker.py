@@ -0,0 +1,108 @@
+"""
+Test cases for the SSE event broker.
+"""
+import asyncio
+import json
+import pytest
+
+from app.api.routes import sse
+from app.utils.event_broker import InProcessEventBroker, PostgresEventBroker
+
+
+class FakeConnection:
+    def __init__(self):
+        self.notifications = []
+
+    def get_server_pid(self):
+        return 1234
+
+    async def execute(self, query, *args):
+        if args:
+            self.notifications.append(args)
+
+
+def test_in_process_broker_isolates_failing_handlers():
+    broker = InProcessEventBroker()
+    received = []
+
+    def failing_handler(event):
+        raise ValueError("boom")
+    broker.subscribe("updates", failing_handler)
+    broker.subscribe("updates", received.append)
+    broker.subscribe("other", lambda event: pytest.fail("wrong channel"))
+
+    broker.publish("updates", {"id": 1})
+
+    assert received == [{"id": 1}]
+
+
+@pytest.mark.asyncio
+async def test_postgres_broker_sends_events_in_publish_order():
+    broker = PostgresEventBroker("postgresql://localhost/test", max_pending=10, reconnect_delay_seconds=1)
+    received = []
+    broker.subscribe("updates", received.append)
+
+    # Not relaying yet: events stay in this process
+    broker.publish("updates", {"id": 0})
+    assert received == [{"id": 0}]
+
+    broker._running = True
+    # The connection is down: this process still gets its own events, the others get them later
+    broker.publish("updates", {"id": 1})
+    assert [event["id"] for event in received] == [0, 1]
+
+    connection = FakeConnection()
+    sender = asyncio.create_task(broker._send_pending(connection))
+    try:
+        broker.publish("updates", {"id": 2})
+        # NOTIFY payloads are limited, large events only reach this process or are sent trimmed
+        broker.publish("updates", {"id": 3, "payload": "x" * 8000})
+        broker.publish("updates", {"id": 4, "payload": "x" * 8000}, {"id": 4, "truncated": True})
+        for _ in range(100):
+            if len(connection.notifications) == 3:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        sender.cancel()
+
+    assert connection.notifications == [
+        ("updates", '{"id": 1}'), ("updates", '{"id": 2}'), ("updates", '{"id": 4, "truncated": true}'),
+    ]
+    assert [event["id"] for event in received] == [0, 1, 2, 3, 4]
+    assert received[-1]["payload"] == "x" * 8000
+
+    # Our own notifications come back and are skipped, those of other workers are delivered
+    broker._on_notification(connection, 1234, "updates", json.dumps({"id": 2}))
+    assert len(received) == 5
+    broker._on_notification(connection, 5678, "updates", json.dumps({"id": 9}))
+    assert received[-1] == {"id": 9}
+
+
+def test_command_updates_reach_the_connection_through_the_broker():
+    queue = asyncio.Queue()
+    sse.active_command_connections["message-1"] = {queue}
+    try:
+        sse.notify_command_update(message_id="message-1", status="SUCCESS", response_payload={"url": "s3://image"})
+        sse.notify_command_update(message_id="message-2", status="SUCCESS")
+    finally:
+        sse.active_command_connections.pop("message-1", None)
+
+    assert queue.qsize() == 1
+    update = queue.get_nowait()
+    assert update["status"] == "SUCCESS"
+    assert update["response_payload"] == {"url": "s3://image"}
+
+
+@pytest.mark.asyncio
+async def test_large_command_updates_reach_other_workers_trimmed(monkeypatch):
+    broker = PostgresEventBroker("postgresql://localhost/test", max_pending=10, reconnect_delay_seconds=1)
+    broker._running = True
+    monkeypatch.setattr(sse, "event_broker", broker)
+
+    sse.notify_command_update(message_id="message-1", status="SUCCESS", response_payload={"image": "x" * 8000})
+
+    _, payload = broker._pending.get_nowait()
+    update = json.loads(payload)["update"]
+    assert update["status"] == "SUCCESS"
+    assert update["response_payload"] is None
+    assert update["truncated"] is True
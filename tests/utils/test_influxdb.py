@@ -0,0 +1,172 @@
+"""
+Test cases for the thread-offloaded InfluxDB metrics client.
+"""
+import asyncio
+import json
+import time
+import pytest
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from app.schemas.device_metrics import METRIC_FAMILY_NAMES
+from app.utils import influxdb
+from app.utils.influxdb import (
+    METRIC_FAMILIES, InfluxMetricsClient, InfluxQueryTimeout, _encode_device_blocks, _stitch_series,
+    build_metrics_query, choose_metrics_interval, dump_json, metrics_query_parameters, query_metrics_batch,
+)
+
+
+@pytest.mark.asyncio
+async def test_query_runs_off_the_event_loop():
+    client = InfluxMetricsClient(max_concurrent_queries=2, timeout_seconds=5)
+    assert client._client is None  # Nothing is built until the first query
+
+    def slow_query(query, parameters=None):
+        time.sleep(0.2)
+        return [{"query": query}]
+    client._query_sync = slow_query
+
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker_task = asyncio.create_task(ticker())
+    try:
+        rows = await asyncio.gather(client.query("a"), client.query("b"))
+    finally:
+        ticker_task.cancel()
+        client.close()
+
+    assert rows == [[{"query": "a"}], [{"query": "b"}]]
+    # The loop kept running while both queries blocked their threads
+    assert ticks >= 5
+
+
+@pytest.mark.asyncio
+async def test_query_timeout():
+    client = InfluxMetricsClient(max_concurrent_queries=1, timeout_seconds=0.05)
+    client._query_sync = lambda query, parameters=None: time.sleep(0.5)
+    try:
+        with pytest.raises(InfluxQueryTimeout):
+            await client.query("SELECT 1")
+    finally:
+        client.close()
+
+
+def test_encode_device_blocks_splits_rows_by_device_and_block():
+    pa = pytest.importorskip("pyarrow")
+
+    table = pa.table({
+        "device_id": pa.array(["device-a", "device-a", "device-a", "device-b"]).dictionary_encode(),
+        "time_window": pa.array([
+            datetime(2025, 1, 1, 0, 0), datetime(2025, 1, 1, 0, 5), datetime(2025, 1, 1, 0, 10), datetime(2025, 1, 1, 0, 0),
+        ], pa.timestamp("ns")),
+        "avg_used": pa.array([1.234, None, 5.0, float("nan")]),
+        "avg_free": pa.array([2.0, 3.456, 6.0, 4.0]),
+    })
+    fields = METRIC_FAMILIES["memory"]["fields"]
+    # 10 minute blocks: the 00:10 window of device-a starts a new block
+    blocks = _encode_device_blocks(table, fields, block_seconds=600)
+    first_block = int(datetime(2025, 1, 1, tzinfo=ZoneInfo("UTC")).timestamp()) // 600
+    assert sorted(blocks) == [("device-a", first_block), ("device-a", first_block + 1), ("device-b", first_block)]
+
+    series = _stitch_series(fields, ["device-a", "device-b", "device-c"], blocks)
+    decoded = {name: json.loads(dump_json(device_series)) for name, device_series in series.items()}
+
+    # UTC windows are returned in JST, rounded, without null or NaN points
+    assert decoded["device-a"] == [
+        {"name": "Mem Used", "data": [
+            {"timestamp": "2025-01-01T09:00:00+09:00", "value": 1.23},
+            {"timestamp": "2025-01-01T09:10:00+09:00", "value": 5},
+        ]},
+        {"name": "Mem Free", "data": [
+            {"timestamp": "2025-01-01T09:00:00+09:00", "value": 2},
+            {"timestamp": "2025-01-01T09:05:00+09:00", "value": 3.46},
+            {"timestamp": "2025-01-01T09:10:00+09:00", "value": 6},
+        ]},
+    ]
+    assert decoded["device-b"][0]["data"] == []
+    assert decoded["device-b"][1]["data"] == [{"timestamp": "2025-01-01T09:00:00+09:00", "value": 4}]
+    assert decoded["device-c"] == [{"name": "Mem Used", "data": []}, {"name": "Mem Free", "data": []}]
+
+
+def test_choose_metrics_interval():
+    start = datetime(2025, 1, 1, tzinfo=ZoneInfo("Asia/Tokyo"))
+    assert choose_metrics_interval(start, start + timedelta(hours=1), 5) == 5
+    # 7 days at 5 minutes would be 2016 points
+    assert choose_metrics_interval(start, start + timedelta(days=7), 5, max_points=1000) == 15
+    assert choose_metrics_interval(start, start + timedelta(days=3650), 5, max_points=1000) == 4 * 24 * 60
+
+
+@pytest.mark.asyncio
+async def test_query_metrics_batch_reuses_settled_blocks(monkeypatch):
+    """Settled blocks come from the cache, only the rest of the range is read again"""
+    await influxdb.metrics_cache_backend.clear()
+    utc = ZoneInfo("UTC")
+    start_time, end_time = datetime(2025, 1, 1, tzinfo=utc), datetime(2025, 1, 2, 6, tzinfo=utc)
+    # 5 minute windows give 12 hour blocks: two cacheable ones, then a partial one
+    first_block = int(start_time.timestamp()) // (12 * 3600)
+
+    calls = []
+    responses = [
+        {
+            ("device-a", first_block): [['"a"'], []],
+            ("device-a", first_block + 1): [['"b"'], []],
+            ("device-a", first_block + 2): [['"c"'], []],
+        },
+        {("device-a", first_block + 2): [['"c2"'], []]},
+    ]
+
+    async def fake_query(query, transform=None, parameters=None):
+        calls.append((query, parameters))
+        return responses[len(calls) - 1]
+    monkeypatch.setattr(influxdb.influx_client, "query", fake_query)
+
+    try:
+        first = await query_metrics_batch("memory", ["device-a", "device-b"], start_time, end_time, 5)
+        second = await query_metrics_batch("memory", ["device-a", "device-b"], start_time, end_time, 5)
+    finally:
+        await influxdb.metrics_cache_backend.clear()
+
+    assert json.loads(dump_json(first["device-a"]))[0]["data"] == ["a", "b", "c"]
+    assert json.loads(dump_json(second["device-a"]))[0]["data"] == ["a", "b", "c2"]
+    # Blocks without data are cached as well
+    assert json.loads(dump_json(second["device-b"]))[0]["data"] == []
+
+    # The first query reads the whole range, the second only the partial last block
+    (first_query, first_parameters), (second_query, second_parameters) = calls
+    assert first_query == second_query
+    assert first_parameters["start_0"] == "2025-01-01T00:00:00Z"
+    assert second_parameters["start_0"] == "2025-01-02T00:00:00Z"
+    assert second_parameters["end_0"] == "2025-01-02T06:00:00Z"
+
+
+def test_build_metrics_query_binds_values():
+    query = build_metrics_query("memory", 2, 2, 5)
+    assert build_metrics_query("memory", 2, 2, 5) is query
+    assert "device_id IN ($device_0, $device_1)" in query
+    assert "AND memory_type = $filter_memory_type" in query
+    assert "(time >= $start_0 AND time < $end_0) OR (time >= $start_1 AND time <= $end_1)" in query
+
+    utc = ZoneInfo("UTC")
+    parameters = metrics_query_parameters(
+        "memory", ["device-a", "it's-b"],
+        [(datetime(2025, 1, 1, tzinfo=utc), datetime(2025, 1, 2, tzinfo=utc)), (datetime(2025, 1, 3, tzinfo=utc), datetime(2025, 1, 4, tzinfo=utc))],
+    )
+    assert parameters == {
+        "filter_memory_type": "main",
+        "device_0": "device-a",
+        "device_1": "it's-b",
+        "start_0": "2025-01-01T00:00:00Z",
+        "end_0": "2025-01-02T00:00:00Z",
+        "start_1": "2025-01-03T00:00:00Z",
+        "end_1": "2025-01-04T00:00:00Z",
+    }
+
+
+def test_metric_families_match_the_schema():
+    assert set(METRIC_FAMILIES) == set(METRIC_FAMILY_NAMES)
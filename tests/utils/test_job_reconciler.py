@@ -0,0 +1,110 @@
+"""
+Test cases for the job status reconciler.
+"""
+import asyncio
+import time
+import pytest
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.routes import sse
+from app.crud import job as crud_job
+from app.models import Device, Job, JobStatus, JobType, User
+from app.utils.aws_iot_jobs import iot_jobs_service
+from app.utils.job_reconciler import AWSRequestLimiter, reconcile_jobs
+
+
+@pytest.mark.asyncio
+async def test_reconcile_jobs_updates_changed_jobs_and_notifies(
+    db: AsyncSession, monkeypatch, active_device: Device, admin_user: User, test_job: Job
+):
+    unchanged_job, canceled_job = (
+        Job(
+            job_id=job_id,
+            device_id=active_device.device_id,
+            user_id=admin_user.user_id,
+            job_type=JobType.REBOOT_DEVICE,
+            status=JobStatus.IN_PROGRESS,
+            parameters={},
+        )
+        for job_id in ("test-job-unchanged", "test-job-canceled")
+    )
+    db.add_all([unchanged_job, canceled_job])
+    await db.commit()
+    # The reconciler ends its read transaction, which expires the fixtures
+    thing_name, job_id = active_device.thing_name, test_job.job_id
+
+    listed, described = [], []
+
+    pages = {
+        None: ({job_id: "SUCCEEDED", "test-job-unchanged": "IN_PROGRESS"}, "page-2"),
+        "page-2": ({"test-job-canceled": "SUCCEEDED", "job-of-another-api": "QUEUED"}, "page-3"),
+        "page-3": ({"old-job": "SUCCEEDED"}, None),
+    }
+
+    def list_statuses(thing, next_token):
+        listed.append((thing, next_token))
+        return pages[next_token]
+
+    def describe(execution_job_id, thing):
+        described.append(execution_job_id)
+        return {"status": "SUCCEEDED", "status_details": {"detailsMap": {"exit": "0"}}}
+    monkeypatch.setattr(iot_jobs_service, "list_job_execution_statuses_for_thing", list_statuses)
+    monkeypatch.setattr(iot_jobs_service, "get_job_execution_status", describe)
+
+    # A user cancels a job while AWS is being queried
+    lock_by_job_ids = crud_job.lock_by_job_ids
+
+    async def cancel_then_lock(session, *, job_ids):
+        await session.execute(update(Job).where(Job.job_id == "test-job-canceled").values(status=JobStatus.CANCELED))
+        return await lock_by_job_ids(session, job_ids=job_ids)
+    monkeypatch.setattr(crud_job, "lock_by_job_ids", cancel_then_lock)
+
+    queue = asyncio.Queue()
+    sse.active_job_connections[job_id] = {queue}
+    try:
+        changed = await reconcile_jobs(db)
+    finally:
+        sse.active_job_connections.pop(job_id, None)
+
+    # Pages are listed until every job of the thing is found, details only for the changed ones
+    assert listed == [(thing_name, None), (thing_name, "page-2")]
+    assert sorted(described) == sorted([job_id, "test-job-canceled"])
+    assert [job_obj.job_id for job_obj in changed] == [job_id]
+
+    await db.refresh(test_job)
+    await db.refresh(unchanged_job)
+    await db.refresh(canceled_job)
+    assert test_job.status == JobStatus.SUCCEEDED
+    assert test_job.status_details == {"detailsMap": {"exit": "0"}}
+    assert test_job.completed_at is not None
+    assert unchanged_job.status == JobStatus.IN_PROGRESS
+    assert canceled_job.status == JobStatus.CANCELED
+
+    update_data = queue.get_nowait()
+    assert update_data["status"] == "SUCCEEDED"
+    assert update_data["progress_percentage"] == 100
+
+    # Finished jobs are not looked up again
+    listed.clear()
+    described.clear()
+    assert await reconcile_jobs(db) == []
+    assert listed == [(thing_name, None)]
+    assert described == []
+
+
+@pytest.mark.asyncio
+async def test_aws_request_limiter_spaces_requests():
+    limiter = AWSRequestLimiter(max_concurrent=2, requests_per_second=20)
+    started = []
+
+    def request(i):
+        started.append(time.monotonic())
+        return i
+
+    results = await asyncio.gather(*(limiter.call(request, i) for i in range(4)))
+
+    assert sorted(results) == [0, 1, 2, 3]
+    # 20 requests per second: starts are at least 50 ms apart
+    started.sort()
+    assert started[-1] - started[0] >= 0.14
@@ -0,0 +1,23 @@
+"""
+Test cases for the City Eye monthly partition helpers.
+"""
+import pytest
+from datetime import date
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.partitions import add_months, partition_name, maintain_partitions
+
+
+def test_add_months_crosses_years():
+    assert add_months(date(2025, 11, 1), 1) == date(2025, 12, 1)
+    assert add_months(date(2025, 12, 1), 1) == date(2026, 1, 1)
+    assert add_months(date(2025, 1, 1), -13) == date(2023, 12, 1)
+
+
+def test_partition_name():
+    assert partition_name("city_eye_human_data", date(2025, 3, 1)) == "city_eye_human_data_p2025_03"
+
+
+@pytest.mark.asyncio
+async def test_maintain_partitions_skips_sqlite(db: AsyncSession):
+    assert await maintain_partitions(db) == {}
@@ -0,0 +1,114 @@
+"""
+Test cases for the X-lines shadow config cache.
+"""
+import json
+import time
+import pytest
+from unittest.mock import patch
+
+from app.core.config import settings
+from app.utils.util import calculate_offset_route
+from app.utils.xlines_config_cache import XLinesConfigCache, DEFAULT_POINT, notify_xlines_config_applied, xlines_config_cache
+
+
+def _shadow(polygons) -> dict:
+    return {"state": {"reported": {"xlines_cfg_content": json.dumps(polygons)}}}
+
+
+CENTER = {"startPoint": {"lat": 35.0, "lng": 139.0}, "endPoint": {"lat": 35.001, "lng": 139.001}}
+
+
+@pytest.mark.asyncio
+async def test_polygons_parsed_once_and_cached():
+    cache = XLinesConfigCache()
+    shadow = _shadow([{"name": "Gate", "center": CENTER}, {"center": {}}])
+
+    with patch(
+        "app.utils.xlines_config_cache.iot_command_service.get_xlines_config_shadow", return_value=shadow
+    ) as mock_get_shadow:
+        polygons = await cache.get_polygons("thing-1")
+        assert await cache.get_polygons("thing-1") is polygons
+
+    assert mock_get_shadow.call_count == 1
+    out_start_point, out_end_point = calculate_offset_route(CENTER)
+    assert polygons[0] == {
+        "polygon_name": "Gate",
+        "in_start_point": CENTER["startPoint"],
+        "in_end_point": CENTER["endPoint"],
+        "out_start_point": out_start_point,
+        "out_end_point": out_end_point,
+    }
+    assert polygons[1]["polygon_name"] == "Zone 2"
+    assert polygons[1]["out_end_point"] == DEFAULT_POINT
+
+
+@pytest.mark.asyncio
+async def test_invalidate_and_failed_reads_refetch():
+    cache = XLinesConfigCache()
+
+    with patch(
+        "app.utils.xlines_config_cache.iot_command_service.get_xlines_config_shadow", return_value=None
+    ) as mock_get_shadow:
+        assert await cache.get_polygons("thing-1") == []
+        assert await cache.get_polygons("thing-1") == []
+        assert mock_get_shadow.call_count == 1
+
+        # Misses expire after the shorter miss TTL
+        with patch.object(settings, "XLINES_CONFIG_CACHE_MISS_TTL_SECONDS", 0):
+            cache.invalidate("thing-1")
+            assert await cache.get_polygons("thing-1") == []
+            assert await cache.get_polygons("thing-1") == []
+        assert mock_get_shadow.call_count == 3
+
+    with patch(
+        "app.utils.xlines_config_cache.iot_command_service.get_xlines_config_shadow",
+        return_value=_shadow([{"name": "Gate", "center": CENTER}]),
+    ) as mock_get_shadow:
+        await cache.get_polygons("thing-1")
+        cache.invalidate("thing-1")
+        await cache.get_polygons("thing-1")
+        assert mock_get_shadow.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_polygons_by_thing_reads_distinct_things_concurrently():
+    cache = XLinesConfigCache()
+    reading, max_reading = 0, 0
+
+    def get_shadow(thing_name):
+        nonlocal reading, max_reading
+        reading += 1
+        max_reading = max(max_reading, reading)
+        time.sleep(0.05)
+        reading -= 1
+        if thing_name == "broken":
+            raise RuntimeError("shadow read failed")
+        return _shadow([{"name": thing_name}])
+
+    with patch.object(settings, "XLINES_CONFIG_MAX_CONCURRENT_READS", 2), patch(
+        "app.utils.xlines_config_cache.iot_command_service.get_xlines_config_shadow", side_effect=get_shadow
+    ) as mock_get_shadow:
+        polygons_by_thing = await cache.get_polygons_by_thing(["thing-1", "thing-2", "thing-1", "thing-3", "broken"])
+
+    assert mock_get_shadow.call_count == 4
+    assert max_reading == 2
+    assert polygons_by_thing["thing-2"][0]["polygon_name"] == "thing-2"
+    assert isinstance(polygons_by_thing["broken"], RuntimeError)
+
+
+@pytest.mark.asyncio
+async def test_applied_config_is_dropped_through_the_broker():
+    with patch(
+        "app.utils.xlines_config_cache.iot_command_service.get_xlines_config_shadow",
+        return_value=_shadow([{"name": "Gate", "center": CENTER}]),
+    ) as mock_get_shadow:
+        try:
+            await xlines_config_cache.get_polygons("thing-1")
+            await xlines_config_cache.get_polygons("thing-2")
+            notify_xlines_config_applied("thing-1")
+            await xlines_config_cache.get_polygons("thing-1")
+            await xlines_config_cache.get_polygons("thing-2")
+        finally:
+            xlines_config_cache.clear()
+
+    assert [call.args[0] for call in mock_get_shadow.call_args_list] == ["thing-1", "thing-2", "thing-1"]